@@ -18,176 +18,178 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import os
 import re
 import sys	
+import egret_alerts
 import egret_ext
+import egret_cache
+import egret_io
+import egret_pool
 from optparse import OptionParser
 #import time
 
-# process command line options
-parser = OptionParser()
-parser.add_option("-f", "--file", dest = "fileName", help = "file containing regex")
-parser.add_option("-r", "--regex", dest = "regex", help = "regular expression")
-parser.add_option("-o", "--output_file", dest = "outputFile", help = "output file name")
-parser.add_option("-w", "--warn", action = "store_true", dest = "warnMode",
-    default = False, help = "warn if example or fix are broke")
-parser.add_option("-d", "--debug", action = "store_true", dest = "debugMode",
-    default = False, help = "display debug info")
-parser.add_option("-s", "--stat", action = "store_true", dest = "statMode",
-    default = False, help = "display stats")
-opts, args = parser.parse_args()
-
-# check for valid command lines
-if opts.fileName != None and opts.regex != None:
-  print("Cannot specify both a regular expression and input file")
-  sys.exit(-1)
-
-# get the regular expression
-descStr = ""
-if opts.fileName != None:
-  inFile = open(opts.fileName)
-  regexStr = inFile.readline().rstrip()
-  try:
-    descStr = inFile.readline().rstrip()
-  except:
-    descStr = ""
-  inFile.close()
-elif opts.regex != None:
-  regexStr = opts.regex
-else:
-  regexStr = input("Enter a Regular Expression: ")
-
-# compile the regular expression
-try: 
-  hasError = False
-  regex = re.compile(regexStr)
-
-  # execute regex-test
-  # start_time = time.process_time()
-  alerts = egret_ext.run(regexStr, "evil", True, False, opts.debugMode, opts.statMode)
-  # elapsed_time = time.process_time() - start_time
-
-except re.error as e:
-  status = "ERROR (compiler error): Regular expression did not compile: " + str(e) + "\n"
-  alerts = [ status ]
-
-#if opts.statMode:
-#  fmt = "{0:30}| {1}"
-#  print(fmt.format("Time", elapsed_time))
-
-# write the output header
-header = "Regex: " + regexStr + "\n\n"
-if descStr != "":
-  header += ("Description: " + descStr + "\n\n")
-if opts.outputFile:
-  outFile = open(opts.outputFile, 'w')
-  outFile.write(header)
-else:
-  print(header, end='')
-
-# write the alerts
-for s in alerts:
-
-  lines = s.split("\n")
-  prevLine = ""
-  for line in lines: 
-
-    suppressLine = False
-    example = False
-    anchorExample = False
-    if re.match("\.\.\.String with", line) != None:
-      example = True
-      anchorExample = True
-    if re.match("\.\.\.Example", line) != None:
-      example = True
-
-    if example:
-      suppressLine = True
-      first, second = line.split(':', 1)
-      exampleStr = second[1:]
-      success = re.fullmatch(regexStr, exampleStr) != None
-      if anchorExample:
-        if prevLine != "":
-          if prevSuccess and success: # both anchor examples successful
-            if opts.outputFile:
-              outFile.write(prevLine)
-              outFile.write('\n')
-              outFile.write(line)
-              outFile.write('\n')
-            else:
-              print(prevLine)
-              print(line)
-          else: # one line failed
-            if opts.warnMode:
-              status = "ATTENTION: EXAMPLE STRING NOT ACCEPTED"
-              if opts.outputFile:
-                outFile.write(prevLine)
-                outFile.write('\n')
-                if not prevSuccess:
-                  outFile.write(status)
-                  outFile.write('\n')
-                outFile.write(line)
-                outFile.write('\n')
-                if not success:
-                  outFile.write(status)
-                  outFile.write('\n')
-              else:
-                print(prevLine)
-                if not prevSuccess:
-                  print(status)
-                print(line)
-                if not success:
-                  print(status)
-          prevLine = ""
-        else:  # prevLine == ""
-          prevLine = line
-          prevSuccess = success
-      else:  # example but not anchor example
-        prevLine = ""
-        if success:
-          suppressLine = False
-        else:
-          if opts.warnMode:
-            status = "ATTENTION: EXAMPLE STRING NOT ACCEPTED"
-            if opts.outputFile:
-              outFile.write(line)
-              outFile.write('\n')
-              outFile.write(status)
-              outFile.write('\n')
-            else:
-              print(line)
-              print(status)
-    else: # not example
-      prevLine = ""
-
-    if re.match("\.\.\.Suggested fix", line) != None:
-      first, second = line.split(':', 1)
-      fixStr = second[1:]
-
-      try:
-        r = re.compile(fixStr)
-      except re.error as e:
-        suppressLine = True
-        if opts.warnMode:
-          status = "ATTENTION: SUGGESTED FIX DID NOT COMPILE: "  + str(e)
-          if opts.outputFile:
-            outFile.write(line)
-            outFile.write('\n')
-            outFile.write(status)
-            outFile.write('\n')
-          else:
-            print(line)
-            print(status)
-
-    if not suppressLine:
-      if opts.outputFile:
-        outFile.write(line)
-        outFile.write('\n')
-      else:
-        print(line)
-
-# close the output
-if opts.outputFile:
-  outFile.close()
-
-sys.exit(0)
+# corpus mode: checks every regex of the corpus on a pool of worker processes
+# and writes one JSON record per regex (see egret_alerts.check_record), in
+# input order
+def check_corpus(opts):
+  cacheDir = '' if opts.noCache else opts.cacheDir
+  outFile = open(opts.outputFile, 'w') if opts.outputFile else sys.stdout
+  regexStrs = egret_io.iter_regexes(opts.corpusFile, opts.inputFormat)
+  tasks = ((regexStr, cacheDir) for regexStr in regexStrs)
+  with egret_pool.EnginePool(egret_alerts.check_record, opts.workers, opts.timeout) as pool:
+    for (regexStr, _), ok, record in pool.imap(tasks):
+      # the worker timed out, crashed or raised
+      if not ok:
+        record = {'regex': regexStr, 'error': str(record), 'violations': []}
+      outFile.write(json.dumps(record) + '\n')
+  if opts.outputFile:
+    outFile.close()
+
+# checks a single regex and writes the report
+def check_regex(opts):
+  # get the regular expression
+  descStr = ""
+  if opts.fileName != None:
+    inFile = open(opts.fileName)
+    regexStr = inFile.readline().rstrip()
+    try:
+      descStr = inFile.readline().rstrip()
+    except:
+      descStr = ""
+    inFile.close()
+  elif opts.regex != None:
+    regexStr = opts.regex
+  else:
+    regexStr = input("Enter a Regular Expression: ")
+
+  # compile the regular expression
+  compileError = None
+  try: 
+    regex = re.compile(regexStr)
+
+    # execute regex-test
+    # start_time = time.process_time()
+    # debug and stat output come from the engine itself, so those runs bypass the cache
+    if opts.debugMode or opts.statMode:
+      result = egret_ext.analyze(regexStr, "evil", True, opts.debugMode, opts.statMode)
+    else:
+      cacheDir = '' if opts.noCache else opts.cacheDir
+      result = egret_cache.cached_analyze(regexStr, "evil", True, cacheDir)
+    # elapsed_time = time.process_time() - start_time
+
+  except re.error as e:
+    compileError = "ERROR (compiler error): Regular expression did not compile: " + str(e) + "\n"
+
+  #if opts.statMode:
+  #  fmt = "{0:30}| {1}"
+  #  print(fmt.format("Time", elapsed_time))
+
+  # write the output header
+  header = "Regex: " + regexStr + "\n\n"
+  if descStr != "":
+    header += ("Description: " + descStr + "\n\n")
+  if opts.outputFile:
+    outFile = open(opts.outputFile, 'w')
+    outFile.write(header)
+  else:
+    print(header, end='')
+
+  def emit(line):
+    if opts.outputFile:
+      outFile.write(line)
+      outFile.write('\n')
+    else:
+      print(line)
+
+  # write the alerts
+  if compileError != None:
+    emit(compileError)
+  elif result.error != None:
+    emit(result.error)
+  elif len(result.alerts) == 0:
+    emit(egret_alerts.NO_VIOLATIONS)
+  else:
+    status = "ATTENTION: EXAMPLE STRING NOT ACCEPTED"
+    for alert in result.alerts:
+      emit(egret_alerts.header_line(alert))
+
+      # anchor examples are shown only if all of them are accepted
+      anchorLines = egret_alerts.anchor_lines(alert)
+      anchorSuccess = [egret_alerts.accepts(regexStr, s) for label, s in alert.anchor_examples]
+      for line, success in zip(anchorLines, anchorSuccess):
+        if all(anchorSuccess) or opts.warnMode:
+          emit(line)
+        if not all(anchorSuccess) and opts.warnMode and not success:
+          emit(status)
+
+      if alert.locations:
+        emit(egret_alerts.regex_line(alert, regexStr))
+
+      if alert.suggestion != None:
+        fixError = egret_alerts.fix_error(alert.suggestion)
+        if fixError == None or opts.warnMode:
+          emit(egret_alerts.suggestion_line(alert))
+        if fixError != None and opts.warnMode:
+          emit("ATTENTION: SUGGESTED FIX DID NOT COMPILE: " + fixError)
+
+      if alert.example != None:
+        success = egret_alerts.accepts(regexStr, alert.example)
+        if success or opts.warnMode:
+          emit(egret_alerts.example_line(alert))
+        if not success and opts.warnMode:
+          emit(status)
+
+      if alert.attack != None:
+        emit(egret_alerts.attack_line(alert))
+
+      emit("")
+
+  # close the output
+  if opts.outputFile:
+    outFile.close()
+
+def main():
+  # process command line options
+  parser = OptionParser()
+  parser.add_option("-f", "--file", dest = "fileName", help = "file containing regex")
+  parser.add_option("-r", "--regex", dest = "regex", help = "regular expression")
+  parser.add_option("-o", "--output_file", dest = "outputFile", help = "output file name")
+  parser.add_option("-w", "--warn", action = "store_true", dest = "warnMode",
+      default = False, help = "warn if example or fix are broke")
+  parser.add_option("-d", "--debug", action = "store_true", dest = "debugMode",
+      default = False, help = "display debug info")
+  parser.add_option("-s", "--stat", action = "store_true", dest = "statMode",
+      default = False, help = "display stats")
+  parser.add_option("--cache_dir", dest = "cacheDir",
+      help = "result cache directory (default: $EGRET_CACHE_DIR or ~/.cache/egret)")
+  parser.add_option("--no_cache", action = "store_true", dest = "noCache",
+      default = False, help = "do not use the result cache")
+  parser.add_option("-c", "--corpus", dest = "corpusFile",
+      help = "file of regexes to check, writes one JSON record per regex")
+  parser.add_option("-i", "--input_format", dest = "inputFormat", choices = egret_io.INPUT_FORMATS,
+      help = "corpus format: json, ndjson or text (default: from file extension)")
+  parser.add_option("--workers", dest = "workers", type = "int", default = os.cpu_count() or 1,
+      help = "number of worker processes in corpus mode")
+  parser.add_option("-t", "--timeout", dest = "timeout", type = "float", default = 30,
+      help = "seconds before a worker stuck on one regex is killed")
+  opts, args = parser.parse_args()
+
+  # check for valid command lines
+  if opts.fileName != None and opts.regex != None:
+    print("Cannot specify both a regular expression and input file")
+    sys.exit(-1)
+  if opts.corpusFile != None and (opts.fileName != None or opts.regex != None):
+    print("Cannot specify both a corpus and a regular expression or input file")
+    sys.exit(-1)
+
+  if opts.corpusFile != None:
+    check_corpus(opts)
+  else:
+    check_regex(opts)
+  sys.exit(0)
+
+
+if __name__ == '__main__':
+  main()
@@ -25,10 +25,16 @@ import string
 from string import printable
 import sys
 import time
+import itertools
 from xml.etree.ElementInclude import include
 import egret_ext
+import egret_alerts
+import egret_cache
+import egret_io
+import egret_match
+import egret_pool
+import egret_probe
 from optparse import OptionParser
-import numpy as np
 import os
 import errno
 from functools import wraps
@@ -120,6 +126,9 @@ def timeout(seconds, error_message=os.strerror(errno.ETIME)):
             raise TimeoutError(error_message)
 
         def wrapper(*args, **kwargs):
+            # signals can only be handled on the main thread
+            if threading.current_thread() is not threading.main_thread():
+                return func(*args, **kwargs)
             signal.signal(signal.SIGALRM, _handle_timeout)
             signal.setitimer(signal.ITIMER_REAL,seconds) #used timer instead of alarm
             try:
@@ -130,158 +139,409 @@ def timeout(seconds, error_message=os.strerror(errno.ETIME)):
         return wraps(func)(wrapper)
     return decorator
 
-parser = OptionParser()
-parser.add_option("-f", "--file", dest="fileName",
-                  help="file containing regex")
-parser.add_option("-r", "--regex", dest="regex", help="regular expression")
-parser.add_option("-b", "--base_substring", dest="baseSubstring",
-                  default="evil", help="base substring for regex strings")
-parser.add_option("-o", "--output_file", dest="outputFile",
-                  help="output file name")
-parser.add_option("-d", "--debug", action="store_true", dest="debugMode",
-                  default=False, help="display debug info")
-parser.add_option("-s", "--stat", action="store_true", dest="statMode",
-                  default=False, help="display stats")
-parser.add_option("-g", "--groups", action="store_true", dest="showGroups",
-                  default=False, help="show groups")
-parser.add_option("-n", "--named_groups", action="store_true", dest="showNamedGroups",
-                  default=False, help="only show named groups")
-opts, args = parser.parse_args()
-
-# check for valid command lines
-if opts.fileName != None and opts.regex != None:
-    print("Cannot specify both a regular expression and input file")
-    sys.exit(-1)
-
-logFile = open("./tmp/logs.tx", 'w')
-# get the regular expression
-output = []
-descStr = []
-regexStrings = []
-hasError = False
-if opts.fileName != None:
-    inFile = open(opts.fileName)
-
-    fileAsJson = json.load(inFile)
-    for regexObject in fileAsJson:
-        # regexes from stackoverflow and regexlib are stored in array called patterns
-        if 'patterns' in regexObject:
-            for pattern in regexObject['patterns']:
-                regexStrings.append(pattern)
-        else:
-            regexStrings.append(regexObject['pattern'])
-            try:
-                descStr.append(regexObject['pattern'])
-            except:
-                continue
-        inFile.close()
-
-# compile the regular expression
-l = len(regexStrings)
-printProgressBar(0, l, prefix='Progress:', suffix='Complete', length=50)
-
-@timeout(10)
-def compile_regex(regexStr):
-    output = egret_ext.run(regexStr, opts.baseSubstring,
-                  False, False, False, False)
+REGEX_TIMEOUT = 10
+BATCH_SIZE = 256
+GROUP_SIZE = 4096               # regexes grouped by canonical form at a time
+MAX_REGEX_LENGTH = 2000
+OUTPUT_DIR = "./data/output/stackoverflow"
+OUTPUT_PREFIX = "stackoverflow_egret"
+CHECKPOINT_INTERVAL = 5         # seconds between checkpoints of the output
+
+
+@timeout(REGEX_TIMEOUT)
+def compile_regex(regexStr, baseSubstring, cacheDir=None, timeLimit=0, maxStrings=0):
+    output = egret_cache.cached_analyze(regexStr, baseSubstring,
+                  False, cacheDir, timeLimit, maxStrings)
     return output
-    
-@timeout(10)
-def perform_search(inputStr):
+
+
+@timeout(REGEX_TIMEOUT)
+def perform_search(regex, inputStr):
     return regex.search(inputStr)
 
-for i, regexStr in enumerate(regexStrings):
-    if isinstance(regexStr, str) and len(regexStr) > 0 and len(regexStr) < 501:
-        compileRegex = True
-        exception = ''
-        hasError = False
-        try:
-            regex = re.compile(regexStr)
-            inputStrs = [10]
-            inputStrs = compile_regex(regexStr)
-            status = inputStrs[0]
-            hasError = (status[0:5] == "ERROR")
-            # in this case, an error is thrown by EGRET
-            if status and status[0:5] == "ERROR":
-                output.append({'regex': regexStr, 'exceptionStackTrace': {
-                    'exceptionThrownBy': 'EGRET',
-                    'exception': status
-                },
-                    'matches': [], 'nonMatches': []})
-                hasError = False
-                continue
-
-        # here we catch errors thrown by the re library
-        except re.error as e:
-            # if e.msg.find('escape') != -1 or e.msg.find('unterminated subpattern') != -1 or e.msg.find('unsupported character') != -1 or e.msg.find('unknown extension') != -1:
-            #     exception = e.msg
-            #     hasError = True
-            #     output.append({'regex': regexStr, 'exception': exception,
-            #                   'matches': [], 'exceptionThrownBy': 'Python'})
-            #     continue
-            output.append({'regex': regexStr, 'exceptionStackTrace': {
-                'exceptionThrownBy': 'Python',
-                'exception':  e.msg
+
+# regexes that are not analyzed
+def skip_regex(regexStr):
+    return not isinstance(regexStr, str) or len(regexStr) == 0 or len(regexStr) > MAX_REGEX_LENGTH
+
+
+# analyze a single regex: run the engine and split the generated strings
+# into matches and nonMatches, returns None if the regex is skipped
+# (cacheDir: result cache directory, None for the default, '' for no cache;
+# output: engine result, or the exception it raised, when the engine was
+# already run on the regex; timeLimit, maxStrings: engine budget, the
+# record of a run cut short by it is marked truncated); the record of a
+# regex with loops that backtrack exponentially or polynomially lists them
+# with their attack strings under redos
+def analyze_regex(regexStr, baseSubstring, cacheDir=None, output=None,
+                  timeLimit=0, maxStrings=0):
+    if skip_regex(regexStr):
+        return None
+
+    try:
+        regex = re.compile(regexStr)
+        if output is None:
+            output = compile_regex(regexStr, baseSubstring, cacheDir, timeLimit, maxStrings)
+        elif isinstance(output, Exception):
+            raise output
+        # in this case, an error is thrown by EGRET
+        if output.error is not None:
+            return {'regex': regexStr, 'exceptionStackTrace': {
+                'exceptionThrownBy': 'EGRET',
+                'exception': output.error
             },
+                'matches': [], 'nonMatches': []}
 
-                'matches': [], })
-            hasError = False
-            continue
-        except TimeoutError:
-            print('Timeout!')
-            continue
-        except Exception as e:
-            if len(e.args) > 0:
-                output.append({'regex': regexStr, 'exceptionStackTrace': {
-                    'exceptionThrownBy': 'EGRET',
-                    'exception': e.args[0]
-                },
-                    'matches': []})
-            hasError = False
-            continue
-
-        if hasError:
-            alerts = [status]
-        else:
-            idx = 0
-            line = inputStrs[idx]
-            while line != "BEGIN":
-                idx += 1
-                line = inputStrs[idx]
-            if idx == 0:
-                alerts = []
-                inputStrs = inputStrs[1:]
-            else:
-                alerts = inputStrs[:idx]
-                inputStrs = inputStrs[idx+1:]
-        printProgressBar(i + 1, l, prefix='Progress:',
-                         suffix='Complete', length=50)
-    matches = []
-    nonMatches = []
+    # here we catch errors thrown by the re library
+    except re.error as e:
+        return {'regex': regexStr, 'exceptionStackTrace': {
+            'exceptionThrownBy': 'Python',
+            'exception':  e.msg
+        },
+
+            'matches': [], }
+    except TimeoutError:
+        print('Timeout!')
+        return None
+    except Exception as e:
+        if len(e.args) > 0:
+            return {'regex': regexStr, 'exceptionStackTrace': {
+                'exceptionThrownBy': 'EGRET',
+                'exception': e.args[0]
+            },
+                'matches': []}
+        return None
+
+    # re only decides the strings the engine's matcher cannot (see egret_match)
     try:
-        for inputStr in inputStrs:
-            search = perform_search(inputStr)
-            if search:
-                matches.append(inputStr)
-            else:
-                nonMatches.append(inputStr)
-        output.append(
-            {'regex': regexStr, 'exceptionStackTrace': None, 'matches': matches, 'nonMatches': nonMatches})
+        matches, nonMatches = egret_match.split(regexStr, output.test_strings,
+                                                fallback=lambda s: perform_search(regex, s))
     except:
-        # do nothing
-        continue
+        return None
+
+    record = {'regex': regexStr, 'exceptionStackTrace': None, 'matches': matches,
+              'nonMatches': nonMatches, 'engineStats': output.stats}
+    if output.truncated:
+        record['truncated'] = True
+    backtracking = egret_alerts.backtracking_alerts(output.alerts)
+    if backtracking:
+        record['redos'] = [{'type': alert.type, 'attack': alert.attack}
+                           for alert in backtracking]
+    return record
+
+
+# groups the regexes that share a canonical form (see egret_ext.canonicalize),
+# a regex the engine cannot parse is only grouped with its exact duplicates
+# and a skipped regex with no other; returns the groups as lists of indexes
+# into regexStrs, in order of their first regex
+def group_regexes(regexStrs):
+    groups = {}
+    for i, regexStr in enumerate(regexStrs):
+        if skip_regex(regexStr):
+            key = ('skipped', i)
+        else:
+            try:
+                form = egret_ext.canonicalize(regexStr)
+            except (UnicodeError, ValueError):
+                form = None
+            key = ('regex', regexStr) if form is None else ('form', form)
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+# yields the records of a window of size regexes in input order, from the
+# (group, records) pairs of its groups (in order of their first regex)
+def records_in_order(size, groupRecords):
+    records = [None] * size
+    finished = [False] * size
+    nextIndex = 0
+    for group, recs in groupRecords:
+        for i, record in zip(group, recs):
+            records[i] = record
+            finished[i] = True
+        while nextIndex < size and finished[nextIndex]:
+            yield records[nextIndex]
+            records[nextIndex] = None
+            nextIndex += 1
+
+
+# yields each window of GROUP_SIZE regexes with its groups (see group_regexes)
+def group_windows(regexStrings):
+    regexStrings = iter(regexStrings)
+    while True:
+        window = list(itertools.islice(regexStrings, GROUP_SIZE))
+        if not window:
+            return
+        yield window, group_regexes(window)
+
+
+# the records of a group of regexes with the same canonical form from one
+# engine run (output, None to run the engine on the first regex): each regex
+# splits the strings into its own matches and nonMatches, only the first
+# record keeps the engine stats so stage times count engine runs
+def analyze_group(regexStrs, baseSubstring, cacheDir=None, output=None,
+                  timeLimit=0, maxStrings=0):
+    if skip_regex(regexStrs[0]):
+        return [None] * len(regexStrs)
+    if output is None:
+        try:
+            output = compile_regex(regexStrs[0], baseSubstring, cacheDir, timeLimit, maxStrings)
+        except Exception as e:
+            output = e
+    records = [analyze_regex(regexStr, baseSubstring, output=output) for regexStr in regexStrs]
+    for record in records[1:]:
+        if record is not None:
+            record.pop('engineStats', None)
+    return records
+
+
+# runs the engine once per group of regexes with the same canonical form,
+# yielding the output records in order
+def analyze_serial(regexStrings, baseSubstring, cacheDir=None, timeLimit=0, maxStrings=0):
+    for window, groups in group_windows(regexStrings):
+        groupRecords = ((group, analyze_group([window[i] for i in group], baseSubstring,
+                                              cacheDir, None, timeLimit, maxStrings))
+                        for group in groups)
+        yield from records_in_order(len(window), groupRecords)
+
+
+# runs the engine on the first regex of each group in one call (spread over
+# threads in the engine), yields the (group, records) pairs
+def analyze_batch(window, groups, baseSubstring, threads=1, cacheDir=None,
+                  timeLimit=0, maxStrings=0):
+    runnable = [window[group[0]] for group in groups if not skip_regex(window[group[0]])]
+    outputs = egret_cache.cached_analyze_many(runnable, baseSubstring, False,
+                                              threads, cacheDir, timeLimit, maxStrings)
+    outputs = dict(zip(runnable, outputs))
+    for group in groups:
+        regexStrs = [window[i] for i in group]
+        yield group, analyze_group(regexStrs, baseSubstring, output=outputs.get(regexStrs[0]))
+
+
+# same as analyze_serial but the engine runs batches of regexes on threads,
+# no timeout is enforced since threads cannot be killed (use timeLimit)
+def analyze_threaded(regexStrings, baseSubstring, threads, cacheDir=None,
+                     timeLimit=0, maxStrings=0):
+    for window, groups in group_windows(regexStrings):
+        groupRecords = itertools.chain.from_iterable(
+            analyze_batch(window, groups[start:start + BATCH_SIZE], baseSubstring,
+                          threads, cacheDir, timeLimit, maxStrings)
+            for start in range(0, len(groups), BATCH_SIZE))
+        yield from records_in_order(len(window), groupRecords)
+
+
+# the records of a group run by a worker: a killed worker gives no record
+# and a crashed one an error record for every regex
+def parallel_records(regexStrs, ok, result):
+    if ok:
+        return result
+    if isinstance(result, egret_pool.EngineTimeout):
+        print('Timeout!')
+        return [None] * len(regexStrs)
+    return [{'regex': regexStr, 'exceptionStackTrace': {
+        'exceptionThrownBy': 'EGRET',
+        'exception': str(result)
+    },
+        'matches': []} for regexStr in regexStrs]
+
+
+# same as analyze_serial but spread over worker processes, a worker that
+# exceeds the timeout is killed and replaced
+def analyze_parallel(regexStrings, baseSubstring, workers, timeout, cacheDir=None,
+                     timeLimit=0, maxStrings=0):
+    with egret_pool.EnginePool(analyze_group, workers, timeout) as pool:
+        for window, groups in group_windows(regexStrings):
+            tasks = (([window[i] for i in group], baseSubstring, cacheDir, None,
+                      timeLimit, maxStrings) for group in groups)
+            groupRecords = ((group, parallel_records(regexStrs, ok, result))
+                            for group, ((regexStrs, *_), ok, result) in zip(groups, pool.imap(tasks)))
+            yield from records_in_order(len(window), groupRecords)
+
+
+# nearest-rank percentile of a sorted list
+def percentile(sortedValues, p):
+    rank = max(1, -(-len(sortedValues) * p // 100))
+    return sortedValues[int(rank) - 1]
+
+
+# adds the stage times and allocations of one engine run to stageTimes
+# (stage -> list of (seconds, objects)); results served from the cache carry
+# the stats of the run that filled it, so they are left out
+def add_stage_times(stageTimes, engineStats):
+    if engineStats.get('cached'):
+        return
+    allocations = engineStats.get('allocations', {})
+    for stage, seconds in engineStats['times'].items():
+        stageTimes.setdefault(stage, []).append((seconds, allocations.get(stage, 0)))
+
+
+# prints the p50/p95/p99 time (milliseconds) and allocations (engine objects)
+# of each engine stage
+def print_stage_times(stageTimes):
+    fmt = "{0:30}| {1:30}| {2}"
+    print(fmt.format("Stage (runs)", "p50 / p95 / p99 (ms)", "p50 / p95 / p99 (objects)"))
+    for stage, runs in stageTimes.items():
+        times = sorted(seconds for seconds, objects in runs)
+        allocations = sorted(objects for seconds, objects in runs)
+        print(fmt.format(stage + " (" + str(len(runs)) + ")",
+                         " / ".join("{0:.3f}".format(percentile(times, p) * 1000)
+                                    for p in (50, 95, 99)),
+                         " / ".join(str(percentile(allocations, p)) for p in (50, 95, 99))))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-f", "--file", dest="fileName",
+                      help="file containing regex")
+    parser.add_option("-r", "--regex", dest="regex", help="regular expression")
+    parser.add_option("-b", "--base_substring", dest="baseSubstring",
+                      default="evil", help="base substring for regex strings")
+    parser.add_option("-o", "--output_file", dest="outputFile",
+                      help="output file name")
+    parser.add_option("-d", "--debug", action="store_true", dest="debugMode",
+                      default=False, help="display debug info")
+    parser.add_option("-s", "--stat", action="store_true", dest="statMode",
+                      default=False, help="display stats")
+    parser.add_option("-g", "--groups", action="store_true", dest="showGroups",
+                      default=False, help="show groups")
+    parser.add_option("-n", "--named_groups", action="store_true", dest="showNamedGroups",
+                      default=False, help="only show named groups")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=0,
+                      help="number of worker processes (0 runs in this process)")
+    parser.add_option("--threads", dest="threads", type="int", default=0,
+                      help="number of engine threads in this process (no per-regex timeout)")
+    parser.add_option("-t", "--timeout", dest="timeout", type="float", default=30,
+                      help="seconds before a worker stuck on one regex is killed")
+    parser.add_option("--time_budget", dest="timeBudget", type="float", default=0,
+                      help="seconds the engine may spend on one regex before it stops "
+                           "and keeps its partial results (0 for no budget)")
+    parser.add_option("--max_strings", dest="maxStrings", type="int", default=0,
+                      help="maximum number of strings generated per regex (0 for no limit)")
+    parser.add_option("-i", "--input_format", dest="inputFormat",
+                      choices=egret_io.INPUT_FORMATS,
+                      help="corpus format: json, ndjson or text (default: from file extension)")
+    parser.add_option("--output_dir", dest="outputDir", default=OUTPUT_DIR,
+                      help="directory of the output shards and their index")
+    parser.add_option("--shard_size", dest="shardSize", type="float", default=64,
+                      help="maximum size of an output shard in MB")
+    parser.add_option("--resume", action="store_true", dest="resume", default=False,
+                      help="continue an interrupted run from its last checkpoint in the output directory")
+    parser.add_option("--no_compress", action="store_true", dest="noCompress",
+                      default=False, help="write plain NDJSON shards instead of gzip")
+    parser.add_option("--cache_dir", dest="cacheDir",
+                      help="result cache directory (default: $EGRET_CACHE_DIR or ~/.cache/egret)")
+    parser.add_option("--no_cache", action="store_true", dest="noCache",
+                      default=False, help="do not use the result cache")
+    parser.add_option("--probe", action="store_true", dest="probe", default=False,
+                      help="time Python's re on pumped evil strings and record how the "
+                           "times grow (see egret_probe)")
+    parser.add_option("--probe_timeout", dest="probeTimeout", type="float",
+                      default=egret_probe.TIMEOUT,
+                      help="seconds before a probe search is killed")
+    opts, args = parser.parse_args()
+
+    # check for valid command lines
+    if opts.fileName != None and opts.regex != None:
+        print("Cannot specify both a regular expression and input file")
+        sys.exit(-1)
+    if opts.workers > 0 and opts.threads > 0:
+        print("Cannot specify both worker processes and threads")
+        sys.exit(-1)
+
+    logFile = open("./tmp/logs.tx", 'w')
+    # get the regular expressions (streamed, the corpus is never fully in memory)
+    if opts.fileName != None:
+        regexStrings = egret_io.iter_regexes(opts.fileName, opts.inputFormat)
+        l = egret_io.count_regexes(opts.fileName, opts.inputFormat)
+    elif opts.regex != None:
+        regexStrings = iter([opts.regex])
+        l = 1
+    else:
+        regexStrings = iter([])
+        l = 0
+
+    # a resumed run skips the regexes recorded by the last checkpoint
+    runState = {'input': opts.fileName if opts.fileName != None else opts.regex,
+                'inputFormat': opts.inputFormat, 'baseSubstring': opts.baseSubstring,
+                'timeBudget': opts.timeBudget, 'maxStrings': opts.maxStrings}
+    if opts.probe:
+        runState['probe'] = True
+    done = 0
+    windowStart = 0
+    if opts.resume:
+        manifest = egret_io.read_manifest(opts.outputDir, OUTPUT_PREFIX)
+        if manifest is not None:
+            state = dict(manifest['state'])
+            done = state.pop('done')
+            if state != runState or manifest['compress'] == opts.noCompress:
+                print("Cannot resume: the output in " + opts.outputDir +
+                      " was written with different options")
+                sys.exit(-1)
+            # the window holding the first regex left is analyzed again from
+            # its start so its regexes are grouped as in an uninterrupted run
+            windowStart = done - done % GROUP_SIZE
+            regexStrings = itertools.islice(regexStrings, windowStart, None)
+
+    cacheDir = '' if opts.noCache else opts.cacheDir
+    cache = egret_cache.get_cache(cacheDir)
+    if cache is not None:
+        cacheBefore = cache.counters()
+
+    # compile the regular expressions
+    if l > 0:
+        printProgressBar(min(done, l), l, prefix='Progress:', suffix='Complete', length=50)
+
+    if opts.workers > 0:
+        records = analyze_parallel(regexStrings, opts.baseSubstring,
+                                   opts.workers, opts.timeout, cacheDir,
+                                   opts.timeBudget, opts.maxStrings)
+    elif opts.threads > 0:
+        records = analyze_threaded(regexStrings, opts.baseSubstring,
+                                   opts.threads, cacheDir, opts.timeBudget, opts.maxStrings)
+    else:
+        records = analyze_serial(regexStrings, opts.baseSubstring, cacheDir,
+                                 opts.timeBudget, opts.maxStrings)
+    records = itertools.islice(records, done - windowStart, None)
 
-amount_of_splits = 10
+    # probes run as many searches at once as the engine has workers or
+    # threads, each on a worker process of the prober (like the engine
+    # workers, use no more than there are cores or the timings get noisy)
+    prober = None
+    if opts.probe:
+        prober = egret_probe.Prober(opts.baseSubstring, opts.probeTimeout,
+                                    workers=max(opts.workers, opts.threads, 1))
+        records = prober.probe_records(records)
 
-splitted = np.array_split(output, amount_of_splits)
+    # results are written as they arrive, in shards of at most shardSize MB
+    # (indexed by regex, see egret_io.ShardReader), and checkpointed every
+    # CHECKPOINT_INTERVAL seconds with the number of regexes done
+    stageTimes = {}
+    with egret_io.ShardWriter(opts.outputDir, OUTPUT_PREFIX, int(opts.shardSize * 1024 * 1024),
+                              compress=not opts.noCompress, resume=opts.resume) as writer:
+        lastCheckpoint = time.monotonic()
+        for i, record in enumerate(records, done):
+            if record is not None:
+                engineStats = record.pop('engineStats', None)
+                if engineStats is not None:
+                    add_stage_times(stageTimes, engineStats)
+                writer.write(record)
+            if time.monotonic() - lastCheckpoint >= CHECKPOINT_INTERVAL:
+                writer.checkpoint(dict(runState, done=i + 1))
+                lastCheckpoint = time.monotonic()
+            printProgressBar(i + 1, l, prefix='Progress:',
+                             suffix='Complete', length=50)
+        writer.checkpoint(dict(runState, done=max(done, l)))
+    if prober is not None:
+        prober.close()
 
-for i, split in enumerate(splitted):
+    if opts.statMode:
+        print_stage_times(stageTimes)
+        if cache is not None:
+            egret_cache.print_stats(cache, cacheBefore)
 
-    outFile = open(
-        "./data/output/stackoverflow/stackoverflow_egret_" + str(i) + ".json", 'w')
-    json.dump(list(split), outFile)
+    logFile.close()
+    sys.exit(0)
 
-if opts.outputFile:
-    outFile.close()
 
-sys.exit(0)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# egret_alerts.py: Presentation of EGRET engine results
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# egret_ext.analyze returns alerts as egret_ext.Alert objects; the functions
+# below turn them into the text (ANSI highlighting) or HTML (web) reports, or
+# into the JSON records of ACRE's corpus mode.
+
+import re
+import egret_cache
+import egret_match
+
+NO_VIOLATIONS = "No violations detected."
+
+# alert types of the checks for loops that backtrack exponentially or polynomially
+BACKTRACKING_TYPES = ("nested quantifier", "ambiguous alternation",
+                      "overlapping adjacent quantifiers")
+
+HIGHLIGHT = {False: ("\033[33;44;1m", "\033[0m"), True: ("<mark>", "</mark>")}
+
+
+# line break for the output format
+def line_break(web=False):
+    return "<br>" if web else "\n"
+
+
+# regex with the alert locations highlighted
+def highlight(regexStr, locations, web=False):
+    start, end = HIGHLIGHT[web]
+    starts = set(loc[0] for loc in locations)
+    ends = set(loc[1] for loc in locations)
+    out = []
+    for i, c in enumerate(regexStr):
+        if i in starts:
+            out.append(start)
+        out.append(c)
+        if i in ends:
+            out.append(end)
+    return "".join(out)
+
+
+def header_line(alert):
+    return alert.kind.upper() + " (" + alert.type + "): " + alert.message
+
+
+def anchor_lines(alert):
+    return ["..." + label + ": " + s for label, s in alert.anchor_examples]
+
+
+def regex_line(alert, regexStr, web=False):
+    return "...Regex: " + highlight(regexStr, alert.locations, web)
+
+
+def suggestion_line(alert):
+    return "...Suggested fix: " + alert.suggestion
+
+
+def example_line(alert):
+    return "...Example accepted string: " + alert.example
+
+
+def attack_line(alert):
+    return "...Attack string: " + alert.attack
+
+
+# all the lines describing an alert
+def alert_lines(alert, regexStr, web=False):
+    lines = [header_line(alert)] + anchor_lines(alert)
+    if alert.locations:
+        lines.append(regex_line(alert, regexStr, web))
+    if alert.suggestion is not None:
+        lines.append(suggestion_line(alert))
+    if alert.example is not None:
+        lines.append(example_line(alert))
+    if alert.attack is not None:
+        lines.append(attack_line(alert))
+    return lines
+
+
+# the alerts about loops that backtrack exponentially or polynomially
+def backtracking_alerts(alerts):
+    return [alert for alert in alerts if alert.type in BACKTRACKING_TYPES]
+
+
+# an alert formatted as a single string, each line ending with a line break
+def format_alert(alert, regexStr, web=False):
+    lb = line_break(web)
+    return lb.join(alert_lines(alert, regexStr, web)) + lb
+
+
+# returns true if the regex accepts the (example) string
+def accepts(regexStr, s):
+    return egret_match.classify(regexStr, [s], fullmatch=True)[0]
+
+
+# returns None if the suggested fix compiles, otherwise the compiler error
+def fix_error(fix):
+    try:
+        re.compile(fix)
+    except re.error as e:
+        return str(e)
+    return None
+
+
+# an alert as a JSON object, with whether each example is accepted and
+# whether the suggested fix compiles (None when there is nothing to check)
+def alert_record(alert, regexStr):
+    record = {'kind': alert.kind, 'type': alert.type, 'message': alert.message,
+              'locations': [list(loc) for loc in alert.locations],
+              'anchorExamples': [{'label': label, 'string': s, 'valid': accepts(regexStr, s)}
+                                 for label, s in alert.anchor_examples],
+              'suggestion': alert.suggestion, 'suggestionValid': None,
+              'example': alert.example, 'exampleValid': None,
+              'attack': alert.attack}
+    if alert.suggestion is not None:
+        record['suggestionValid'] = fix_error(alert.suggestion) is None
+    if alert.example is not None:
+        record['exampleValid'] = accepts(regexStr, alert.example)
+    return record
+
+
+# checks a regex in check mode and returns its JSON record: the compiler or
+# engine error, or the violations (see alert_record)
+def check_record(regexStr, cacheDir=None):
+    record = {'regex': regexStr, 'error': None, 'violations': []}
+    try:
+        re.compile(regexStr)
+    except re.error as e:
+        record['error'] = "ERROR (compiler error): Regular expression did not compile: " + str(e)
+        return record
+
+    result = egret_cache.cached_analyze(regexStr, "evil", True, cacheDir)
+    if result.error is not None:
+        record['error'] = result.error
+    else:
+        record['violations'] = [alert_record(alert, regexStr) for alert in result.alerts]
+    return record
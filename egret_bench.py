@@ -0,0 +1,284 @@
+# egret_bench.py: Benchmark of the EGRET engine
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The corpus is the regexes of the sample outputs (data/output/sample) plus
+# generated stress shapes, so every run measures the same cases.  Each case
+# runs in its own process so its peak RSS is not hidden by earlier cases.
+#
+#   python3 egret_bench.py                         # compare against data/bench/baseline.json
+#   python3 egret_bench.py --save bench.json       # record a baseline
+#   python3 egret_bench.py --baseline bench.json --compare_times
+#
+# A comparison exits with status 1 if a case's path or string count or its
+# error changed.  These hold on any machine, so the stored baseline (test
+# generation mode, base substring "evil") is compared against by default;
+# re-record it with --save data/bench/baseline.json when the engine changes
+# on purpose.  --baseline '' skips it.  Times and peak RSS only mean
+# something against a baseline recorded on the same machine, so a case that
+# got slower or bigger than the tolerance allows only counts with
+# --compare_times.
+#
+#   python3 egret_bench.py --soak 1000000          # look for leaks
+#
+# A soak run calls the engine over and over on the sample regexes in one
+# process and exits with status 1 if the RSS keeps growing after warm up.
+
+import glob
+import json
+import os
+import re
+import resource
+import string
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "data", "output", "sample")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "data", "bench", "baseline.json")
+
+SIZES = {'small': 0, 'medium': 1, 'large': 2}
+
+TIME_FLOOR = 0.001              # time differences below this are noise (seconds)
+RSS_FLOOR = 1024                # RSS differences below this are noise (KB)
+SOAK_SAMPLES = 10               # RSS samples taken during a soak run
+
+CHARSET_CHARS = [re.escape(c) for c in string.printable if not c.isspace()]
+
+
+# stress shapes: name -> function from a size index to a regex
+STRESS_SHAPES = {
+    'nested_groups': lambda i: '(' * (10, 50, 200)[i] + 'a' + ')' * (10, 50, 200)[i],
+    'nested_loops': lambda i: '(a(b' * (4, 8, 16)[i] + ')*c)?' * (4, 8, 16)[i],
+    'alternation': lambda i: '|'.join('w' + str(j) for j in range((10, 100, 1000)[i])),
+    'char_set': lambda i: '[' + ''.join(CHARSET_CHARS[:(10, 40, len(CHARSET_CHARS))[i]]) + ']+',
+    'repeat_bounds': lambda i: 'a{1,' + str((10, 1000, 100000)[i]) + '}',
+    'literal': lambda i: 'x' * (100, 1000, 10000)[i],
+}
+
+
+# regexes from the sample outputs, in file order
+def sample_regexes(sampleDir=SAMPLE_DIR):
+    regexes = []
+    for fileName in sorted(glob.glob(os.path.join(sampleDir, "*.json"))):
+        with open(fileName) as inFile:
+            for record in json.load(inFile):
+                if record['regex'] not in regexes:
+                    regexes.append(record['regex'])
+    return regexes
+
+
+# the benchmark cases as an ordered list of (name, regex)
+def corpus(sampleDir=SAMPLE_DIR):
+    cases = [('sample_' + str(i), regexStr)
+             for i, regexStr in enumerate(sample_regexes(sampleDir))]
+    for shape, makeRegex in STRESS_SHAPES.items():
+        for size, i in SIZES.items():
+            cases.append((shape + '_' + size, makeRegex(i)))
+    return cases
+
+
+# peak resident set size of this process in KB
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+# current resident set size of this process in KB (the peak where unknown)
+def current_rss():
+    try:
+        with open("/proc/self/statm") as inFile:
+            return int(inFile.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return peak_rss()
+
+
+# calls the engine calls times on the regexes in turn (each call is a run,
+# which returns a list, and an analyze, which returns a result), returns
+# the (calls, RSS) samples
+def soak(regexStrs, baseSubstring, checkMode, calls):
+    import egret_ext
+
+    step = max(calls // SOAK_SAMPLES, 1)
+    samples = []
+    for i in range(calls):
+        regexStr = regexStrs[i % len(regexStrs)]
+        egret_ext.run(regexStr, baseSubstring, checkMode, False, False, False)
+        egret_ext.analyze(regexStr, baseSubstring, checkMode)
+        if (i + 1) % step == 0 or i + 1 == calls:
+            samples.append((i + 1, current_rss()))
+    return samples
+
+
+# runs one case in this process, returns its measurements
+def measure(regexStr, baseSubstring, checkMode, repeat):
+    import egret_ext
+
+    before = peak_rss()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = egret_ext.analyze(regexStr, baseSubstring, checkMode)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    counts = result.stats['counts']
+    return {
+        'time': best,
+        'rss': peak_rss(),
+        'rssGrowth': peak_rss() - before,
+        'paths': counts.get('Paths'),
+        'strings': counts.get('Strings', len(result.test_strings)),
+        'error': result.error,
+    }
+
+
+# runs one case in a fresh process
+def run_case(name, baseSubstring, checkMode, repeat):
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', name,
+           '-b', baseSubstring, '-n', str(repeat)]
+    if checkMode:
+        cmd.append('--check')
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+        return {'crash': proc.stderr.strip().splitlines()[-1:] or [str(proc.returncode)]}
+    return json.loads(proc.stdout)
+
+
+# compares a case with its baseline, returns a list of problems (times and
+# peak RSS are only compared if compareTimes is set)
+def compare_case(new, old, tolerance, compareTimes=False):
+    if 'crash' in new:
+        return ['crashed: ' + new['crash'][0]]
+    if 'crash' in old:
+        return []
+    problems = []
+    if compareTimes:
+        if new['time'] > old['time'] * (1 + tolerance) and new['time'] - old['time'] > TIME_FLOOR:
+            problems.append("time {0:.3f} ms -> {1:.3f} ms".format(old['time'] * 1000,
+                                                                  new['time'] * 1000))
+        if new['rss'] > old['rss'] * (1 + tolerance) and new['rss'] - old['rss'] > RSS_FLOOR:
+            problems.append("peak RSS {0} KB -> {1} KB".format(old['rss'], new['rss']))
+    for key in ('paths', 'strings', 'error'):
+        if new[key] != old[key]:
+            problems.append("{0} changed: {1} -> {2}".format(key, old[key], new[key]))
+    return problems
+
+
+def print_case(name, result):
+    fmt = "{0:30}| {1:>12} | {2:>10} | {3:>8} | {4:>8}"
+    if 'crash' in result:
+        print(fmt.format(name, 'CRASH', '', '', ''))
+        return
+    print(fmt.format(name, "{0:.3f}".format(result['time'] * 1000), result['rss'],
+                     result['paths'] if result['paths'] is not None else '-',
+                     result['strings']))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--base_substring", dest="baseSubstring",
+                      default="evil", help="base substring for regex strings")
+    parser.add_option("-c", "--check", action="store_true", dest="checkMode",
+                      default=False, help="benchmark check mode instead of test generation")
+    parser.add_option("-n", "--repeat", dest="repeat", type="int", default=5,
+                      help="runs per case, the fastest one is reported")
+    parser.add_option("-k", "--cases", dest="pattern",
+                      help="only run the cases whose name matches this regex")
+    parser.add_option("--save", dest="saveFile", help="save the results as a baseline")
+    parser.add_option("--baseline", dest="baselineFile", default=BASELINE_FILE,
+                      help="baseline to compare against (default: the stored one)")
+    parser.add_option("--tolerance", dest="tolerance", type="float", default=0.25,
+                      help="allowed relative growth in time and peak RSS")
+    parser.add_option("--compare_times", action="store_true", dest="compareTimes",
+                      default=False, help="also compare times and peak RSS (use a baseline "
+                                          "recorded on this machine)")
+    parser.add_option("--soak", dest="soakCalls", type="int",
+                      help="call the engine this many times and check that RSS stays flat")
+    parser.add_option("--case", dest="case", help="run a single case in this process (internal)")
+    opts, args = parser.parse_args()
+
+    cases = corpus()
+
+    # child process: measure one case and report it on stdout
+    if opts.case is not None:
+        regexStr = dict(cases)[opts.case]
+        print(json.dumps(measure(regexStr, opts.baseSubstring, opts.checkMode, opts.repeat)))
+        sys.exit(0)
+
+    if opts.pattern is not None:
+        cases = [(name, regexStr) for name, regexStr in cases if re.search(opts.pattern, name)]
+
+    # soak run: the first sample is taken after warm up, later ones must not grow
+    if opts.soakCalls is not None:
+        regexStrs = [regexStr for name, regexStr in cases if name.startswith('sample_')]
+        if not regexStrs:
+            print("No sample regexes to soak")
+            sys.exit(-1)
+        fmt = "{0:30}| {1:>10}"
+        print(fmt.format("Calls", "RSS (KB)"))
+        samples = soak(regexStrs, opts.baseSubstring, opts.checkMode, opts.soakCalls)
+        for calls, rss in samples:
+            print(fmt.format(calls, rss))
+        growth = samples[-1][1] - samples[0][1]
+        print("RSS growth after warm up: " + str(growth) + " KB")
+        sys.exit(1 if growth > RSS_FLOOR else 0)
+
+    # the stored baseline is skipped when it does not apply, a given one must
+    baseline = None
+    stored = opts.baselineFile == BASELINE_FILE
+    if opts.baselineFile and not (stored and not os.path.exists(opts.baselineFile)):
+        with open(opts.baselineFile) as inFile:
+            baseline = json.load(inFile)
+        if baseline['checkMode'] != opts.checkMode or baseline['baseSubstring'] != opts.baseSubstring:
+            if not stored:
+                print("Baseline was recorded with different options")
+                sys.exit(-1)
+            print("Stored baseline was recorded with different options, not comparing")
+            baseline = None
+
+    fmt = "{0:30}| {1:>12} | {2:>10} | {3:>8} | {4:>8}"
+    print(fmt.format("Case", "Time (ms)", "RSS (KB)", "Paths", "Strings"))
+    results = {}
+    regressions = 0
+    for name, regexStr in cases:
+        results[name] = run_case(name, opts.baseSubstring, opts.checkMode, opts.repeat)
+        print_case(name, results[name])
+        if baseline is not None and name in baseline['cases']:
+            for problem in compare_case(results[name], baseline['cases'][name], opts.tolerance,
+                                         opts.compareTimes):
+                print("REGRESSION: " + problem)
+                regressions += 1
+
+    if opts.saveFile is not None:
+        with open(opts.saveFile, 'w') as outFile:
+            json.dump({'baseSubstring': opts.baseSubstring, 'checkMode': opts.checkMode,
+                       'cases': results}, outFile, indent=1)
+
+    if baseline is not None:
+        print(str(regressions) + " regression(s)")
+        sys.exit(1 if regressions else 0)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# egret_cache.py: Persistent cache of EGRET engine results
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Engine results (egret_ext.Result) are stored in a SQLite database keyed by a
+# hash of the regex, the base substring, the check mode and the engine build,
+# so a rebuilt engine never serves results produced by an older one.  Web mode
+# only changes how results are presented, so it is not part of the key.  The cache
+# directory comes from EGRET_CACHE_DIR (default ~/.cache/egret); setting it
+# to an empty string disables caching.  Runs with a budget are looked up like
+# any other (a string budget needs a fresh run), but a result cut short by its
+# budget is never stored.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import egret_ext
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "egret")
+DEFAULT_MAX_BYTES = int(os.environ.get("EGRET_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+_build_id = None
+_caches = {}
+_cachesLock = threading.Lock()
+
+
+# identifies the engine build: a hash of the extension module itself
+def engine_build_id():
+    global _build_id
+    if _build_id is None:
+        h = hashlib.sha1()
+        with open(egret_ext.__file__, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _build_id = h.hexdigest()
+    return _build_id
+
+
+class ResultCache:
+    """
+    Size bounded cache of egret_ext.analyze results.
+    @params:
+        directory   - Required  : directory holding the cache database (Str)
+        maxBytes    - Optional  : total size of cached results before the least
+                                  recently used ones are evicted (Int)
+    """
+
+    def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.path = os.path.join(directory, "results.sqlite")
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    # one connection per process and thread
+    def _connect(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                         "key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('bytes', 0)")
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    def key(self, regexStr, baseSubstring, checkMode):
+        data = json.dumps([engine_build_id(), regexStr, baseSubstring, bool(checkMode)])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, regexStr, baseSubstring, checkMode):
+        conn = self._connect()
+        key = self.key(regexStr, baseSubstring, checkMode)
+        row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        with conn:
+            if row is None:
+                self.misses += 1
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self.hits += 1
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+            conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return decode_result(row[0])
+
+    def put(self, regexStr, baseSubstring, checkMode, result):
+        self.put_many([regexStr], baseSubstring, checkMode, [result])
+
+    # stores the results of a batch of regexes in one transaction
+    def put_many(self, regexStrs, baseSubstring, checkMode, results):
+        conn = self._connect()
+        with conn:
+            added = 0
+            for regexStr, result in zip(regexStrs, results):
+                key = self.key(regexStr, baseSubstring, checkMode)
+                value = json.dumps(result)
+                size = len(value) + len(key)
+                old = conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                             (key, value, size, time.time()))
+                added += size - (old[0] if old else 0)
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'bytes'", (added,))
+            total = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        if total > self.maxBytes:
+            self.evict(int(self.maxBytes * 0.9))
+
+    # drop least recently used results until the cache holds at most target bytes
+    def evict(self, target):
+        conn = self._connect()
+        with conn:
+            total = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+            rows = conn.execute("SELECT key, size FROM results ORDER BY last_used")
+            doomed = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                doomed.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'bytes'", (total,))
+
+    # cumulative counters stored with the cache (shared by all processes)
+    def counters(self):
+        conn = self._connect()
+        return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+
+    def analyze(self, regexStr, baseSubstring, checkMode, timeLimit=0, maxStrings=0):
+        result = None
+        if not maxStrings:
+            result = self.get(regexStr, baseSubstring, checkMode)
+        if result is None:
+            result = egret_ext.analyze(regexStr, baseSubstring, checkMode,
+                                       time_limit=timeLimit, max_strings=maxStrings)
+            if not result.truncated:
+                self.put(regexStr, baseSubstring, checkMode, result)
+        return result
+
+    # egret_ext.analyze_both, each result is cached under its own mode
+    def analyze_both(self, regexStr, baseSubstring, checkBaseSubstring):
+        checkResult = self.get(regexStr, checkBaseSubstring, True)
+        genResult = self.get(regexStr, baseSubstring, False)
+        if checkResult is None and genResult is None:
+            checkResult, genResult = egret_ext.analyze_both(regexStr, baseSubstring,
+                                                            checkBaseSubstring)
+            self.put(regexStr, checkBaseSubstring, True, checkResult)
+            self.put(regexStr, baseSubstring, False, genResult)
+        elif checkResult is None:
+            checkResult = egret_ext.analyze(regexStr, checkBaseSubstring, True)
+            self.put(regexStr, checkBaseSubstring, True, checkResult)
+        elif genResult is None:
+            genResult = egret_ext.analyze(regexStr, baseSubstring, False)
+            self.put(regexStr, baseSubstring, False, genResult)
+        return checkResult, genResult
+
+    # egret_ext.analyze_many over the regexes missing from the cache
+    def analyze_many(self, regexStrs, baseSubstring, checkMode, threads=1,
+                     timeLimit=0, maxStrings=0):
+        if maxStrings:
+            results = [None] * len(regexStrs)
+        else:
+            results = [self.get(regexStr, baseSubstring, checkMode) for regexStr in regexStrs]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missingStrs = [regexStrs[i] for i in missing]
+            fresh = egret_ext.analyze_many(missingStrs, baseSubstring, checkMode, threads,
+                                           time_limit=timeLimit, max_strings=maxStrings)
+            complete = [(regexStr, result) for regexStr, result in zip(missingStrs, fresh)
+                        if not result.truncated]
+            if complete:
+                self.put_many([regexStr for regexStr, _ in complete], baseSubstring, checkMode,
+                              [result for _, result in complete])
+            for i, result in zip(missing, fresh):
+                results[i] = result
+        return results
+
+
+# rebuilds an egret_ext.Result stored as JSON (the result and its alerts are
+# tuples, so json.dumps stores them as lists); the stats are those of the run
+# that filled the cache, marked with 'cached' so they are not counted again
+def decode_result(value):
+    error, alerts, testStrings, stats, truncated = json.loads(value)
+    stats['cached'] = True
+    alerts = tuple(egret_ext.Alert(a[:3] + [tuple(map(tuple, a[3]))] + a[4:6] +
+                                   [tuple(map(tuple, a[6]))] + a[7:]) for a in alerts)
+    return egret_ext.Result((error, alerts, tuple(testStrings), stats, truncated))
+
+
+# returns the cache for directory (None when caching is disabled)
+def get_cache(directory=None):
+    if directory is None:
+        directory = os.environ.get("EGRET_CACHE_DIR", DEFAULT_DIR)
+    if not directory:
+        return None
+    with _cachesLock:
+        if directory not in _caches:
+            _caches[directory] = ResultCache(directory)
+        return _caches[directory]
+
+
+# egret_ext.analyze, served from the cache when possible
+def cached_analyze(regexStr, baseSubstring, checkMode, directory=None,
+                   timeLimit=0, maxStrings=0):
+    cache = get_cache(directory)
+    if cache is None:
+        return egret_ext.analyze(regexStr, baseSubstring, checkMode,
+                                 time_limit=timeLimit, max_strings=maxStrings)
+    return cache.analyze(regexStr, baseSubstring, checkMode, timeLimit, maxStrings)
+
+
+# egret_ext.analyze_both, served from the cache when possible
+def cached_analyze_both(regexStr, baseSubstring, checkBaseSubstring, directory=None):
+    cache = get_cache(directory)
+    if cache is None:
+        return egret_ext.analyze_both(regexStr, baseSubstring, checkBaseSubstring)
+    return cache.analyze_both(regexStr, baseSubstring, checkBaseSubstring)
+
+
+# egret_ext.analyze_many, served from the cache when possible
+def cached_analyze_many(regexStrs, baseSubstring, checkMode, threads=1, directory=None,
+                        timeLimit=0, maxStrings=0):
+    cache = get_cache(directory)
+    if cache is None:
+        return egret_ext.analyze_many(regexStrs, baseSubstring, checkMode, threads,
+                                      time_limit=timeLimit, max_strings=maxStrings)
+    return cache.analyze_many(regexStrs, baseSubstring, checkMode, threads,
+                              timeLimit, maxStrings)
+
+
+# prints the hit/miss counters
+def print_stats(cache, before=None):
+    counters = cache.counters()
+    if before:
+        counters['hits'] -= before['hits']
+        counters['misses'] -= before['misses']
+    fmt = "{0:30}| {1}"
+    print(fmt.format("Cache hits", counters['hits']))
+    print(fmt.format("Cache misses", counters['misses']))
+    print(fmt.format("Cache size (bytes)", counters['bytes']))
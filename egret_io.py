@@ -0,0 +1,380 @@
+# egret_io.py: Streaming corpus input and sharded output for EGRET
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+import sqlite3
+
+INPUT_FORMATS = ['json', 'ndjson', 'text']
+
+CHUNK_SIZE = 1 << 16
+BLOCK_SIZE = 1 << 16            # uncompressed bytes of records per gzip member
+
+
+# guess the corpus format from the file extension
+def guess_format(fileName):
+    ext = os.path.splitext(fileName)[1].lower()
+    if ext == '.json':
+        return 'json'
+    if ext in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return 'text'
+
+
+# regexes from stackoverflow and regexlib are stored in array called patterns,
+# other corpora store a single pattern per object; anything else raises
+# ValueError
+def _patterns(regexObject):
+    if isinstance(regexObject, str):
+        patterns = [regexObject]
+    elif isinstance(regexObject, dict) and isinstance(regexObject.get('patterns'), list):
+        patterns = regexObject['patterns']
+    elif isinstance(regexObject, dict) and 'pattern' in regexObject:
+        patterns = [regexObject['pattern']]
+    else:
+        raise ValueError("expected a regex string or an object with a 'pattern' "
+                         "string or a 'patterns' list")
+    for pattern in patterns:
+        if not isinstance(pattern, str):
+            raise ValueError("regex is not a string: " + json.dumps(pattern)[:80])
+        yield pattern
+
+
+# yields the elements of a top level JSON array without loading the whole file
+def _iter_json_array(inFile):
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip whitespace and separators
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+            pos += 1
+
+        if pos == len(buf) or not started and buf[pos] != '[':
+            if pos == len(buf) and not eof:
+                more = inFile.read(CHUNK_SIZE)
+                eof = (more == '')
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            if not started:
+                raise ValueError("expected a JSON array of regex objects")
+            raise ValueError("unterminated JSON array")
+
+        if not started:
+            started = True
+            pos += 1
+            continue
+
+        if buf[pos] == ']':
+            return
+
+        # decode the next element, reading more if it is cut off
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            end = None
+        if end is None or (end == len(buf) and not eof):
+            if eof:
+                raise ValueError("malformed JSON array element at offset " + str(pos))
+            more = inFile.read(CHUNK_SIZE)
+            eof = (more == '')
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+
+        yield element
+        pos = end
+        if pos > CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+
+# yields every regex in a corpus file, one at a time
+#   json   - array of objects with a 'pattern' string or a 'patterns' list
+#   ndjson - one such object (or a bare JSON string) per line
+#   text   - one regex per line
+def iter_regexes(fileName, inputFormat=None):
+    if inputFormat is None:
+        inputFormat = guess_format(fileName)
+
+    with open(fileName) as inFile:
+        if inputFormat == 'json':
+            for regexObject in _iter_json_array(inFile):
+                yield from _patterns(regexObject)
+        elif inputFormat == 'ndjson':
+            for line in inFile:
+                if line.strip():
+                    yield from _patterns(json.loads(line))
+        else:
+            for line in inFile:
+                yield line.rstrip('\r\n')
+
+
+# counts the regexes in a corpus file (streams, so memory stays flat)
+def count_regexes(fileName, inputFormat=None):
+    return sum(1 for _ in iter_regexes(fileName, inputFormat))
+
+
+# hash of a regex, the key of the shard index
+def regex_hash(regexStr):
+    return hashlib.sha1(regexStr.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class ShardWriter:
+    """
+    Writes records as NDJSON, starting a new shard when the current one
+    would grow past maxBytes.  Shards are named <prefix>_<n>.ndjson, or
+    <prefix>_<n>.ndjson.gz when compressed: the records are then written in
+    blocks of about BLOCK_SIZE bytes, each one a separate gzip member, so the
+    shard is an ordinary gzip file that can also be read a block at a time.
+    Next to the shards, <prefix>_index.sqlite maps the hash of each regex to
+    the shard, byte offset and length of its line or block (see ShardReader).
+
+    checkpoint(state) makes everything written so far durable and records it,
+    with the caller's state, in <prefix>_manifest.json.  A writer created with
+    resume continues after the last checkpoint of an earlier writer, dropping
+    whatever that one wrote after it; its state is then the checkpointed state
+    (None when starting afresh).
+    """
+
+    def __init__(self, directory, prefix, maxBytes, compress=False, resume=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.maxBytes = maxBytes
+        self.compress = compress
+        self.shard = -1
+        self.size = 0
+        self.records = 0                # records written (rows in the index)
+        self.outFile = None
+        self.block = []                 # (hash, line) of the records not yet written
+        self.blockSize = 0
+        self.state = None
+        os.makedirs(directory, exist_ok=True)
+        self.indexPath = os.path.join(directory, prefix + "_index.sqlite")
+        manifest = read_manifest(directory, prefix) if resume else None
+        if manifest is None:
+            self._start()
+        else:
+            self._restore(manifest)
+
+    # removes the output of an earlier run, which would be read as part of this one
+    def _start(self):
+        for path in glob.glob(os.path.join(glob.escape(self.directory),
+                                           glob.escape(self.prefix) + "_*.ndjson*")):
+            os.remove(path)
+        for path in (self.indexPath, manifest_path(self.directory, self.prefix)):
+            if os.path.exists(path):
+                os.remove(path)
+        self.index = sqlite3.connect(self.indexPath)
+        self.index.execute("CREATE TABLE records (hash TEXT, shard INTEGER, "
+                           "offset INTEGER, length INTEGER, line INTEGER)")
+        # created up front so lookups into a run still going or interrupted use it
+        self.index.execute("CREATE INDEX records_hash ON records (hash)")
+
+    # cuts the output back to the checkpoint in manifest
+    def _restore(self, manifest):
+        if manifest['compress'] != self.compress:
+            raise ValueError("cannot resume: the shards were written with compress=" +
+                             str(manifest['compress']))
+        self.shard = manifest['shard']
+        self.size = manifest['size']
+        self.records = manifest['records']
+        self.state = manifest['state']
+        shard = self.shard + 1
+        while os.path.exists(self.shard_path(shard)):
+            os.remove(self.shard_path(shard))
+            shard += 1
+        if self.shard >= 0:
+            self.outFile = open(self.shard_path(self.shard), 'r+b')
+            self.outFile.truncate(self.size)
+            self.outFile.seek(self.size)
+        self.index = sqlite3.connect(self.indexPath)
+        self.index.execute("CREATE INDEX IF NOT EXISTS records_hash ON records (hash)")
+        self.index.execute("DELETE FROM records WHERE rowid > ?", (self.records,))
+        self.index.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def shard_path(self, shard):
+        return shard_path(self.directory, self.prefix, shard, self.compress)
+
+    def _roll(self):
+        if self.outFile:
+            self.outFile.close()
+        self.shard += 1
+        self.size = 0
+        self.outFile = open(self.shard_path(self.shard), 'wb')
+
+    # writes data (a line or a gzip member holding the lines of block) and
+    # indexes the records in it
+    def _write_data(self, data, block):
+        if self.outFile is None or (self.size > 0 and self.size + len(data) > self.maxBytes):
+            self._roll()
+        self.index.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                               [(h, self.shard, self.size, len(data), i)
+                                for i, (h, _) in enumerate(block)])
+        self.outFile.write(data)
+        self.size += len(data)
+        self.records += len(block)
+
+    def _flush_block(self):
+        if self.block:
+            data = ''.join(line for _, line in self.block).encode('utf-8')
+            self._write_data(gzip.compress(data, mtime=0), self.block)
+            self.block = []
+            self.blockSize = 0
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        entry = (regex_hash(str(record.get('regex'))), line)
+        if not self.compress:
+            self._write_data(line.encode('utf-8'), [entry])
+            return
+        self.block.append(entry)
+        self.blockSize += len(line)
+        if self.blockSize >= BLOCK_SIZE:
+            self._flush_block()
+
+    def checkpoint(self, state):
+        """
+        Makes the records written so far durable and records them in the
+        manifest along with state (any JSON value, e.g. the input position).
+        """
+        if self.compress:
+            self._flush_block()
+        if self.outFile:
+            self.outFile.flush()
+            os.fsync(self.outFile.fileno())
+        self.index.commit()
+        manifest = {'shard': self.shard, 'size': self.size, 'records': self.records,
+                    'compress': self.compress, 'state': state}
+        path = manifest_path(self.directory, self.prefix)
+        with open(path + ".tmp", 'w') as outFile:
+            json.dump(manifest, outFile)
+            outFile.flush()
+            os.fsync(outFile.fileno())
+        os.replace(path + ".tmp", path)
+        self.state = state
+
+    def close(self):
+        if self.compress:
+            self._flush_block()
+        if self.outFile:
+            self.outFile.close()
+            self.outFile = None
+        if self.index:
+            self.index.commit()
+            self.index.close()
+            self.index = None
+
+
+class ShardReader:
+    """
+    Reads the records written by a ShardWriter, either all of them in order
+    or only some through the index: lookup and sample read just the line or
+    block holding each record.
+    """
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        self.index = sqlite3.connect(os.path.join(directory, prefix + "_index.sqlite"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.index.close()
+
+    def __len__(self):
+        return self.index.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _path(self, shard):
+        path = shard_path(self.directory, self.prefix, shard, True)
+        if os.path.exists(path):
+            return path
+        return shard_path(self.directory, self.prefix, shard, False)
+
+    def _read(self, shard, offset, length, line):
+        path = self._path(shard)
+        with open(path, 'rb') as inFile:
+            inFile.seek(offset)
+            data = inFile.read(length)
+        if path.endswith('.gz'):
+            data = gzip.decompress(data)
+        return json.loads(data.decode('utf-8').split('\n')[line])
+
+    # records of a regex (a list, as a corpus may hold a regex more than once)
+    def lookup(self, regexStr):
+        rows = self.index.execute("SELECT shard, offset, length, line FROM records "
+                                  "WHERE hash = ? ORDER BY rowid", (regex_hash(regexStr),))
+        return [self._read(*row) for row in rows]
+
+    # k records picked at random (without replacement)
+    def sample(self, k):
+        rowIds = random.sample(range(1, len(self) + 1), k)
+        return [self._read(*self.index.execute(
+            "SELECT shard, offset, length, line FROM records WHERE rowid = ?",
+            (rowId,)).fetchone()) for rowId in rowIds]
+
+    # all records, in the order they were written
+    def __iter__(self):
+        shard = 0
+        while os.path.exists(self._path(shard)):
+            path = self._path(shard)
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as inFile:
+                for line in inFile:
+                    yield json.loads(line)
+            shard += 1
+
+
+# path of a shard written by ShardWriter
+def shard_path(directory, prefix, shard, compress):
+    return os.path.join(directory, prefix + "_" + str(shard) +
+                        (".ndjson.gz" if compress else ".ndjson"))
+
+
+def manifest_path(directory, prefix):
+    return os.path.join(directory, prefix + "_manifest.json")
+
+
+# the last checkpoint of a ShardWriter (None if it never made one)
+def read_manifest(directory, prefix):
+    try:
+        with open(manifest_path(directory, prefix)) as inFile:
+            return json.load(inFile)
+    except (OSError, ValueError):
+        return None
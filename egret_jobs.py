@@ -0,0 +1,219 @@
+# egret_jobs.py: Bulk analysis jobs for the EGRET web service
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A job analyzes a list of regexes in the background and appends one JSON
+# record per regex, in input order, to its results file.  Each job has its
+# own directory under the jobs directory (EGRET_JOBS_DIR, default
+# ~/.cache/egret/jobs):
+#
+#   job.json        id, base substring, number of regexes and creation time
+#   input.ndjson    the regexes, one JSON string per line
+#   results.ndjson  the records finished so far
+#
+# so a job interrupted by a restart resumes after its last complete record.
+
+import collections
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import egret_pool
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "egret", "jobs")
+
+POLL_INTERVAL = 0.5     # seconds between checks for new results while streaming
+
+
+class JobManager:
+    """
+    Runs bulk analysis jobs, one at a time, on a pool of worker processes.
+    @params:
+        directory   - Required  : directory holding the jobs (Str)
+        func        - Required  : top level function func(regexStr, baseSubstring)
+                                  returning the JSON record of a regex
+        errorFunc   - Required  : function errorFunc(regexStr, baseSubstring, message)
+                                  returning the record of a regex that timed out
+                                  or crashed its worker
+        workers     - Optional  : number of worker processes (Int)
+        timeout     - Optional  : seconds before a regex is abandoned (Float)
+    """
+
+    def __init__(self, directory, func, errorFunc, workers=2, timeout=10):
+        self.directory = directory
+        self.func = func
+        self.errorFunc = errorFunc
+        self.workers = workers
+        self.timeout = timeout
+        self.jobs = {}                      # id -> job info (job.json plus 'done')
+        self.queue = collections.deque()    # ids of the jobs waiting to run
+        self.running = None                 # id of the job being run
+        self.cond = threading.Condition()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _job_path(self, jobId, name):
+        return os.path.join(self.directory, jobId, name)
+
+    # picks up the jobs stored by an earlier server, queueing unfinished ones
+    def _load(self):
+        jobs = []
+        for jobId in os.listdir(self.directory):
+            try:
+                with open(self._job_path(jobId, "job.json")) as inFile:
+                    job = json.load(inFile)
+            except (OSError, ValueError):
+                continue
+            job['done'] = self._complete_records(jobId)
+            jobs.append(job)
+        for job in sorted(jobs, key=lambda job: job['created']):
+            self.jobs[job['id']] = job
+            if job['done'] < job['total']:
+                self.queue.append(job['id'])
+
+    # counts the complete records of a job, dropping a partly written last one
+    def _complete_records(self, jobId):
+        path = self._job_path(jobId, "results.ndjson")
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb+') as resultFile:
+            data = resultFile.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                resultFile.truncate(end)
+        return data.count(b'\n', 0, end)
+
+    def submit(self, regexStrs, baseSubstring):
+        """
+        Stores a job for the regexes (any iterable of strings, consumed before
+        returning) and queues it, returns the job status.
+        """
+        jobId = uuid.uuid4().hex
+        tmpDir = os.path.join(self.directory, "." + jobId)
+        os.makedirs(tmpDir)
+        try:
+            total = 0
+            with open(os.path.join(tmpDir, "input.ndjson"), 'w') as outFile:
+                for regexStr in regexStrs:
+                    outFile.write(json.dumps(regexStr) + '\n')
+                    total += 1
+            job = {'id': jobId, 'baseSubstring': baseSubstring, 'total': total,
+                   'created': time.time()}
+            with open(os.path.join(tmpDir, "job.json"), 'w') as outFile:
+                json.dump(job, outFile)
+            os.rename(tmpDir, os.path.join(self.directory, jobId))
+        except BaseException:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            raise
+
+        with self.cond:
+            job['done'] = 0
+            self.jobs[jobId] = job
+            self.queue.append(jobId)
+            self.cond.notify_all()
+        return self.status(jobId)
+
+    def status(self, jobId):
+        """
+        Returns the progress of a job as a dict (None for an unknown job),
+        state is 'queued', 'running' or 'done'.
+        """
+        with self.cond:
+            job = self.jobs.get(jobId)
+            if job is None:
+                return None
+            if job['done'] == job['total']:
+                state = 'done'
+            elif jobId == self.running:
+                state = 'running'
+            else:
+                state = 'queued'
+            return {'id': jobId, 'state': state, 'total': job['total'], 'done': job['done'],
+                    'baseSubstring': job['baseSubstring'], 'created': job['created']}
+
+    def iter_results(self, jobId, follow=True):
+        """
+        Yields the NDJSON lines of the finished records of a job, in input
+        order.  With follow, waits for the records still being computed.
+        """
+        sent = 0
+        inFile = None
+        try:
+            while True:
+                with self.cond:
+                    job = self.jobs[jobId]
+                    while follow and sent == job['done'] < job['total']:
+                        self.cond.wait(POLL_INTERVAL)
+                    done = job['done']
+                if sent == done:
+                    return
+                # records are counted once written, so the first done lines are complete
+                if inFile is None:
+                    inFile = open(self._job_path(jobId, "results.ndjson"))
+                while sent < done:
+                    yield inFile.readline()
+                    sent += 1
+        finally:
+            if inFile is not None:
+                inFile.close()
+
+    def _run(self):
+        # the workers are started with the first job
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+        with egret_pool.EnginePool(self.func, self.workers, self.timeout, method='spawn') as pool:
+            while True:
+                with self.cond:
+                    while not self.queue:
+                        self.cond.wait()
+                    jobId = self.queue.popleft()
+                    self.running = jobId
+                    job = self.jobs[jobId]
+                self._run_job(pool, job)
+                with self.cond:
+                    self.running = None
+                    self.cond.notify_all()
+
+    # analyzes the regexes of a job that have no record yet
+    def _run_job(self, pool, job):
+        jobId = job['id']
+        baseSubstring = job['baseSubstring']
+        skip = job['done']
+        with open(self._job_path(jobId, "input.ndjson")) as inFile, \
+                open(self._job_path(jobId, "results.ndjson"), 'a') as outFile:
+            regexStrs = (json.loads(line) for i, line in enumerate(inFile) if i >= skip)
+            tasks = ((regexStr, baseSubstring) for regexStr in regexStrs)
+            for (regexStr, _), ok, result in pool.imap(tasks):
+                if not ok:
+                    result = self.errorFunc(regexStr, baseSubstring, str(result))
+                outFile.write(json.dumps(result) + '\n')
+                outFile.flush()
+                with self.cond:
+                    job['done'] += 1
+                    self.cond.notify_all()
+
+
+# returns the jobs directory (EGRET_JOBS_DIR or the default)
+def jobs_dir():
+    return os.environ.get("EGRET_JOBS_DIR", DEFAULT_DIR)
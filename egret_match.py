@@ -0,0 +1,63 @@
+# egret_match.py: Splitting strings into matches and nonMatches of a regex
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Strings are classified by the engine's matcher (egret_ext.classify), a
+# Thompson NFA simulation that takes time linear in the string length, so a
+# ReDoS-prone regex cannot hang on its own evil strings.  Python re only
+# decides the strings the matcher cannot: those of regexes using constructs
+# it does not model exactly (backreferences, lookarounds, \b, flags, \N{...})
+# and strings that are not ASCII.
+
+import re
+import egret_ext
+
+
+def classify(regexStr, strings, fullmatch=False, fallback=None):
+    """
+    Returns a list telling for each string whether the regex matches it
+    (anywhere in the string like re.search, or all of it like re.fullmatch).
+    @params:
+        regexStr    - Required  : regular expression (Str)
+        strings     - Required  : strings to classify (List of Str)
+        fullmatch   - Optional  : match all of each string (Bool)
+        fallback    - Optional  : function from a string to a match (or None)
+                                  for the strings the matcher cannot decide,
+                                  re.search or re.fullmatch of the regex by default
+    """
+    try:
+        results = egret_ext.classify(regexStr, strings, fullmatch)
+    except UnicodeError:
+        results = None
+    if results is None:
+        results = [None] * len(strings)
+    if fallback is None and None in results:
+        regex = re.compile(regexStr)
+        fallback = regex.fullmatch if fullmatch else regex.search
+    return [result if result is not None else fallback(s) is not None
+            for s, result in zip(strings, results)]
+
+
+# splits strings into the (matches, nonMatches) of the regex, in order
+def split(regexStr, strings, fullmatch=False, fallback=None):
+    matches = []
+    nonMatches = []
+    for s, matched in zip(strings, classify(regexStr, strings, fullmatch, fallback)):
+        (matches if matched else nonMatches).append(s)
+    return (matches, nonMatches)
@@ -0,0 +1,375 @@
+# egret_pool.py: Pool of pre-warmed EGRET engine worker processes
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The engine runs inside C++, where neither SIGALRM nor KeyboardInterrupt can
+# reach it.  The only reliable way to stop a runaway regex is to run it in a
+# separate process and kill that process, so the pool below keeps one pipe per
+# worker and enforces the deadline from the parent.
+
+import collections
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+
+class EngineTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class EngineBusy(Exception):
+    pass
+
+
+class EngineError(Exception):
+    pass
+
+
+def _worker_main(conn, func):
+    # pre-warm: load the engine before the first task arrives
+    import egret_ext
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            result = (True, func(*task))
+        except Exception as e:
+            result = (False, repr(e))
+        conn.send(result)
+    conn.close()
+
+
+# error for a worker whose process has exited
+def _crash_error(worker):
+    return WorkerCrashed("ERROR (crash): engine worker exited with code " +
+                         str(worker.process.exitcode))
+
+
+# sends a task to a worker of pool, an idle worker found dead is replaced and
+# the task goes to the replacement (it never ran on the dead one).  Returns
+# the worker running the task, raises WorkerCrashed (after replacing it
+# again) if the replacement cannot take the task either.
+def _send(pool, worker, index, task):
+    try:
+        worker.send(index, task)
+    except (BrokenPipeError, OSError):
+        worker = pool._replace(worker)
+        try:
+            worker.send(index, task)
+        except (BrokenPipeError, OSError):
+            error = _crash_error(worker)
+            pool._replace(worker)
+            raise error
+    return worker
+
+
+class _Worker:
+
+    def __init__(self, ctx, func):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, func),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.index = None       # id of the task being run (imap index or future), None if idle
+        self.task = None        # task being run
+        self.started = 0.0      # time the current task was sent
+
+    # raises BrokenPipeError or OSError (leaving the worker idle) if the
+    # process has died
+    def send(self, index, task):
+        try:
+            self.conn.send(task)
+        except (BrokenPipeError, OSError):
+            self.process.join(1)
+            raise
+        self.index = index
+        self.task = task
+        self.started = time.monotonic()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class EnginePool:
+    """
+    Runs func(*task) for each task on a set of worker processes.
+    @params:
+        func        - Required  : top level function run by the workers
+        workers     - Required  : number of worker processes (Int)
+        timeout     - Optional  : seconds before a task is killed (Float)
+        method      - Optional  : multiprocessing start method (Str)
+    """
+
+    def __init__(self, func, workers, timeout=10, method=None):
+        self.ctx = multiprocessing.get_context(method)
+        self.func = func
+        self.timeout = timeout
+        self.workers = [_Worker(self.ctx, func) for _ in range(max(1, workers))]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    # kills a worker and returns the worker that takes its place
+    def _replace(self, worker):
+        worker.kill()
+        idx = self.workers.index(worker)
+        self.workers[idx] = _Worker(self.ctx, self.func)
+        return self.workers[idx]
+
+    def imap(self, tasks):
+        """
+        Yields (task, ok, value) for each task in the order the tasks were given.
+        value is the function result when ok is True, otherwise an EngineTimeout,
+        WorkerCrashed or the repr of the exception raised by the function.
+        """
+        tasks = iter(tasks)
+        window = 4 * len(self.workers)  # bound on results held out of order
+        results = {}
+        next_send = 0
+        next_yield = 0
+        exhausted = False
+
+        while True:
+            # hand out work to idle workers
+            for worker in list(self.workers):
+                if exhausted or worker.index is not None:
+                    continue
+                if next_send - next_yield >= window:
+                    break
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                try:
+                    _send(self, worker, next_send, task)
+                except WorkerCrashed as e:
+                    results[next_send] = (task, False, e)
+                next_send += 1
+
+            # release finished results in order
+            while next_yield in results:
+                yield results.pop(next_yield)
+                next_yield += 1
+
+            busy = [w for w in self.workers if w.index is not None]
+            if not busy:
+                if exhausted:
+                    return
+                continue
+
+            # wait for a result or for the oldest deadline to pass
+            now = time.monotonic()
+            first_deadline = min(w.started for w in busy) + self.timeout
+            ready = wait([w.conn for w in busy], max(0, first_deadline - now))
+
+            for worker in busy:
+                if worker.conn in ready:
+                    try:
+                        results[worker.index] = (worker.task,) + worker.conn.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(1)
+                        results[worker.index] = (worker.task, False, _crash_error(worker))
+                        worker.index = None
+                        self._replace(worker)
+                        continue
+                    worker.index = None
+                elif time.monotonic() - worker.started >= self.timeout:
+                    results[worker.index] = (worker.task, False, EngineTimeout(
+                        "Time is up! Moving to next regex."))
+                    worker.index = None
+                    self._replace(worker)
+
+
+class EngineService:
+    """
+    Thread safe pool for servers: any thread may submit a task, which runs
+    on a worker process and fails if it is not done by its deadline.
+    @params:
+        func        - Required  : top level function run by the workers
+        workers     - Required  : number of worker processes (Int)
+        timeout     - Optional  : default seconds from submission to deadline (Float)
+        maxQueue    - Optional  : tasks waiting for a worker before submit
+                                  raises EngineBusy (Int, default 4 per worker)
+        method      - Optional  : multiprocessing start method (Str)
+    """
+
+    def __init__(self, func, workers, timeout=10, maxQueue=None, method=None):
+        self.ctx = multiprocessing.get_context(method)
+        self.func = func
+        self.timeout = timeout
+        self.maxQueue = 4 * max(1, workers) if maxQueue is None else maxQueue
+        self.workers = [_Worker(self.ctx, func) for _ in range(max(1, workers))]
+        self.pending = collections.deque()  # (future, task, deadline, timeout) waiting for a worker
+        self.deadlines = {}                 # worker -> (deadline, timeout) of its task
+        self.closed = False
+        self.lock = threading.Lock()
+        self.wakeRecv, self.wakeSend = self.ctx.Pipe(duplex=False)
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, task, timeout=None):
+        """
+        Returns a Future for func(*task).  Its exception is EngineTimeout if the
+        deadline passes, WorkerCrashed if the worker died and EngineError if
+        func raised.  Raises EngineBusy when too many tasks are waiting.
+        """
+        future = Future()
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("engine service is closed")
+            if len(self.pending) >= self.maxQueue:
+                raise EngineBusy("ERROR (busy): too many regexes are waiting to be analyzed")
+            self.pending.append((future, task, deadline, timeout))
+            self.wakeSend.send_bytes(b'')
+        return future
+
+    # runs func(*task) on a worker and returns its value (see submit)
+    def call(self, task, timeout=None):
+        return self.submit(task, timeout).result()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.wakeSend.send_bytes(b'')
+        self.thread.join()
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    # kills a worker and returns the worker that takes its place
+    def _replace(self, worker):
+        worker.kill()
+        idx = self.workers.index(worker)
+        self.workers[idx] = _Worker(self.ctx, self.func)
+        return self.workers[idx]
+
+    def _timeout_error(self, timeout):
+        return EngineTimeout("ERROR (timeout): regex was not analyzed within " +
+                             str(timeout) + " seconds")
+
+    # hands out pending tasks, collects results and enforces deadlines
+    def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                if self.closed:
+                    break
+                for i in range(len(self.workers)):
+                    while self.workers[i].index is None and self.pending:
+                        future, task, deadline, timeout = self.pending.popleft()
+                        if deadline <= now:
+                            future.set_exception(self._timeout_error(timeout))
+                        elif future.set_running_or_notify_cancel():
+                            try:
+                                worker = _send(self, self.workers[i], future, task)
+                            except WorkerCrashed as e:
+                                future.set_exception(e)
+                                continue
+                            self.deadlines[worker] = (deadline, timeout)
+                firstDeadline = min([deadline for future, task, deadline, timeout in self.pending] +
+                                    [deadline for deadline, timeout in self.deadlines.values()],
+                                    default=None)
+
+            # wait for a result, a new task or the first deadline to pass
+            busy = [w for w in self.workers if w.index is not None]
+            waitTime = None if firstDeadline is None else max(0, firstDeadline - now)
+            ready = wait([w.conn for w in busy] + [self.wakeRecv], waitTime)
+            if self.wakeRecv in ready:
+                while self.wakeRecv.poll():
+                    self.wakeRecv.recv_bytes()
+
+            for worker in busy:
+                future = worker.index
+                if worker.conn in ready:
+                    try:
+                        ok, value = worker.conn.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(1)
+                        future.set_exception(_crash_error(worker))
+                        self._finish(worker, replace=True)
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(EngineError(value))
+                    self._finish(worker)
+                elif time.monotonic() >= self.deadlines[worker][0]:
+                    future.set_exception(self._timeout_error(self.deadlines[worker][1]))
+                    self._finish(worker, replace=True)
+
+        # fail whatever is left when the service closes
+        for future, task, deadline, timeout in self.pending:
+            future.set_exception(RuntimeError("engine service is closed"))
+        self.pending.clear()
+        for worker in self.workers:
+            if worker.index is not None:
+                worker.index.set_exception(RuntimeError("engine service is closed"))
+                self._finish(worker)
+
+    # marks a worker idle, replacing it if it crashed or was stopped
+    def _finish(self, worker, replace=False):
+        worker.index = None
+        del self.deadlines[worker]
+        if replace:
+            self._replace(worker)
@@ -0,0 +1,213 @@
+# egret_probe.py: Measured backtracking growth of the EGRET evil strings
+#
+# Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+# elarson@seattleu.edu
+#
+# This file is part of EGRET.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# For each loop it generates strings for, the engine knows a substring of a
+# test string that the loop can repeat (egret_ext.pumps).  A probe repeats it
+# 4, 8, 16, ... times, times Python's re on each string in a worker process
+# that is killed once a search takes longer than the timeout, and classifies
+# how the times grow as linear, polynomial or exponential.  A backtracking
+# matcher is only slow on a string it finally rejects, so each pump is also
+# tried with its suffix replaced or followed by characters regexes rarely
+# match.  The worst growth over all pumps is the result for the regex:
+#
+#   {'growth': 'polynomial', 'degree': 2, 'prefix': '', 'pump': '0',
+#    'suffix': '!', 'timings': [[4, 1.2e-06], [8, 2.1e-06], ...]}
+#
+# where timings holds (repeats, seconds) pairs, None for a search that was
+# killed, and degree is only given for polynomial growth.
+
+import collections
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import egret_ext
+import egret_pool
+
+FAIL_CHARS = ("!", "\n", "\x00")    # characters appended to make a string fail
+START_REPEATS = 4                   # repeats of the pump in the first string
+MAX_LENGTH = 1 << 15                # longest string probed
+TIMEOUT = 1.0                       # seconds before a search is killed
+BUDGET = 30.0                       # seconds spent on one regex before stopping
+MIN_TIME = 0.001                    # a search is repeated until it took this long
+MAX_RUNS = 100                      # but at most this many times
+NOISE_FLOOR = 0.0001                # times below this are noise (seconds)
+EXPONENTIAL_REPEATS = 64            # a search killed at most this many repeats
+                                    # in grows exponentially
+
+GROWTH_ORDER = {'linear': 0, 'polynomial': 1, 'exponential': 2}
+
+
+# worker function: seconds re.search takes on s (re caches the compiled regex)
+def time_search(regexStr, s):
+    regex = re.compile(regexStr)
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        regex.search(s)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME or runs >= MAX_RUNS:
+            return elapsed / runs
+
+
+# slope of the least squares line through the (log repeats, log seconds) points
+def log_slope(points):
+    xs = [math.log(n) for n, seconds in points]
+    ys = [math.log(seconds) for n, seconds in points]
+    xMean = sum(xs) / len(xs)
+    yMean = sum(ys) / len(ys)
+    var = sum((x - xMean) ** 2 for x in xs)
+    return sum((x - xMean) * (y - yMean) for x, y in zip(xs, ys)) / var
+
+
+def classify_growth(timings):
+    """
+    Returns (growth, degree) for (repeats, seconds) timings taken with the
+    repeats doubling each time, degree is None unless growth is polynomial.
+    """
+    killed = [n for n, seconds in timings if seconds is None]
+    if killed and killed[0] <= EXPONENTIAL_REPEATS:
+        return 'exponential', None
+    points = [(n, seconds) for n, seconds in timings
+              if seconds is not None and seconds >= NOISE_FLOOR]
+
+    # polynomial time doubles by a constant factor, exponential time by a
+    # growing one
+    if len(points) >= 3:
+        slopes = [log_slope(points[i:i + 2]) for i in range(len(points) - 1)]
+        if slopes[-1] > 3 and slopes[-1] > 2 * slopes[-2]:
+            return 'exponential', None
+    slope = log_slope(points[-3:]) if len(points) >= 2 else 0
+    if slope >= 1.5:
+        return 'polynomial', int(round(slope))
+    if killed:
+        return 'polynomial', None
+    return 'linear', None
+
+
+class Prober:
+    """
+    Probes regexes with pumped evil strings on worker processes.
+    @params:
+        baseSubstring - Optional  : base substring for the engine strings (Str)
+        timeout       - Optional  : seconds before a search is killed (Float)
+        budget        - Optional  : seconds spent on one regex (Float)
+        workers       - Optional  : regexes probed at once, one worker process each (Int)
+    """
+
+    def __init__(self, baseSubstring="evil", timeout=TIMEOUT, budget=BUDGET, workers=1):
+        self.baseSubstring = baseSubstring
+        self.timeout = timeout
+        self.budget = budget
+        self.workers = max(1, workers)
+        self.service = egret_pool.EngineService(time_search, self.workers, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.service.close()
+
+    # (repeats, seconds) for the pump repeated 4, 8, 16, ... times, stopping
+    # after the first search that is killed
+    def measure(self, regexStr, prefix, pump, suffix, deadline):
+        timings = []
+        n = START_REPEATS
+        while len(prefix) + n * len(pump) + len(suffix) <= MAX_LENGTH:
+            if time.monotonic() >= deadline:
+                break
+            s = prefix + pump * n + suffix
+            try:
+                timings.append([n, self.service.call((regexStr, s))])
+            except egret_pool.EngineTimeout:
+                timings.append([n, None])
+                break
+            except (egret_pool.WorkerCrashed, egret_pool.EngineError):
+                break
+            n *= 2
+        return timings
+
+    def probe(self, regexStr):
+        """
+        Returns the worst growth found for regexStr (see above), or None if the
+        regex has no loop to pump or the engine cannot analyze it.
+        """
+        try:
+            pumps = egret_ext.pumps(regexStr, self.baseSubstring)
+        except (UnicodeError, ValueError):
+            pumps = None
+        if not pumps:
+            return None
+
+        worst = None
+        deadline = time.monotonic() + self.budget
+        for prefix, pump, suffix in dict.fromkeys(pumps):
+            suffixes = [suffix] + list(FAIL_CHARS) + [suffix + c for c in FAIL_CHARS]
+            for tail in dict.fromkeys(suffixes):
+                timings = self.measure(regexStr, prefix, pump, tail, deadline)
+                if not timings:
+                    continue
+                growth, degree = classify_growth(timings)
+                result = {'growth': growth, 'degree': degree, 'prefix': prefix,
+                          'pump': pump, 'suffix': tail, 'timings': timings}
+                if worst is None or rank(result) > rank(worst):
+                    worst = result
+                if growth == 'exponential' or time.monotonic() >= deadline:
+                    return worst
+        return worst
+
+    def probe_record(self, record):
+        """
+        Adds the probe result of an output record's regex to the record as
+        'probe', records of regexes that raised an error are left alone.
+        """
+        if record.get('exceptionStackTrace') is None:
+            record['probe'] = self.probe(record['regex'])
+
+    # probe_record on a thread, returning the record (None is passed through)
+    def _probed(self, record):
+        if record is not None:
+            self.probe_record(record)
+        return record
+
+    def probe_records(self, records):
+        """
+        Yields the output records in order after probe_record, probing up to
+        workers records at a time.  Each probe waits on its own searches, so
+        the searches of different regexes run side by side on the workers.
+        """
+        window = 2 * self.workers  # bound on records probed ahead
+        pending = collections.deque()
+        with ThreadPoolExecutor(self.workers) as threads:
+            for record in records:
+                pending.append(threads.submit(self._probed, record))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+# orders probe results from the best to the worst growth
+def rank(result):
+    return GROWTH_ORDER[result['growth']], result['degree'] or 0
@@ -19,18 +19,35 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-from flask import Flask, request, url_for, render_template, Response, Markup
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from flask import Flask, request, session, url_for, render_template, Response, Markup, jsonify
+import egret_io
+import egret_jobs
+import egret_match
+import egret_pool
 import egret_web_api
 
-# EGRET global variables
-test_strings = [] # Holds all of the strings currently being tested against the regex
-egret = {}
-egret['baseSubstr'] = ''
-egret['testString'] = ''
-egret['showGroups'] = False
-egret['useDiffBase'] = False
 UPLOAD_FOLDER = '/tmp' # Uploads module requires this to be set, but nothing is actually saved there
 ALLOWED_EXTENSIONS = set(['txt'])
+MAX_SESSIONS = 1000 # sessions kept on the server, least recently used ones are dropped
+
+# engine worker processes: the engine never runs in the server process, so a
+# pathological regex costs at most ENGINE_TIMEOUT seconds and a crash only
+# loses a worker (which is replaced).  The user's test strings are classified
+# on as many matcher workers with the same limits, since Python re decides
+# the strings the engine's matcher cannot.  Requests are served by Flask's threaded
+# server rather than an async layer: a handler thread only waits on the future
+# of its engine call, which the dispatcher fails once the deadline passes, so
+# a slow regex holds one request thread for at most ENGINE_TIMEOUT seconds and
+# the queue limit answers 503 before threads pile up.  (Flask's async views
+# need the asgiref package and would still run each view on a thread.)
+ENGINE_WORKERS = int(os.environ.get('EGRET_ENGINE_WORKERS', '2'))
+ENGINE_TIMEOUT = float(os.environ.get('EGRET_ENGINE_TIMEOUT', '10'))
+ENGINE_QUEUE = int(os.environ.get('EGRET_ENGINE_QUEUE', str(4 * ENGINE_WORKERS)))
+JOB_WORKERS = int(os.environ.get('EGRET_JOB_WORKERS', '2')) # worker processes for bulk jobs
 
 # configuration
 DEBUG = True
@@ -39,19 +56,102 @@ DEBUG = True
 app = Flask(__name__)
 app.config.from_object(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.secret_key = os.environ.get('EGRET_SECRET_KEY') or os.urandom(24)
+
+class WebSession:
+  """
+  EGRET state of one user: the strings being tested against the regex and
+  the form values, kept on the server and found through the session cookie.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()  # held while a request uses the session
+    self.test_strings = []        # strings currently being tested against the regex
+    self.analysis = None          # egret_web_api.Analysis of the current regex
+    self.acre = (None, None)      # ACRE (result, errorMsg) of the current regex
+    self.egret = {}
+    self.egret['baseSubstr'] = ''
+    self.egret['testString'] = ''
+    self.egret['showGroups'] = False
+    self.egret['useDiffBase'] = False
+    self.egret['passList'] = []
+    self.egret['failList'] = []
+
+  # switches to the analysis of a new regex, classifying every string (the
+  # session is left unchanged if classifying raises egret_web_api.MATCH_ERRORS)
+  def set_analysis(self, analysis):
+    if analysis is self.analysis:
+      return
+    if analysis is None:
+      (self.egret['passList'], self.egret['failList']) = ([], [])
+    else:
+      (self.egret['passList'], self.egret['failList']) = analysis.classify(self.test_strings)
+    self.analysis = analysis
+
+  # adds a test string, classifying only that string
+  def add_string(self, s):
+    if s in self.test_strings:
+      return
+    if self.analysis is not None:
+      self.analysis.insert(s, self.egret['passList'], self.egret['failList'])
+    self.test_strings.append(s)
+
+  # deletes a test string, removing only that string from the lists
+  def delete_string(self, s):
+    if s not in self.test_strings:
+      return
+    self.test_strings.remove(s)
+    if self.analysis is not None:
+      self.analysis.remove(s, self.egret['passList'], self.egret['failList'])
+
+_sessions = OrderedDict()
+_sessionsLock = threading.Lock()
+_engineLock = threading.Lock()
+jobs = None # egret_jobs.JobManager, started on first use
+
+# starts the engine workers on first use
+def start_engine():
+  with _engineLock:
+    if egret_web_api.engine is None:
+      egret_web_api.engine = egret_pool.EngineService(egret_web_api.Analysis,
+        ENGINE_WORKERS, ENGINE_TIMEOUT, ENGINE_QUEUE, method='spawn')
+      egret_web_api.matcher = egret_pool.EngineService(egret_match.classify,
+        ENGINE_WORKERS, ENGINE_TIMEOUT, ENGINE_QUEUE, method='spawn')
+
+# starts the bulk job manager on first use (resuming the stored jobs)
+def start_jobs():
+  global jobs
+  with _engineLock:
+    if jobs is None:
+      jobs = egret_jobs.JobManager(egret_jobs.jobs_dir(), egret_web_api.job_record,
+        egret_web_api.job_error_record, JOB_WORKERS, ENGINE_TIMEOUT)
+  return jobs
+
+# returns the state of the session making the request
+def get_session():
+  if 'sid' not in session:
+    session['sid'] = uuid.uuid4().hex
+  sid = session['sid']
+  with _sessionsLock:
+    state = _sessions.pop(sid, None)
+    if state is None:
+      state = WebSession()
+    _sessions[sid] = state
+    while len(_sessions) > MAX_SESSIONS:
+      _sessions.popitem(last=False)
+  return state
 
-def run_acre(regex):
+def run_acre(state, regex):
   if regex != '':
-    (result, errorMsg) = egret_web_api.run_acre(regex)
+    (result, errorMsg) = state.acre
     if result:
       result = Markup(result)
     return (result, errorMsg)
 
   return (None, None)
 
-def run_egret(regex):
-  global test_strings
-  global egret
+def run_egret(state, regex):
+  egret = state.egret
 
   # get data from text boxes
   if 'baseSubstr' in request.form:
@@ -64,41 +164,53 @@ def run_egret(regex):
     egret['showGroups'] = 'showGroups' in request.form
     egret['useDiffBase'] = 'useDiffBase' in request.form
         
-  # process saved string options
+  # process saved string options (lists are those shown with the previous page)
   addedStrs = []
+  deletedStrs = []
   if 'addTestString' in request.form:
     addedStrs = [ egret['testString'] ]
   elif 'addSelectedAccept' in request.form:
     addedStrs = request.form.getlist('accept')
   elif 'addAccept' in request.form:
-    addedStrs = egret['passList']
+    addedStrs = list(egret['passList'])
   elif 'addSelectedReject' in request.form:
     addedStrs = request.form.getlist('reject')
   elif 'addReject' in request.form:
-    addedStrs = egret['failList']
+    addedStrs = list(egret['failList'])
   elif 'deleteSelected' in request.form:
     deletedStrs = request.form.getlist('delete')
-    for s in deletedStrs:
-      test_strings.remove(s)
   elif 'deleteAll' in request.form:
-    test_strings = []
+    deletedStrs = list(state.test_strings)
 
-  for item in addedStrs:
-    if item not in test_strings:
-      test_strings.append(item)
-
-  # run egret engine
+  # run egret engine (memoized per regex, so only a new regex or base
+  # substring reclassifies every string)
   if egret['useDiffBase']:
     baseSubstr = egret['baseSubstr']
   else:
     baseSubstr = 'evil'
       
-  if regex != '':
-    (egret['passList'], egret['failList'], egret['errorMsg'], egret['warnings']) = \
-      egret_web_api.run_egret(regex, baseSubstr, test_strings)
-  else:
-    (egret['passList'], egret['failList'], egret['errorMsg'], egret['warnings']) = \
-      ([], [], None, None)
+  # strings are classified on the matcher workers; if that times out or
+  # crashes, the error is shown and the strings are kept unclassified (deleted
+  # strings are removed first, so deleting a string that hangs does not wait)
+  for item in deletedStrs:
+    state.delete_string(item)
+  try:
+    if regex != '':
+      analysis = egret_web_api.get_analysis(regex, baseSubstr)
+      state.acre = analysis.acre
+      state.set_analysis(analysis)
+      (egret['errorMsg'], egret['warnings']) = \
+        (state.analysis.errorMsg, state.analysis.warnings)
+    else:
+      state.set_analysis(None)
+      (egret['errorMsg'], egret['warnings']) = (None, None)
+    for item in addedStrs:
+      state.add_string(item)
+  except egret_web_api.MATCH_ERRORS as e:
+    state.set_analysis(None)
+    (egret['errorMsg'], egret['warnings']) = (str(e), None)
+    for item in addedStrs:
+      state.add_string(item)
 
   if egret['warnings']:
     egret['warnings'] = Markup(egret['warnings'])
@@ -113,10 +225,12 @@ def run_egret(regex):
     
     
   # determine if test string is accepted or not
+  egret['testResult'] = ''
   if regex != '' and egret['testString'] != '' and egret['errorMsg'] == None:
-    egret['testResult'] = egret_web_api.run_test_string(regex, egret['testString'])
-  else:
-    egret['testResult'] = ''
+    try:
+      egret['testResult'] = "ACCEPTED" if state.analysis.accepts(egret['testString']) else "REJECTED"
+    except egret_web_api.MATCH_ERRORS as e:
+      egret['testResult'] = str(e)
     
 def allowed_file(filename):
   return '.' in filename and filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
@@ -131,18 +245,73 @@ def process_submit():
   else:
     regex = ''
 
-  # run tools
-  (acre_result, acre_error) = run_acre(regex)
-  run_egret(regex)
+  # run tools (one engine pass serves both)
+  start_engine()
+  state = get_session()
+  with state.lock:
+    try:
+      run_egret(state, regex)
+    except egret_pool.EngineBusy as e:
+      return Response(str(e), status=503, mimetype='text/plain',
+        headers={'Retry-After': '1'})
+    (acre_result, acre_error) = run_acre(state, regex)
     
-  # render webpage
-  return render_template('egret.html', regex=regex, egret=egret, test_strings=test_strings, \
-    acre_result=acre_result, acre_error=acre_error)
+    # render webpage
+    return render_template('egret.html', regex=regex, egret=state.egret,
+      test_strings=state.test_strings, acre_result=acre_result, acre_error=acre_error)
             
+# BULK JOB API
+#
+# POST /jobs                 regexes as JSON {"regexes": [...], "base_substring": "evil"}
+#                            or an uploaded file (json, ndjson or text corpus format)
+# GET  /jobs/<id>            job progress
+# GET  /jobs/<id>/results    NDJSON records in input order, streamed as they finish
+#                            (?follow=0 returns only the records finished so far)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+  manager = start_jobs()
+  if 'file' in request.files:
+    upload = request.files['file']
+    baseSubstr = request.form.get('base_substring', 'evil')
+    suffix = os.path.splitext(upload.filename)[1]
+    # submit reads the whole upload before returning, so a malformed file
+    # raises here while the temporary file still exists
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+      upload.save(tmp.name)
+      try:
+        status = manager.submit(egret_io.iter_regexes(tmp.name, request.form.get('format')),
+          baseSubstr)
+      except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': 'could not read regexes: ' + str(e)}), 400
+  else:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('regexes'), list) or \
+        not all(isinstance(r, str) for r in data['regexes']):
+      return jsonify({'error': 'expected {"regexes": [strings]} or a file upload'}), 400
+    status = manager.submit(data['regexes'], data.get('base_substring', 'evil'))
+  return jsonify(status), 202
+
+@app.route('/jobs/<jobId>')
+def job_status(jobId):
+  status = start_jobs().status(jobId)
+  if status is None:
+    return jsonify({'error': 'unknown job'}), 404
+  return jsonify(status)
+
+@app.route('/jobs/<jobId>/results')
+def job_results(jobId):
+  manager = start_jobs()
+  if manager.status(jobId) is None:
+    return jsonify({'error': 'unknown job'}), 404
+  follow = request.args.get('follow', '1') != '0'
+  return Response(manager.iter_results(jobId, follow), mimetype='application/x-ndjson')
+
 @app.route('/download')
 def download_file():
+  state = get_session()
   contents = []
-  for item in test_strings:
+  for item in state.test_strings:
     contents.append(item + '\n')
         
   return Response(contents,
@@ -172,9 +341,16 @@ def upload_file():
         new_string = item.decode("utf-8") 
         new_strings.append(new_string.rstrip())
       # transfer content into test strings
-      for item in new_strings:
-        if item not in test_strings:
-          test_strings.append(item)
+      state = get_session()
+      with state.lock:
+        try:
+          for item in new_strings:
+            state.add_string(item)
+        except egret_web_api.MATCH_ERRORS:
+          # kept unclassified, process_submit reports the error
+          state.set_analysis(None)
+          for item in new_strings:
+            state.add_string(item)
       return process_submit()
 
   return render_template('upload.html')
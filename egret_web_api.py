@@ -18,56 +18,70 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
+import functools
 import re
-import egret_ext
+import egret_alerts
+import egret_cache
+import egret_match
+import egret_pool
 
-def run_egret(regexStr, baseSubstring, testList):
+MEMO_SIZE = 256
+
+# compiled patterns, shared by all requests
+compile_regex = functools.lru_cache(maxsize=MEMO_SIZE)(re.compile)
+
+# runs the engine once for both tools, returns the (ACRE, EGRET) results
+# to pass to run_acre and run_egret (None if the regex does not compile)
+def analyze_both(regexStr, baseSubstring):
+    try:
+        compile_regex(regexStr)
+    except re.error:
+        return (None, None)
+    return egret_cache.cached_analyze_both(regexStr, baseSubstring, "evil")
+
+def run_egret(regexStr, baseSubstring, testList, result=None):
     try:
-        regex = re.compile(regexStr)
+        regex = compile_regex(regexStr)
     except re.error as e:
         status = "ERROR (compiler error): Regular expression did not compile: " + str(e)
         return ([], [], status, [])
         
-    inputStrs = egret_ext.run(regexStr, baseSubstring, False, True, False, False)
+    if result is None:
+        result = egret_cache.cached_analyze(regexStr, baseSubstring, False)
+    if result.error is not None:
+        return ([], [], result.error, [])
 
-    idx = 0
-    line = inputStrs[idx]
-    if line[0:5] == "ERROR":
-        return ([], [], line, [])
+    warnings = ""
+    for a in result.alerts:
+      warnings += egret_alerts.format_alert(a, regexStr, web=True)
 
-    while line != "BEGIN":
-      idx += 1;
-      line = inputStrs[idx]
+    inputStrs = sorted(list(set(result.test_strings) | set(testList)))
+    (matches, nonMatches) = egret_match.split(regexStr, inputStrs, True, regex.fullmatch)
 
-    if idx == 0:
-      alerts = []
-      inputStrs = inputStrs[1:]
-    else:
-      alerts = inputStrs[:idx]
-      inputStrs = inputStrs[idx+1:]
+    return (matches, nonMatches, None, warnings)
 
-    warnings = ""
-    for a in alerts:
-      warnings += a
-
-    matches = []
-    nonMatches = []
-
-    inputStrs = sorted(list(set(inputStrs) | set(testList)))
-    
-    for inputStr in inputStrs:
-        search = regex.fullmatch(inputStr)
-        if search:
-            matches.append(inputStr)
-        else:
-            nonMatches.append(inputStr)
+# egret_pool.EngineService classifying the user's test strings
+# (egret_match.classify), None to classify them in this process
+matcher = None
 
-    return (matches, nonMatches, None, warnings)
+# errors of a matcher call, reported instead of a classification
+# (egret_pool.EngineBusy is raised to the caller)
+MATCH_ERRORS = (egret_pool.EngineTimeout, egret_pool.WorkerCrashed, egret_pool.EngineError)
+
+# for each string whether the regex matches all of it; Python re may decide
+# strings the engine's matcher cannot, so on the matcher service a string
+# that backtracks too long raises egret_pool.EngineTimeout instead of
+# holding up the server
+def fullmatches(regexStr, strings):
+    if matcher is None:
+        return egret_match.classify(regexStr, strings, True,
+                                    compile_regex(regexStr).fullmatch)
+    return matcher.call((regexStr, strings, True))
 
 # Precondition: regexStr successfully compiles
 def run_test_string(regexStr, testStr):
-    regex = re.compile(regexStr)
-    if regex.fullmatch(testStr):
+    if fullmatches(regexStr, [testStr])[0]:
         return "ACCEPTED"
     else:
         return "REJECTED"
@@ -80,7 +94,7 @@ def get_group_info(regexStr, testStrings):
         return (None, None, None)
 
     # compile regex
-    regex = re.compile(regexStr)
+    regex = compile_regex(regexStr)
 
     # determine if there are named groups, numbered groups, or no groups
     match = regex.fullmatch(testStrings[0])
@@ -117,73 +131,138 @@ def get_group_info(regexStr, testStrings):
     groupHdr.insert(0, 'String')
     return (groupHdr, groupRows, len(groupHdr) - 1)
 
-def run_acre(regexStr):
+def run_acre(regexStr, result=None):
   try:
-    regex = re.compile(regexStr)
+    regex = compile_regex(regexStr)
   except re.error as e:
     errorMsg = "ERROR (compiler error): Regular expression did not compile: " + str(e)
     return (None, errorMsg)
         
-  alerts = egret_ext.run(regexStr, "evil", True, True, False, False)
-
-  first_line = alerts[0]
-  if first_line[0:5] == "ERROR":
-    return (None, first_line)
-
-  status = ""
-  for s in alerts:
-
-    lines = s.split("<br>")
-    prevLine = ""
-    for line in lines: 
-
-      suppressLine = False
-      example = False
-      anchorExample = False
-      if re.match("\.\.\.String with", line) != None:
-        example = True
-        anchorExample = True
-      if re.match("\.\.\.Example", line) != None:
-        example = True
-
-      if example:
-        suppressLine = True
-        first, second = line.split(':', 1)
-        exampleStr = second[1:]
-        success = re.fullmatch(regexStr, exampleStr) != None
-        if anchorExample:
-          if prevLine != "":
-            if prevSuccess and success: # both anchor examples successful
-              status += prevLine
-              status += '<br>'
-              status += line
-              status += '<br>'
-            prevLine = ""
-          else:  # prevLine == ""
-            prevLine = line
-            prevSuccess = success
-        else:  # example but not anchor example
-          prevLine = ""
-          if success:
-            suppressLine = False
-      else: # not example
-        prevLine = ""
-
-      if re.match("\.\.\.Suggested fix", line) != None:
-        first, second = line.split(':', 1)
-        fixStr = second[1:]
-
-        try:
-          r = re.compile(fixStr)
-        except re.error as e:
-          suppressLine = True
-
-      if not suppressLine:
-        status += line
-        status += '<br>'
+  if result is None:
+    result = egret_cache.cached_analyze(regexStr, "evil", True)
+  if result.error is not None:
+    return (None, result.error)
+  if len(result.alerts) == 0:
+    return (egret_alerts.NO_VIOLATIONS, None)
+
+  # only show examples the regex accepts and fixes that compile
+  lines = []
+  for alert in result.alerts:
+    lines.append(egret_alerts.header_line(alert))
+    anchorLines = egret_alerts.anchor_lines(alert)
+    if all(egret_alerts.accepts(regexStr, s) for label, s in alert.anchor_examples):
+      lines += anchorLines
+    if alert.locations:
+      lines.append(egret_alerts.regex_line(alert, regexStr, web=True))
+    if alert.suggestion is not None and egret_alerts.fix_error(alert.suggestion) is None:
+      lines.append(egret_alerts.suggestion_line(alert))
+    if alert.example is not None and egret_alerts.accepts(regexStr, alert.example):
+      lines.append(egret_alerts.example_line(alert))
+    if alert.attack is not None:
+      lines.append(egret_alerts.attack_line(alert))
+    lines.append("")
 
   # get rid of line breaks at end (eliminates extra space at the end)
-  while (status[-4:] == "<br>"):
-    status = status[0:-4]
+  while lines and lines[-1] == "":
+    lines.pop()
+
+  return ('<br>'.join(lines), None)
+
+class Analysis:
+    """
+    ACRE and EGRET output for a regex, computed with one engine pass and
+    shared by every session using the regex (see get_analysis).
+    @params:
+        regexStr      - Required  : regular expression (Str)
+        baseSubstring - Required  : base substring for the EGRET strings (Str)
+        errorMsg      - Optional  : error reported for both tools instead of
+                                    running the engine (Str)
+    """
 
-  return (status, None)
+    def __init__(self, regexStr, baseSubstring, errorMsg=None):
+        self.regexStr = regexStr
+        if errorMsg is not None:
+            self.acre = (None, errorMsg)
+            (self.matches, self.nonMatches, self.errorMsg, self.warnings) = ([], [], errorMsg, [])
+            self.engineStrings = set()
+            return
+        (acreResult, egretResult) = analyze_both(regexStr, baseSubstring)
+        self.acre = run_acre(regexStr, acreResult)
+        (self.matches, self.nonMatches, self.errorMsg, self.warnings) = \
+            run_egret(regexStr, baseSubstring, [], egretResult)
+        self.engineStrings = set(self.matches) | set(self.nonMatches)
+
+    # the methods matching strings raise MATCH_ERRORS (see fullmatches)
+    def accepts(self, testStr):
+        return fullmatches(self.regexStr, [testStr])[0]
+
+    # returns the sorted (matches, nonMatches) of the engine strings and testList
+    def classify(self, testList):
+        if self.errorMsg is not None:
+            return ([], [])
+        matches = list(self.matches)
+        nonMatches = list(self.nonMatches)
+        testStrs = sorted(set(testList) - self.engineStrings)
+        if testStrs:
+            for testStr, matched in zip(testStrs, fullmatches(self.regexStr, testStrs)):
+                bisect.insort(matches if matched else nonMatches, testStr)
+        return (matches, nonMatches)
+
+    # adds a string that is not an engine string to sorted matches or nonMatches
+    def insert(self, testStr, matches, nonMatches):
+        if self.errorMsg is None and testStr not in self.engineStrings:
+            bisect.insort(matches if self.accepts(testStr) else nonMatches, testStr)
+
+    # removes a string that is not an engine string from matches or nonMatches
+    # (without matching it again)
+    def remove(self, testStr, matches, nonMatches):
+        if self.errorMsg is None and testStr not in self.engineStrings:
+            for strs in (matches, nonMatches):
+                i = bisect.bisect_left(strs, testStr)
+                if i < len(strs) and strs[i] == testStr:
+                    del strs[i]
+                    return
+
+# JSON record of an analysis (the output of the bulk job API)
+def analysis_record(analysis):
+    (acreResult, acreError) = analysis.acre
+    return {'regex': analysis.regexStr,
+            'acre': {'result': acreResult, 'error': acreError},
+            'egret': {'matches': analysis.matches, 'nonMatches': analysis.nonMatches,
+                      'error': analysis.errorMsg, 'warnings': analysis.warnings or None}}
+
+# record of a regex, run by the bulk job workers
+def job_record(regexStr, baseSubstring):
+    return analysis_record(Analysis(regexStr, baseSubstring))
+
+# record of a regex that timed out or crashed a bulk job worker
+def job_error_record(regexStr, baseSubstring, message):
+    return analysis_record(Analysis(regexStr, baseSubstring, message))
+
+# egret_pool.EngineService running the analyses, None to run them in this process
+engine = None
+
+# analyzes a regex on the engine service; egret_pool.EngineTimeout,
+# WorkerCrashed and EngineBusy are raised to the caller, so get_analysis
+# never memoizes them
+def analyze(regexStr, baseSubstring):
+    if engine is None:
+        return Analysis(regexStr, baseSubstring)
+    try:
+        return engine.call((regexStr, baseSubstring))
+    except egret_pool.EngineError as e:
+        return Analysis(regexStr, baseSubstring, "ERROR (internal): " + str(e))
+
+# memo of the analyses of the most recently used regexes
+_analyses = functools.lru_cache(maxsize=MEMO_SIZE)(analyze)
+
+# the memoized analysis of a regex; a regex that timed out or crashed the
+# engine gets an analysis reporting the error, which is not memoized since
+# the deadline counts time spent waiting for a worker (a busy server should
+# not leave the error behind for every session), while egret_pool.EngineBusy
+# is raised to the caller
+def get_analysis(regexStr, baseSubstring):
+    try:
+        return _analyses(regexStr, baseSubstring)
+    except (egret_pool.EngineTimeout, egret_pool.WorkerCrashed) as e:
+        return Analysis(regexStr, baseSubstring, str(e))
@@ -0,0 +1,34 @@
+/*  Arena.cpp: Owner of the objects allocated during an engine run
+
+    Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+    elarson@seattleu.edu
+
+    This file is part of EGRET.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <vector>
+#include "Arena.h"
+using namespace std;
+
+void
+Arena::release()
+{
+  for (unsigned int i = objects.size(); i > 0; i--) {
+    objects[i - 1].second(objects[i - 1].first);
+  }
+  objects.clear();
+  objects.shrink_to_fit();
+}
@@ -0,0 +1,63 @@
+/*  Arena.h: Owner of the objects allocated during an engine run
+
+    Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+    elarson@seattleu.edu
+
+    This file is part of EGRET.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef ARENA_H
+#define ARENA_H
+
+#include <utility>
+#include <vector>
+using namespace std;
+
+// Arena: owns the parse nodes, character sets, edges, loops, strings and
+// backreferences of a run, which point at each other freely, and deletes
+// them all at once when the run ends
+class Arena
+{
+
+public:
+  Arena() {};
+  ~Arena() { release(); }
+
+  // takes ownership of obj and returns it
+  template <class T>
+  T *adopt(T *obj) {
+    objects.push_back(make_pair(static_cast<void *>(obj), &destroy<T>));
+    return obj;
+  }
+
+  // deletes every object owned, newest first
+  void release();
+
+  // number of objects owned
+  unsigned int size() { return objects.size(); }
+
+private:
+
+  Arena(const Arena &);                         // not copyable
+  Arena &operator=(const Arena &);
+
+  template <class T>
+  static void destroy(void *obj) { delete static_cast<T *>(obj); }
+
+  vector <pair <void *, void (*)(void *)> > objects;   // (object, deleter) pairs
+};
+
+#endif // ARENA_H
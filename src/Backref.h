@@ -45,6 +45,8 @@ public:
 
   // getters
   Location get_group_loc() { return group_loc; }
+  string get_group_name() { return group_name; }
+  int get_group_number() { return group_number; }
   string get_substring() { return substring; }
 
   // generate minimum iteration string
@@ -36,6 +36,33 @@ void
 CharSet::add_item(CharSetItem item)
 {
   items.push_back(item);
+  members = NULL;
+}
+
+CharSetMembers *
+CharSet::get_members()
+{
+  if (members != NULL) return members;
+
+  // sets with the same items (in the same order) match the same characters
+  // and have the same test characters
+  string key(1, complement ? '^' : '[');
+  vector <CharSetItem>::iterator it;
+  for (it = items.begin(); it != items.end(); it++) {
+    key += (char) it->type;
+    key += it->type == CHAR_RANGE_ITEM ? it->range_start : it->character;
+    key += it->type == CHAR_RANGE_ITEM ? it->range_end : '\0';
+  }
+
+  members = Util::get()->find_members(key);
+  if (members == NULL) {
+    members = Util::get()->own(new CharSetMembers());
+    for (int i = 0; i < 256; i++) {
+      members->chars[i] = matches_items((char) i);
+    }
+    Util::get()->add_members(key, members);
+  }
+  return members;
 }
 
 // PROPERTY FUNCTIONS
@@ -192,6 +219,12 @@ CharSet::only_has_punc(bool allow_spaces)
 
 bool
 CharSet::is_valid_character(char character)
+{
+  return get_members()->chars[(unsigned char) character];
+}
+
+bool
+CharSet::matches_items(char character, bool exact)
 {
   vector <CharSetItem>::iterator it;
   for (it = items.begin(); it != items.end(); it++) {
@@ -211,7 +244,7 @@ CharSet::is_valid_character(char character)
 	    if (character >= '0' && character <= '9') return !complement; 
 	    break;
 	  case 's':
-	    if (character == ' ') return !complement;
+	    if (exact ? is_python_space(character) : character == ' ') return !complement;
 	    break;
 	  case 'W':
 	  {
@@ -227,10 +260,11 @@ CharSet::is_valid_character(char character)
 	    if (!(character >= '0' && character <= '9')) return !complement; 
 	    break;
 	  case 'S':
-	    if (character != ' ') return !complement;
+	    if (exact ? !is_python_space(character) : character != ' ') return !complement;
 	    break;
 	  case '.':		
-            return !complement;
+            if (!exact || character != '\n') return !complement;
+            break;
 	  default:
 	  {
 	    stringstream s;
@@ -401,6 +435,92 @@ CharSet::get_valid_character(char except)
   throw EgretException("ERROR (internal): Could not valid character in char set");
 }
 
+// SET FUNCTIONS
+
+// A set is written as the sorted ranges of the characters it matches, so
+// [0-9], [\d] and \d or [a-zA-Z] and [A-Za-z] share a form, and a set of
+// one character as that character.  The members of \s, \S and . are only
+// approximated (\s is a space), so sets using them are written as their
+// sorted items instead.
+bitset <256>
+CharSet::get_exact_chars()
+{
+  bitset <256> chars;
+  for (int i = 0; i < 256; i++) {
+    chars[i] = matches_items((char) i, true);
+  }
+  return chars;
+}
+
+// ASCII whitespace as matched by \s in Python
+bool
+CharSet::is_python_space(char character)
+{
+  return character == ' ' || (character >= '\t' && character <= '\r') ||
+    (character >= '\x1c' && character <= '\x1f');
+}
+
+string
+CharSet::get_canonical_form()
+{
+  vector <CharSetItem>::iterator it;
+  set <string> sorted_items;
+  bool approximate = false;
+  for (it = items.begin(); it != items.end(); it++) {
+    switch (it->type) {
+    case CHARACTER_ITEM:
+      sorted_items.insert(canonical_char(it->character));
+      break;
+    case CHAR_CLASS_ITEM:
+      sorted_items.insert("\\" + string(1, it->character));
+      if (it->character == 's' || it->character == 'S' || it->character == '.')
+        approximate = true;
+      break;
+    case CHAR_RANGE_ITEM:
+      sorted_items.insert(canonical_char(it->range_start) + "-" + canonical_char(it->range_end));
+      break;
+    }
+  }
+
+  if (approximate) {
+    string form = complement ? "[^" : "[";
+    set <string>::iterator item_it;
+    for (item_it = sorted_items.begin(); item_it != sorted_items.end(); item_it++) {
+      form += *item_it;
+    }
+    return form + "]";
+  }
+
+  const bitset <256> &chars = get_members()->chars;
+  string form = "[";
+  for (int i = 0; i < 256; i++) {
+    if (!chars[i]) continue;
+    int j = i;
+    while (j < 255 && chars[j + 1]) j++;
+    if (i == j && chars.count() == 1)
+      return canonical_char((char) i);
+    form += canonical_char((char) i);
+    if (j > i)
+      form += "-" + canonical_char((char) j);
+    i = j;
+  }
+  return form + "]";
+}
+
+bool
+CharSet::has_same_chars(CharSet *other)
+{
+  CharSetMembers *m1 = get_members();
+  CharSetMembers *m2 = other->get_members();
+  return m1 == m2 || m1->chars == m2->chars;
+}
+
+bool
+CharSet::overlaps(CharSet *other)
+{
+  return (get_members()->chars & other->get_members()->chars).any();
+}
+
 // CHECKER FUNCTIONS
 
 void
@@ -964,7 +1084,7 @@ CharSet::replace_charset_with_parens(Location loc)
 vector <string>
 CharSet::gen_evil_strings(string test_string, const set <char> &punct_marks)
 {
-  set <char> test_chars  = create_test_chars(punct_marks);
+  const set <char> &test_chars = get_test_chars(punct_marks);
   string suffix = test_string.substr(prefix.size() + 1);
   vector <string> evil_strings;
 
@@ -978,6 +1098,18 @@ CharSet::gen_evil_strings(string test_string, const set <char> &punct_marks)
   return evil_strings;
 }
 
+const set <char> &
+CharSet::get_test_chars(const set <char> &punct_marks)
+{
+  CharSetMembers *m = get_members();
+  if (!m->has_test_chars || m->punct_marks != punct_marks) {
+    m->test_chars = create_test_chars(punct_marks);
+    m->punct_marks = punct_marks;
+    m->has_test_chars = true;
+  }
+  return m->test_chars;
+}
+
 set <char>
 CharSet::create_test_chars(const set<char> &punct_marks)
 {
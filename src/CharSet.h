@@ -22,6 +22,7 @@
 #ifndef CHARSET_H
 #define CHARSET_H
 
+#include <bitset>
 #include <set>
 #include <string>
 #include <vector>
@@ -45,15 +46,27 @@ struct CharSetItem
   char range_end;	// for CHAR_RANGE_ITEM
 };
 
+// CharSetMembers: the characters matched by a character set, shared by all
+// sets of a run with the same items (see Util::find_members)
+struct CharSetMembers
+{
+  bitset <256> chars;		// indexed by (unsigned char) character
+  bool has_test_chars;		// true once test_chars has been created
+  set <char> punct_marks;	// punctuation marks test_chars was created for
+  set <char> test_chars;	// test characters for test generation
+
+  CharSetMembers() { has_test_chars = false; }
+};
+
 class CharSet {
 
 public:
 
-  CharSet() { complement = false; checked = false; }
+  CharSet() { complement = false; checked = false; members = NULL; }
 
   // setters
   void set_prefix(string p) { prefix = p; }
-  void set_complement(bool c) { complement = c; }
+  void set_complement(bool c) { complement = c; members = NULL; }
 
   // getters
   bool is_complement() { return complement; }
@@ -92,6 +105,21 @@ public:
   // gets a single valid character
   char get_valid_character(char except = '\0');
 
+  // SET FUNCTIONS
+
+  // returns the set in canonical form (see ParseTree::canonical_form)
+  string get_canonical_form();
+
+  // returns the characters matched by the set as Python matches them (the
+  // members of \s, \S and . are otherwise approximated)
+  bitset <256> get_exact_chars();
+
+  // returns true if both sets match the same characters
+  bool has_same_chars(CharSet *other);
+
+  // returns true if some character is matched by both sets
+  bool overlaps(CharSet *other);
+
   // CHECKER FUNCTIONS
 
   // checks the character set, emits warnings if necessary
@@ -120,6 +148,12 @@ private:
   bool complement;		// true if set is complemented
   string prefix;		// path string up to visiting this node
   bool checked;			// true of charset has been checked
+  CharSetMembers *members;	// characters matched (NULL until first needed)
+
+  // returns the members of the set, interning them on first use
+  CharSetMembers *get_members();
+  bool matches_items(char character, bool exact = false);
+  bool is_python_space(char character);
 
   // checker functions
   bool only_has_punc(bool allow_spaces = false);
@@ -133,7 +167,8 @@ private:
   void replace(string &str, string from, string to);
   string replace_charset_with_parens(Location loc);
   
-  // creates a set of test characters
+  // creates a set of test characters (cached with the members)
+  const set <char> &get_test_chars(const set <char> &punct_marks);
   set <char> create_test_chars(const set <char> &punct_marks);
 };
 
@@ -40,6 +40,7 @@ Checker::check()
   check_wild_punctuation();
   check_repeat_punctuation();
   check_digit_too_optional();
+  check_redos();
 }
 
 // CHECKER FUNCTIONS
@@ -52,9 +53,6 @@ Checker::check_anchor_usage()
   bool warn_caret_start = false;
   bool warn_dollar_end = false;
   
-  // get end of line marker
-  string eol = Util::get()->is_web_mode() ? "<br>" : "\n";
-
   bool is_first_string = true;
   string first_string;
   vector <Path>::iterator path_iter;
@@ -77,22 +75,18 @@ Checker::check_anchor_usage()
       if (all_start_with_caret && !start_with_caret) {
 	string curr_string = path_iter->get_test_string();
 
-        stringstream s;
-        s << "Some but not all strings start with a ^ anchor" << eol;
-        s << "...String with ^ anchor: " << first_string << eol;
-        s << "...String with no ^ anchor: " << curr_string;
-        Alert a("anchor usage", s.str(), fix_anchors());
+        Alert a("anchor usage", "Some but not all strings start with a ^ anchor", fix_anchors());
+        a.anchor_examples.push_back(make_pair("String with ^ anchor", first_string));
+        a.anchor_examples.push_back(make_pair("String with no ^ anchor", curr_string));
         Util::get()->add_alert(a);
         warn_caret_start = true;
       }
       if (!all_start_with_caret && start_with_caret) {
 	string curr_string = path_iter->get_test_string();
 
-        stringstream s;
-        s << "Some but not all strings start with a ^ anchor" << eol;
-        s << "...String with ^ anchor: " << curr_string << eol;
-        s << "...String with no ^ anchor: " << first_string;
-        Alert a("anchor usage", s.str(), fix_anchors());
+        Alert a("anchor usage", "Some but not all strings start with a ^ anchor", fix_anchors());
+        a.anchor_examples.push_back(make_pair("String with ^ anchor", curr_string));
+        a.anchor_examples.push_back(make_pair("String with no ^ anchor", first_string));
         Util::get()->add_alert(a);
         warn_caret_start = true;
       }
@@ -101,22 +95,18 @@ Checker::check_anchor_usage()
       if (all_end_with_dollar && !end_with_dollar) {
 	string curr_string = path_iter->get_test_string();
 
-        stringstream s;
-        s << "Some but not all strings end with a $ anchor" << eol;
-        s << "...String with $ anchor: " << first_string << eol;
-        s << "...String with no $ anchor: " << curr_string;
-        Alert a("anchor usage", s.str(), fix_anchors());
+        Alert a("anchor usage", "Some but not all strings end with a $ anchor", fix_anchors());
+        a.anchor_examples.push_back(make_pair("String with $ anchor", first_string));
+        a.anchor_examples.push_back(make_pair("String with no $ anchor", curr_string));
         Util::get()->add_alert(a);
         warn_dollar_end = true;
       }
       if (!all_end_with_dollar && end_with_dollar) {
 	string curr_string = path_iter->get_test_string();
 
-        stringstream s;
-        s << "Some but not all strings end with a $ anchor" << eol;
-        s << "...String with $ anchor: " << curr_string << eol;
-        s << "...String with no $ anchor: " << first_string;
-        Alert a("anchor usage", s.str(), fix_anchors());
+        Alert a("anchor usage", "Some but not all strings end with a $ anchor", fix_anchors());
+        a.anchor_examples.push_back(make_pair("String with $ anchor", curr_string));
+        a.anchor_examples.push_back(make_pair("String with no $ anchor", first_string));
         Util::get()->add_alert(a);
         warn_dollar_end = true;
       }
@@ -197,3 +187,566 @@ Checker::fix_anchors()
 
   return new_regex;
 }
+
+// REDOS FUNCTIONS
+//
+// A backtracking matcher rejects a string only after trying every way the
+// string can be split among the iterations of the loops.  A loop whose body
+// can match the same string in two ways (a nested loop, adjacent loops or an
+// alternation with overlapping options, found by searching the loop's
+// automaton - see Matcher) has exponentially many splits, two adjacent loops
+// that match the same characters have polynomially many.  The splits are only
+// tried when something after the loops fails to match, so a loop followed by
+// nothing that can fail is at most a warning.  The attack string is a prefix
+// leading to the loop, the ambiguous string pumped many times and a character
+// that makes the match fail; it is only given if the matcher rejects it.
+
+// returns the first character of chars, preferring letters and digits
+static char
+pick_char(const bitset <256> &chars)
+{
+  string preferred = "abcdefghijklmnopqrstuvwxyz0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ";
+  for (unsigned int i = 0; i < preferred.size(); i++) {
+    if (chars[(unsigned char) preferred[i]]) return preferred[i];
+  }
+  for (int c = ' '; c <= '~'; c++) {
+    if (chars[c]) return (char) c;
+  }
+  for (int c = 0; c < 256; c++) {
+    if (chars[c]) return (char) c;
+  }
+  return '\0';
+}
+
+// returns node without the groups around it
+static ParseNode *
+skip_groups(ParseNode *node)
+{
+  while (node->type == GROUP_NODE && node->left != NULL) node = node->left;
+  return node;
+}
+
+// appends the elements of a concatenation (concatenations nest to the right)
+static void
+concat_items(ParseNode *node, vector <ParseNode *> &items)
+{
+  while (node->type == CONCAT_NODE) {
+    items.push_back(node->left);
+    node = node->right;
+  }
+  items.push_back(node);
+}
+
+void
+Checker::check_redos()
+{
+  check_redos_tree(root, false, false);
+}
+
+void
+Checker::check_redos_tree(ParseNode *node, bool can_fail_after, bool in_loop)
+{
+  if (node == NULL) return;
+
+  if (node->type == CONCAT_NODE) {
+    // check the whole sequence at once, an element is followed by the
+    // elements after it and by what follows the sequence
+    vector <ParseNode *> items;
+    concat_items(node, items);
+    vector <bool> fail_after(items.size());
+    bool fails = can_fail_after;
+    for (int i = items.size() - 1; i >= 0; i--) {
+      fail_after[i] = fails;
+      fails = fails || can_fail(items[i]);
+    }
+
+    // adjacent loops in the body of a loop are reported with that loop
+    if (!in_loop) check_adjacent_loops(items, fail_after);
+    for (unsigned int i = 0; i < items.size(); i++) {
+      check_redos_tree(items[i], fail_after[i], in_loop);
+    }
+    return;
+  }
+
+  if (node->type == REPEAT_NODE && node->repeat_upper == -1) {
+    check_nested_loop(node, can_fail_after);
+    check_redos_tree(node->left, can_fail_after, true);
+    return;
+  }
+  if (node->type == REPEAT_NODE && node->repeat_lower > 1) {
+    check_redos_tree(node->left, can_fail_after || can_fail(node->left), in_loop);
+    return;
+  }
+  check_redos_tree(node->left, can_fail_after, in_loop);
+  check_redos_tree(node->right, can_fail_after, in_loop);
+}
+
+void
+Checker::check_nested_loop(ParseNode *loop, bool can_fail_after)
+{
+  ParseNode *body = loop->left;
+
+  // without anything after the loop that can fail, only a full match of the
+  // regex would backtrack into the loop, so check mode leaves it out
+  bool warning = !can_fail_after;
+
+  // loop{loop}: the iterations of the inner loop can be split among the outer ones
+  ParseNode *inner = find_inner_loop(body);
+  if (inner != NULL) {
+    string pump = sample_string(inner->left, true);
+    if (!pump.empty()) {
+      add_redos_alert("nested quantifier",
+          "Nested quantifiers can backtrack exponentially on strings they reject",
+          loop, inner, attack_string(loop, pump, EXP_ATTACK_REPEATS), warning);
+      return;
+    }
+  }
+
+  // (a+a+)+, (\s*,\s*)+ or (a|aa)*: the iterations can match the same
+  // string in two ways
+  ParseNode *overlapping = find_overlapping_loops(body);
+  if (overlapping == NULL) overlapping = find_wrapped_loops(body);
+  ParseNode *alternation = find_ambiguous_alternation(body);
+  vector <bitset <256> > sets;
+  Matcher loop_matcher;
+  int ambiguous = loop_matcher.find_ambiguity(loop, sets);
+  string pump;
+  if (ambiguous == 1) {
+    for (unsigned int i = 0; i < sets.size(); i++) {
+      pump += pick_char(sets[i]);
+    }
+  }
+  else if (ambiguous == -1 && overlapping != NULL) {
+    // the automaton cannot be searched, but adjacent overlapping loops always
+    // make the body ambiguous
+    pump = sample_string(body, true);
+  }
+  else if (ambiguous == -1 && alternation != NULL) {
+    // ... nor can alternation options that match the same character
+    bitset <256> common = single_chars(alternation->left) & single_chars(alternation->right);
+    if (common.any()) pump = witness_string(body, alternation, string(1, pick_char(common)));
+  }
+  if (pump.empty()) return;
+
+  // without overlapping loops or options the ambiguity comes from a
+  // quantifier in the body such as a? or a{2,4}
+  string attack = attack_string(loop, pump, EXP_ATTACK_REPEATS);
+  if (overlapping != NULL) {
+    add_redos_alert("overlapping adjacent quantifiers",
+        "Repeated quantifiers in sequence matching the same characters can backtrack exponentially on strings they reject",
+        loop, overlapping, attack, warning);
+  }
+  else if (alternation != NULL) {
+    add_redos_alert("ambiguous alternation",
+        "Repeated alternation with overlapping options can backtrack exponentially on strings it rejects",
+        loop, alternation, attack, warning);
+  }
+  else {
+    add_redos_alert("nested quantifier",
+        "Nested quantifiers can backtrack exponentially on strings they reject",
+        loop, loop, attack, warning);
+  }
+}
+
+void
+Checker::check_adjacent_loops(const vector <ParseNode *> &items, const vector <bool> &fail_after)
+{
+  for (unsigned int i = 0; i < items.size(); i++) {
+    int j = overlapping_loop(items, i);
+    if (j == -1) continue;
+
+    // the loops only backtrack when something after them rejects the pumped
+    // character (or the end of the string), so the alert needs an attack
+    // string that is rejected.  The backtracking is polynomial, which
+    // bounded inputs keep cheap, so it is a warning that check mode leaves out
+    ParseNode *first = skip_groups(items[i]);
+    ParseNode *second = skip_groups(items[j]);
+    if (!fail_after[j]) continue;
+    bitset <256> common = single_chars(first->left) & single_chars(second->left);
+    string attack = attack_string(first, string(1, pick_char(common)), POLY_ATTACK_REPEATS);
+    if (attack.empty()) continue;
+    add_redos_alert("overlapping adjacent quantifiers",
+        "Adjacent quantifiers matching the same characters can backtrack polynomially on strings they reject",
+        first, second, attack, true);
+  }
+}
+
+int
+Checker::overlapping_loop(const vector <ParseNode *> &items, unsigned int i)
+{
+  ParseNode *first = skip_groups(items[i]);
+  if (first->type != REPEAT_NODE || first->repeat_upper != -1) return -1;
+
+  // the loops may be separated by elements that can be skipped
+  for (unsigned int j = i + 1; j < items.size(); j++) {
+    ParseNode *second = skip_groups(items[j]);
+    if (second->type == REPEAT_NODE && second->repeat_upper == -1 &&
+        (single_chars(first->left) & single_chars(second->left)).any()) {
+      return j;
+    }
+    if (!is_nullable(items[j])) return -1;
+  }
+  return -1;
+}
+
+bool
+Checker::can_fail(ParseNode *node)
+{
+  node = skip_groups(node);
+  return node->type == DOLLAR_NODE || !is_nullable(node);
+}
+
+ParseNode *
+Checker::find_inner_loop(ParseNode *node)
+{
+  if (node == NULL) return NULL;
+
+  switch (node->type) {
+  case REPEAT_NODE:
+    if (node->repeat_upper == -1) return node;
+    if (node->repeat_upper == 0) return NULL;
+    return find_inner_loop(node->left);
+  case GROUP_NODE:
+    return find_inner_loop(node->left);
+  case ALTERNATION_NODE: {
+    ParseNode *inner = find_inner_loop(node->left);
+    if (inner != NULL) return inner;
+    return find_inner_loop(node->right);
+  }
+  case CONCAT_NODE: {
+    ParseNode *inner = NULL;
+    if (is_nullable(node->right)) inner = find_inner_loop(node->left);
+    if (inner == NULL && is_nullable(node->left)) inner = find_inner_loop(node->right);
+    return inner;
+  }
+  default:
+    return NULL;
+  }
+}
+
+ParseNode *
+Checker::find_overlapping_loops(ParseNode *node)
+{
+  if (node == NULL) return NULL;
+
+  // loops inside an unbounded loop are checked with that loop
+  if (node->type == REPEAT_NODE && node->repeat_upper == -1) return NULL;
+  if (node->type == BACKREFERENCE_NODE) return NULL;
+  if (node->type == CONCAT_NODE) {
+    vector <ParseNode *> items;
+    concat_items(node, items);
+    for (unsigned int i = 0; i < items.size(); i++) {
+      int j = overlapping_loop(items, i);
+      if (j != -1) return skip_groups(items[j]);
+    }
+    for (unsigned int i = 0; i < items.size(); i++) {
+      ParseNode *second = find_overlapping_loops(items[i]);
+      if (second != NULL) return second;
+    }
+    return NULL;
+  }
+
+  ParseNode *second = find_overlapping_loops(node->left);
+  if (second != NULL) return second;
+  return find_overlapping_loops(node->right);
+}
+
+ParseNode *
+Checker::find_wrapped_loops(ParseNode *body)
+{
+  vector <ParseNode *> items;
+  concat_items(skip_groups(body), items);
+
+  // the first loop may only be preceded, and the last one followed, by
+  // elements that can be skipped
+  int first = -1;
+  for (unsigned int i = 0; i < items.size() && first == -1; i++) {
+    ParseNode *item = skip_groups(items[i]);
+    if (item->type == REPEAT_NODE && item->repeat_upper == -1) first = i;
+    else if (!is_nullable(items[i])) return NULL;
+  }
+  int last = -1;
+  for (int i = items.size() - 1; i >= 0 && last == -1; i--) {
+    ParseNode *item = skip_groups(items[i]);
+    if (item->type == REPEAT_NODE && item->repeat_upper == -1) last = i;
+    else if (!is_nullable(items[i])) return NULL;
+  }
+  if (first == -1 || first == last) return NULL;
+
+  ParseNode *start = skip_groups(items[first]);
+  ParseNode *end = skip_groups(items[last]);
+  if ((single_chars(start->left) & single_chars(end->left)).none()) return NULL;
+  return start;
+}
+
+ParseNode *
+Checker::find_ambiguous_alternation(ParseNode *node)
+{
+  if (node == NULL) return NULL;
+
+  // alternations inside an unbounded loop are checked with that loop
+  if (node->type == REPEAT_NODE && node->repeat_upper == -1) return NULL;
+  if (node->type == BACKREFERENCE_NODE) return NULL;
+  if (node->type == ALTERNATION_NODE &&
+      (first_chars(node->left) & first_chars(node->right)).any()) {
+    return node;
+  }
+
+  ParseNode *alternation = find_ambiguous_alternation(node->left);
+  if (alternation != NULL) return alternation;
+  return find_ambiguous_alternation(node->right);
+}
+
+bool
+Checker::is_nullable(ParseNode *node)
+{
+  if (node == NULL) return true;
+
+  map <ParseNode *, bool>::iterator it = nullable_nodes.find(node);
+  if (it != nullable_nodes.end()) return it->second;
+
+  bool nullable;
+  switch (node->type) {
+  case CHARACTER_NODE:
+  case CHAR_SET_NODE:
+    nullable = false;
+    break;
+  case ALTERNATION_NODE:
+    nullable = is_nullable(node->left) || is_nullable(node->right);
+    break;
+  case CONCAT_NODE:
+    nullable = is_nullable(node->left) && is_nullable(node->right);
+    break;
+  case REPEAT_NODE:
+    nullable = node->repeat_lower == 0 || is_nullable(node->left);
+    break;
+  case GROUP_NODE:
+    nullable = is_nullable(node->left);
+    break;
+  default:        // anchors, ignored elements and backreferences
+    nullable = true;
+    break;
+  }
+
+  nullable_nodes[node] = nullable;
+  return nullable;
+}
+
+bitset <256>
+Checker::single_chars(ParseNode *node)
+{
+  bitset <256> chars;
+  if (node == NULL) return chars;
+
+  map <ParseNode *, bitset <256> >::iterator it = single_char_nodes.find(node);
+  if (it != single_char_nodes.end()) return it->second;
+
+  switch (node->type) {
+  case CHARACTER_NODE:
+    chars[(unsigned char) node->character] = true;
+    break;
+  case CHAR_SET_NODE:
+    chars = node->char_set->get_exact_chars();
+    break;
+  case ALTERNATION_NODE:
+    chars = single_chars(node->left) | single_chars(node->right);
+    break;
+  case CONCAT_NODE:
+    if (is_nullable(node->right)) chars |= single_chars(node->left);
+    if (is_nullable(node->left)) chars |= single_chars(node->right);
+    break;
+  case REPEAT_NODE:
+    if (node->repeat_upper != 0 && (node->repeat_lower <= 1 || is_nullable(node->left)))
+      chars = single_chars(node->left);
+    break;
+  case GROUP_NODE:
+    chars = single_chars(node->left);
+    break;
+  default:
+    break;
+  }
+
+  single_char_nodes[node] = chars;
+  return chars;
+}
+
+bitset <256>
+Checker::first_chars(ParseNode *node)
+{
+  bitset <256> chars;
+  if (node == NULL) return chars;
+
+  switch (node->type) {
+  case CHARACTER_NODE:
+    chars[(unsigned char) node->character] = true;
+    break;
+  case CHAR_SET_NODE:
+    chars = node->char_set->get_exact_chars();
+    break;
+  case ALTERNATION_NODE:
+    chars = first_chars(node->left) | first_chars(node->right);
+    break;
+  case CONCAT_NODE:
+    chars = first_chars(node->left);
+    if (is_nullable(node->left)) chars |= first_chars(node->right);
+    break;
+  case REPEAT_NODE:
+    if (node->repeat_upper != 0) chars = first_chars(node->left);
+    break;
+  case GROUP_NODE:
+    chars = first_chars(node->left);
+    break;
+  default:
+    break;
+  }
+  return chars;
+}
+
+bitset <256>
+Checker::all_chars(ParseNode *node)
+{
+  bitset <256> chars;
+  if (node == NULL) return chars;
+
+  if (node->type == CHARACTER_NODE)
+    chars[(unsigned char) node->character] = true;
+  else if (node->type == CHAR_SET_NODE)
+    chars = node->char_set->get_exact_chars();
+  else if (node->type != BACKREFERENCE_NODE)
+    chars = all_chars(node->left) | all_chars(node->right);
+  return chars;
+}
+
+bool
+Checker::contains(ParseNode *node, ParseNode *target)
+{
+  if (node == NULL) return false;
+  if (node == target) return true;
+  if (node->type == BACKREFERENCE_NODE) return false;
+  return contains(node->left, target) || contains(node->right, target);
+}
+
+string
+Checker::sample_string(ParseNode *node, bool one_iteration)
+{
+  if (node == NULL) return "";
+
+  switch (node->type) {
+  case CHARACTER_NODE:
+    return string(1, node->character);
+  case CHAR_SET_NODE:
+    return string(1, pick_char(node->char_set->get_exact_chars()));
+  case ALTERNATION_NODE: {
+    // the shorter option (the non-empty one for one iteration)
+    string left = sample_string(node->left, one_iteration);
+    string right = sample_string(node->right, one_iteration);
+    if (one_iteration && (left.empty() || right.empty())) return left + right;
+    return right.size() < left.size() ? right : left;
+  }
+  case CONCAT_NODE:
+    return sample_string(node->left, one_iteration) + sample_string(node->right, one_iteration);
+  case REPEAT_NODE: {
+    int iterations = node->repeat_lower;
+    if (one_iteration && iterations == 0 && node->repeat_upper != 0) iterations = 1;
+    string body = sample_string(node->left, one_iteration);
+    string s;
+    for (int i = 0; i < iterations && s.size() <= MAX_ATTACK_LENGTH; i++) {
+      s += body;
+    }
+    return s;
+  }
+  case GROUP_NODE:
+    return sample_string(node->left, one_iteration);
+  default:
+    return "";
+  }
+}
+
+string
+Checker::witness_string(ParseNode *node, ParseNode *target, string s)
+{
+  if (node == target) return s;
+  if (!contains(node, target)) return sample_string(node);
+
+  switch (node->type) {
+  case ALTERNATION_NODE:
+    if (contains(node->left, target)) return witness_string(node->left, target, s);
+    return witness_string(node->right, target, s);
+  case CONCAT_NODE:
+    return witness_string(node->left, target, s) + witness_string(node->right, target, s);
+  case REPEAT_NODE: {
+    string witness = witness_string(node->left, target, s);
+    string body = sample_string(node->left);
+    for (int i = 1; i < node->repeat_lower && witness.size() <= MAX_ATTACK_LENGTH; i++) {
+      witness += body;
+    }
+    return witness;
+  }
+  default:
+    return witness_string(node->left, target, s);
+  }
+}
+
+bool
+Checker::find_prefix(ParseNode *node, ParseNode *target, string &prefix)
+{
+  if (node == target) return true;
+  if (!contains(node, target)) return false;
+
+  switch (node->type) {
+  case ALTERNATION_NODE:
+    if (contains(node->left, target)) return find_prefix(node->left, target, prefix);
+    return find_prefix(node->right, target, prefix);
+  case CONCAT_NODE:
+    if (contains(node->left, target)) return find_prefix(node->left, target, prefix);
+    prefix += sample_string(node->left);
+    return find_prefix(node->right, target, prefix);
+  default:
+    return find_prefix(node->left, target, prefix);
+  }
+}
+
+string
+Checker::attack_string(ParseNode *loop, string pump, int repeats)
+{
+  // prefix and pumped string
+  string pumped;
+  find_prefix(root, loop, pumped);
+  for (int i = 0; i < repeats && pumped.size() <= MAX_ATTACK_LENGTH; i++) {
+    pumped += pump;
+  }
+
+  // a character no part of the regex matches, else one that commonly ends a
+  // match (only tried when the matcher can tell whether the string is rejected)
+  bitset <256> unused = all_chars(root);
+  unused.flip();
+  string fail_chars = FAIL_CHARS;
+  if (unused.any()) fail_chars.insert(fail_chars.begin(), pick_char(unused));
+
+  if (matcher_built == -1) matcher_built = matcher.build(root) ? 1 : 0;
+  for (unsigned int i = 0; i < fail_chars.size(); i++) {
+    string attack = pumped + fail_chars[i];
+    if (attack.size() > MAX_ATTACK_LENGTH) return "";
+    if (matcher_built == 1) {
+      if (matcher.matches(attack, false) == 0) return attack;
+    }
+    else {
+      // without such a character the string may well be accepted
+      return unused.any() ? attack : "";
+    }
+  }
+  return "";
+}
+
+void
+Checker::add_redos_alert(string type, string message, ParseNode *loop,
+                         ParseNode *culprit, string attack, bool warning)
+{
+  Alert a(type, message, loop->loc, culprit->loc);
+  a.warning = warning || !Util::get()->is_check_mode();
+  if (!attack.empty()) {
+    a.has_attack = true;
+    a.attack = attack;
+  }
+  Util::get()->add_alert(a);
+}
@@ -22,29 +22,51 @@
 #ifndef CHECKER_H
 #define CHECKER_H
 
+#include <bitset>
+#include <map>
 #include <set>
 #include <string>
 #include <vector>
+#include "Matcher.h"
+#include "ParseTree.h"
 #include "Scanner.h"
 #include "Path.h"
 using namespace std;
 
+#define EXP_ATTACK_REPEATS 25           // pumps in an exponential attack string
+#define POLY_ATTACK_REPEATS 1000        // pumps in a polynomial attack string
+#define MAX_ATTACK_LENGTH 5000          // longer attack strings are not reported
+#define FAIL_CHARS "\n!"                // characters tried to end an attack string
+
 class Checker {
 
 public:
 
-  Checker(vector <Path> p, vector <Token> t) {
+  Checker(vector <Path> p, vector <Token> t, ParseNode *r) {
     paths = p;
     tokens = t;
+    root = r;
+    matcher_built = -1;
   }
 
   // checker entry point
   void check();
 
+  // checks for loops that a backtracking matcher (such as Python's re) can
+  // take exponential or polynomial time on - only needs the parse tree, so
+  // it also runs in test generation mode, where it reports warnings
+  void check_redos();
+
 private:
 
   vector <Path> paths;		// list of paths
   vector <Token> tokens;        // set of tokens - used for generated fixes
+  ParseNode *root;              // root of parse tree - used for redos checks
+
+  map <ParseNode *, bool> nullable_nodes;               // memo for is_nullable
+  map <ParseNode *, bitset <256> > single_char_nodes;   // memo for single_chars
+  Matcher matcher;              // matcher of the whole regex - used for attack strings
+  int matcher_built;            // 1 if built, 0 if it cannot be, -1 if not tried yet
 
   // CHECKER FUNCTIONS
 
@@ -71,6 +93,73 @@ private:
 
   // fix anchors
   string fix_anchors();
+
+  // REDOS FUNCTIONS
+
+  // checks the loops in the subtree of node (can_fail_after is true if
+  // something after node can fail to match, in_loop if node is in the body
+  // of an unbounded loop)
+  void check_redos_tree(ParseNode *node, bool can_fail_after, bool in_loop);
+
+  // checks an unbounded loop for nested loops and ambiguous alternations
+  void check_nested_loop(ParseNode *loop, bool can_fail_after);
+
+  // checks a concatenation for adjacent loops matching the same characters
+  void check_adjacent_loops(const vector <ParseNode *> &items, const vector <bool> &fail_after);
+
+  // returns the index of a loop after items[i] matching the same characters
+  // with only elements that can be skipped in between (-1 if none)
+  int overlapping_loop(const vector <ParseNode *> &items, unsigned int i);
+
+  // returns true if node can fail to match (it is not nullable or it is $)
+  bool can_fail(ParseNode *node);
+
+  // returns an unbounded loop whose iterations node can match on their own
+  ParseNode *find_inner_loop(ParseNode *node);
+
+  // returns the second of two adjacent loops in node matching the same characters
+  ParseNode *find_overlapping_loops(ParseNode *node);
+
+  // returns the first loop of the body of a loop if it matches the same
+  // characters as the last one, which it follows in the next iteration
+  // (as in (\s*,\s*)+), NULL if not
+  ParseNode *find_wrapped_loops(ParseNode *body);
+
+  // returns an alternation in node whose options can start with the same character
+  ParseNode *find_ambiguous_alternation(ParseNode *node);
+
+  // returns true if node matches the empty string
+  bool is_nullable(ParseNode *node);
+
+  // returns the characters c such that node matches the string c
+  bitset <256> single_chars(ParseNode *node);
+
+  // returns the characters a non-empty match of node can start with
+  bitset <256> first_chars(ParseNode *node);
+
+  // returns every character node can match
+  bitset <256> all_chars(ParseNode *node);
+
+  // returns true if target is in the subtree of node
+  bool contains(ParseNode *node, ParseNode *target);
+
+  // returns a short string matched by node (with one_iteration, loops that
+  // can be skipped are taken once)
+  string sample_string(ParseNode *node, bool one_iteration = false);
+
+  // returns a string matched by node where target matches s
+  string witness_string(ParseNode *node, ParseNode *target, string s);
+
+  // appends to prefix a string matched by the part of node before target
+  bool find_prefix(ParseNode *node, ParseNode *target, string &prefix);
+
+  // returns the prefix leading to loop, pump repeated and a character that
+  // makes the match fail - empty if no such string is known to be rejected
+  string attack_string(ParseNode *loop, string pump, int repeats);
+
+  // adds a redos alert (with the attack string unless it is empty)
+  void add_redos_alert(string type, string message, ParseNode *loop,
+                       ParseNode *culprit, string attack, bool warning);
 };
 
 #endif // CHECKER_H
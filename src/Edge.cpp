@@ -43,6 +43,10 @@ Edge::process_edge(string test_string, Path *path)
     backref->set_curr_substring(path->gen_backref_string(backref->get_group_loc()));
   }
 
+  // epsilon edges are shared by every NFA and carry no state, so leave
+  // them untouched (concurrent runs may be walking the same edge)
+  if (type == EPSILON_EDGE) return false;
+
   // no further work needed if edge already processed from prior path
   if (processed) return false;
   processed = true;
@@ -269,6 +273,19 @@ Edge::gen_evil_strings(string path_string, const set <char> &punct_marks)
   }
 }
 
+bool
+Edge::get_pump(string path_string, Pump &pump)
+{
+  switch (type) {
+    case STRING_EDGE:
+      return regex_str->get_pump(path_string, pump);
+    case END_LOOP_EDGE:
+      return regex_loop->get_pump(path_string, pump);
+    default:
+      return false;
+  }
+}
+
 void
 Edge::print()
 {
@@ -71,6 +71,9 @@ public:
   // process an edge, returns true if edge should be used in creating evil strings
   bool process_edge(string test_string, Path *path);
 
+  // mark the edge unprocessed so the next path visiting it processes it again
+  void reset() { if (type != EPSILON_EDGE) processed = false; }
+
   // get substring associated with edge
   string get_substring();
 
@@ -99,6 +102,9 @@ public:
   // generate evil strings
   vector <string> gen_evil_strings(string path_string, const set <char> &punct_marks);
 
+  // sets pump for loops and strings that can be repeated without limit
+  bool get_pump(string path_string, Pump &pump);
+
   // print the edge
   void print();
 
@@ -0,0 +1,432 @@
+/*  Matcher.cpp: Linear time matcher that decides which strings a regex matches
+
+    Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+    elarson@seattleu.edu
+
+    This file is part of EGRET.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include <algorithm>
+#include <bitset>
+#include <map>
+#include <string>
+#include <vector>
+#include "Matcher.h"
+#include "ParseTree.h"
+#include "Util.h"
+using namespace std;
+
+bool
+Matcher::build(ParseTree &tree)
+{
+  return build(tree.get_root());
+}
+
+bool
+Matcher::build(ParseNode *root)
+{
+  string regex = Util::get()->get_regex();
+  if (!reset(regex)) return false;
+
+  MatchFragment fragment = build_fragment(root, regex);
+  if (!modeled) return false;
+  initial = fragment.initial;
+  patch(fragment, add_state(MATCH_STATE));
+  marks.assign(states.size(), 0);
+  return true;
+}
+
+// clears the automaton, returns false if the regex has characters the
+// matcher does not model
+bool
+Matcher::reset(const string &regex)
+{
+  states.clear();
+  char_sets.clear();
+  modeled = true;
+
+  // non-ASCII characters are several bytes to the engine but one to Python
+  for (unsigned int i = 0; i < regex.size(); i++) {
+    if ((unsigned char) regex[i] >= 128) return false;
+  }
+
+  // the scanner reads {,} as a literal, recent versions of Python as {0,}
+  if (regex.find("{,}") != string::npos) return false;
+
+  return true;
+}
+
+MatchFragment
+Matcher::build_fragment(ParseNode *node, const string &regex)
+{
+  if (!node || !modeled) return build_empty();
+
+  switch (node->type) {
+
+  case ALTERNATION_NODE:
+  {
+    MatchFragment left = build_fragment(node->left, regex);
+    MatchFragment right = build_fragment(node->right, regex);
+    int join = add_state(EPSILON_STATE);
+    patch(left, join);
+    patch(right, join);
+    return MatchFragment(add_state(SPLIT_STATE, left.initial, right.initial), join);
+  }
+
+  case CONCAT_NODE:
+  {
+    MatchFragment left = build_fragment(node->left, regex);
+    return concat(left, build_fragment(node->right, regex));
+  }
+
+  case REPEAT_NODE:
+    return build_repeat(node, regex);
+
+  case GROUP_NODE:
+    return build_fragment(node->left, regex);
+
+  case CHARACTER_NODE:
+  {
+    bitset <256> chars;
+    chars[(unsigned char) node->character] = true;
+    char_sets.push_back(chars);
+    int state = add_state(CHAR_STATE, -1, -1, char_sets.size() - 1);
+    return MatchFragment(state, state);
+  }
+
+  case CHAR_SET_NODE:
+  {
+    char_sets.push_back(node->char_set->get_exact_chars());
+    int state = add_state(CHAR_STATE, -1, -1, char_sets.size() - 1);
+    return MatchFragment(state, state);
+  }
+
+  case CARET_NODE:
+  {
+    int state = add_state(BEGIN_STATE);
+    return MatchFragment(state, state);
+  }
+
+  case DOLLAR_NODE:
+  {
+    // the scanner reads \Z as $, but \Z does not match before a final newline
+    int state = add_state(regex[node->loc.first] == '\\' ? STRICT_END_STATE : END_STATE);
+    return MatchFragment(state, state);
+  }
+
+  default:
+    modeled = false;
+    return build_empty();
+  }
+}
+
+// x{m,n} is unrolled into m copies of x followed by n - m nested optional
+// copies (x(x(x)?)?)?, and x{m,} into m copies followed by x*
+MatchFragment
+Matcher::build_repeat(ParseNode *node, const string &regex)
+{
+  MatchFragment fragment = build_empty();
+  for (int i = 0; i < node->repeat_lower && modeled; i++) {
+    fragment = concat(fragment, build_fragment(node->left, regex));
+  }
+
+  if (node->repeat_upper == -1) {
+    MatchFragment body = build_fragment(node->left, regex);
+    int exit = add_state(EPSILON_STATE);
+    int split = add_state(SPLIT_STATE, body.initial, exit);
+    patch(body, split);
+    return concat(fragment, MatchFragment(split, exit));
+  }
+
+  MatchFragment optional = build_empty();
+  for (int i = node->repeat_lower; i < node->repeat_upper && modeled; i++) {
+    MatchFragment body = build_fragment(node->left, regex);
+    int exit = add_state(EPSILON_STATE);
+    if (i > node->repeat_lower) {
+      patch(body, optional.initial);
+      patch(optional, exit);
+    }
+    else {
+      patch(body, exit);
+    }
+    optional = MatchFragment(add_state(SPLIT_STATE, body.initial, exit), exit);
+  }
+  return concat(fragment, optional);
+}
+
+MatchFragment
+Matcher::build_empty()
+{
+  int state = add_state(EPSILON_STATE);
+  return MatchFragment(state, state);
+}
+
+MatchFragment
+Matcher::concat(MatchFragment first, MatchFragment second)
+{
+  patch(first, second.initial);
+  return MatchFragment(first.initial, second.final);
+}
+
+int
+Matcher::add_state(MatchStateType type, int out1, int out2, int chars)
+{
+  if (states.size() >= MAX_MATCHER_STATES) {
+    modeled = false;
+    return 0;
+  }
+  MatchState state = { type, out1, out2, chars };
+  states.push_back(state);
+  return states.size() - 1;
+}
+
+void
+Matcher::patch(MatchFragment fragment, int state)
+{
+  if (modeled) states[fragment.final].out1 = state;
+}
+
+bool
+Matcher::add_to_list(vector <int> &list, int state, const string &s, unsigned int pos)
+{
+  bool accepts = false;
+  pending.push_back(state);
+  while (!pending.empty()) {
+    int i = pending.back();
+    pending.pop_back();
+    if (marks[i] == generation) continue;
+    marks[i] = generation;
+
+    MatchState &st = states[i];
+    switch (st.type) {
+    case CHAR_STATE:
+      list.push_back(i);
+      break;
+    case SPLIT_STATE:
+      pending.push_back(st.out2);
+      pending.push_back(st.out1);
+      break;
+    case EPSILON_STATE:
+      pending.push_back(st.out1);
+      break;
+    case BEGIN_STATE:
+      if (pos == 0) pending.push_back(st.out1);
+      break;
+    case END_STATE:
+      if (pos == s.size() || (pos + 1 == s.size() && s[pos] == '\n')) pending.push_back(st.out1);
+      break;
+    case STRICT_END_STATE:
+      if (pos == s.size()) pending.push_back(st.out1);
+      break;
+    case MATCH_STATE:
+      accepts = true;
+      break;
+    }
+  }
+  return accepts;
+}
+
+int
+Matcher::matches(const string &s, bool full_match)
+{
+  for (unsigned int i = 0; i < s.size(); i++) {
+    if ((unsigned char) s[i] >= 128) return -1;
+  }
+
+  // a search starts a new attempt at every position, a full match at the start only
+  curr_list.clear();
+  generation++;
+  bool accepts = add_to_list(curr_list, initial, s, 0);
+  for (unsigned int pos = 0; pos < s.size(); pos++) {
+    if (accepts && !full_match) return 1;
+    next_list.clear();
+    generation++;
+    accepts = false;
+    unsigned char c = s[pos];
+    for (unsigned int i = 0; i < curr_list.size(); i++) {
+      MatchState &st = states[curr_list[i]];
+      if (char_sets[st.chars][c])
+        accepts = add_to_list(next_list, st.out1, s, pos + 1) || accepts;
+    }
+    if (!full_match)
+      accepts = add_to_list(next_list, initial, s, pos + 1) || accepts;
+    curr_list.swap(next_list);
+    if (curr_list.empty() && !accepts && full_match) return 0;
+  }
+  return accepts ? 1 : 0;
+}
+
+// The ambiguity search follows two paths through the loop at once: a state
+// of the search is the pair of CHAR_STATEs the paths are at and whether the
+// paths have differed yet.  Both paths read the same character at each step,
+// so once they differ and then meet at the same CHAR_STATE, the string read
+// so far (completed back to the start of an iteration) is matched by the
+// loop in two ways.
+
+int
+Matcher::find_ambiguity(ParseNode *loop, vector <bitset <256> > &pump)
+{
+  string regex = Util::get()->get_regex();
+  if (!reset(regex)) return -1;
+
+  MatchFragment body = build_fragment(loop->left, regex);
+  int exit = add_state(MATCH_STATE);
+  loop_start = add_state(SPLIT_STATE, body.initial, exit);
+  patch(body, loop_start);
+  if (!modeled) return -1;
+
+  // character states are numbered 0 to n - 1 for the search
+  vector <int> char_states;
+  vector <int> index(states.size(), -1);
+  for (unsigned int i = 0; i < states.size(); i++) {
+    if (states[i].type == CHAR_STATE) {
+      index[i] = char_states.size();
+      char_states.push_back(i);
+    }
+  }
+  int n = char_states.size();
+  if (n > MAX_AMBIGUITY_STATES) return -1;
+
+  steps = 0;
+  on_path.assign(states.size(), false);
+  closures.assign(states.size(), vector <int>());
+  crosses.assign(states.size(), false);
+  vector <int> start;
+  bool start_crosses = false;
+  add_paths(start, loop_start, start_crosses);
+  for (int i = 0; i < n; i++) {
+    bool c = false;
+    add_paths(closures[char_states[i]], states[char_states[i]].out1, c);
+    crosses[char_states[i]] = c;
+  }
+  if (steps > MAX_AMBIGUITY_STEPS) return -1;
+
+  // search state (a, b, differed) with a <= b is numbered (a * n + b) * 2 + differed,
+  // parent is the state it was reached from (-1 for the first ones)
+  vector <int> parent(n * n * 2, -2);
+  vector <bitset <256> > read(n * n * 2);
+  vector <int> queue;
+  int found = -1;
+
+  // the paths leave the start of an iteration together
+  for (unsigned int i = 0; i < start.size() && found == -1; i++) {
+    for (unsigned int j = i; j < start.size(); j++) {
+      int a = index[start[i]];
+      int b = index[start[j]];
+      if (a > b) swap(a, b);
+      int s = (a * n + b) * 2 + (i != j ? 1 : 0);
+      if (parent[s] != -2) continue;
+      parent[s] = -1;
+      queue.push_back(s);
+      if (a == b && i != j) {
+        found = s;
+        break;
+      }
+    }
+  }
+
+  for (unsigned int q = 0; q < queue.size() && found == -1; q++) {
+    int s = queue[q];
+    int a = s / 2 / n;
+    int b = s / 2 % n;
+    bool differed = s % 2;
+    bitset <256> chars = char_sets[states[char_states[a]].chars] & char_sets[states[char_states[b]].chars];
+    if (chars.none()) continue;
+
+    vector <int> &first = closures[char_states[a]];
+    vector <int> &second = closures[char_states[b]];
+    bool together = (a == b && !differed);
+    for (unsigned int i = 0; i < first.size() && found == -1; i++) {
+      for (unsigned int j = together ? i : 0; j < second.size(); j++) {
+        if (++steps > MAX_AMBIGUITY_STEPS) return -1;
+        int x = index[first[i]];
+        int y = index[second[j]];
+        if (x > y) swap(x, y);
+        bool d = differed || !together || i != j;
+        int t = (x * n + y) * 2 + (d ? 1 : 0);
+        if (parent[t] != -2) continue;
+        parent[t] = s;
+        read[t] = chars;
+        queue.push_back(t);
+        if (x == y && d) {
+          found = t;
+          break;
+        }
+      }
+    }
+  }
+  if (found == -1) return 0;
+
+  // the string read to reach the meeting state, completed to the start of an iteration
+  pump.clear();
+  for (int s = found; parent[s] != -1; s = parent[s]) {
+    pump.insert(pump.begin(), read[s]);
+  }
+  if (!complete_iteration(char_states[found / 2 / n], pump)) return -1;
+  return 1;
+}
+
+void
+Matcher::add_paths(vector <int> &closure, int state, bool &crossed)
+{
+  if (++steps > MAX_AMBIGUITY_STEPS || state < 0 || on_path[state]) return;
+
+  MatchState &st = states[state];
+  switch (st.type) {
+  case CHAR_STATE:
+    if (count(closure.begin(), closure.end(), state) < 2) closure.push_back(state);
+    return;
+  case SPLIT_STATE:
+  case EPSILON_STATE:
+    if (state == loop_start) crossed = true;
+    on_path[state] = true;
+    add_paths(closure, st.out1, crossed);
+    if (st.type == SPLIT_STATE) add_paths(closure, st.out2, crossed);
+    on_path[state] = false;
+    return;
+  default:
+    // anchors are not followed, the loop is only searched where it can repeat freely
+    return;
+  }
+}
+
+bool
+Matcher::complete_iteration(int state, vector <bitset <256> > &pump)
+{
+  // breadth first over the CHAR_STATEs, each one reads a character
+  map <int, int> parent;
+  vector <int> queue(1, state);
+  parent[state] = -1;
+  for (unsigned int q = 0; q < queue.size(); q++) {
+    int curr = queue[q];
+    if (crosses[curr]) {
+      vector <bitset <256> > tail;
+      for (int s = curr; s != -1; s = parent[s]) {
+        tail.insert(tail.begin(), char_sets[states[s].chars]);
+      }
+      pump.insert(pump.end(), tail.begin(), tail.end());
+      return true;
+    }
+    for (unsigned int i = 0; i < closures[curr].size(); i++) {
+      int next = closures[curr][i];
+      if (parent.count(next) == 0) {
+        parent[next] = curr;
+        queue.push_back(next);
+      }
+    }
+  }
+  return false;
+}
@@ -0,0 +1,140 @@
+/*  Matcher.h: Linear time matcher that decides which strings a regex matches
+
+    Copyright (C) 2016-2018  Eric Larson and Anna Kirk
+    elarson@seattleu.edu
+
+    This file is part of EGRET.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#ifndef MATCHER_H
+#define MATCHER_H
+
+#include <bitset>
+#include <string>
+#include <vector>
+#include "ParseTree.h"
+using namespace std;
+
+#define MAX_MATCHER_STATES 10000
+#define MAX_AMBIGUITY_STATES 64       // character states of a loop searched for ambiguity
+#define MAX_AMBIGUITY_STEPS 1000000   // work done before the ambiguity search gives up
+
+typedef enum
+{
+  CHAR_STATE,		// consumes a character of a set
+  SPLIT_STATE,		// moves to out1 and out2
+  EPSILON_STATE,	// moves to out1
+  BEGIN_STATE,		// moves to out1 at the start of the string (^ and \A)
+  END_STATE,		// moves to out1 at the end or before a final newline ($)
+  STRICT_END_STATE,	// moves to out1 at the end of the string (\Z)
+  MATCH_STATE		// accepts
+} MatchStateType;
+
+struct MatchState
+{
+  MatchStateType type;
+  int out1;		// next state (-1 while unpatched)
+  int out2;		// second next state (SPLIT_STATE)
+  int chars;		// index of the character set (CHAR_STATE)
+};
+
+// a piece of the automaton under construction: its final state moves
+// (out1) to the state that follows the piece once patched
+struct MatchFragment
+{
+  int initial;
+  int final;
+  MatchFragment(int i, int f) { initial = i; final = f; }
+};
+
+// Matcher: a Thompson NFA compiled from the parse tree and simulated one
+// character at a time, so a string is classified in time linear in its
+// length whatever the regex (no backtracking).  Unlike the NFA used for
+// test generation, repeats are unrolled and character sets match what
+// Python matches.
+class Matcher {
+
+public:
+
+  Matcher() { initial = -1; generation = 0; loop_start = -1; steps = 0; }
+
+  // compiles the tree, returns false if the regex uses a construct the
+  // matcher does not model exactly (backreferences, ignored elements such
+  // as lookarounds, \b or flags, non-ASCII characters) or needs more than
+  // MAX_MATCHER_STATES states
+  bool build(ParseTree &tree);
+  bool build(ParseNode *root);
+
+  // builds the automaton of an unbounded loop (without its required
+  // iterations) and returns 1 if the loop is ambiguous: two different paths
+  // through it match the same string from the start of an iteration back to
+  // the start of one, so a backtracking matcher has exponentially many ways
+  // to try on that string pumped.  pump is set to the character sets of such
+  // a string, one per character.  Returns 0 if there is no such string and
+  // -1 if the loop cannot be modeled or the search gives up.
+  int find_ambiguity(ParseNode *loop, vector <bitset <256> > &pump);
+
+  // returns 1 if the regex matches s (anywhere in s like re.search, or all
+  // of s like re.fullmatch), 0 if it does not and -1 if s is not ASCII
+  int matches(const string &s, bool full_match);
+
+private:
+
+  vector <MatchState> states;		// states of the automaton
+  vector <bitset <256> > char_sets;	// character sets of CHAR_STATEs
+  int initial;				// initial state
+  bool modeled;				// false once an unmodeled construct is found
+
+  // simulation
+  vector <int> curr_list;		// CHAR_STATEs and MATCH_STATE before a character
+  vector <int> next_list;		// ... after it
+  vector <int> pending;			// states whose moves are being followed
+  vector <unsigned int> marks;		// generation of the list each state was added to
+  unsigned int generation;
+
+  // ambiguity search
+  int loop_start;			// SPLIT_STATE starting each iteration of the loop
+  int steps;				// work done so far
+  vector <vector <int> > closures;	// CHAR_STATEs after each CHAR_STATE, one entry per path
+  vector <bool> crosses;		// ... and whether a path passes loop_start
+  vector <bool> on_path;		// states on the path being followed
+
+  // construction functions
+  bool reset(const string &regex);
+  MatchFragment build_fragment(ParseNode *node, const string &regex);
+  MatchFragment build_repeat(ParseNode *node, const string &regex);
+  MatchFragment build_empty();
+  MatchFragment concat(MatchFragment first, MatchFragment second);
+  int add_state(MatchStateType type, int out1 = -1, int out2 = -1, int chars = -1);
+  void patch(MatchFragment fragment, int state);
+
+  // adds state and the states it moves to without a character to list,
+  // returns true if one of them accepts
+  bool add_to_list(vector <int> &list, int state, const string &s, unsigned int pos);
+
+  // ambiguity search functions
+
+  // appends to closure the CHAR_STATE at the end of each path of moves
+  // without a character from state (at most two per CHAR_STATE), sets
+  // crossed if a path passes the start of an iteration
+  void add_paths(vector <int> &closure, int state, bool &crossed);
+
+  // appends to pump the character sets of a string taking the automaton from
+  // CHAR_STATE state to the start of an iteration, returns false if there is none
+  bool complete_iteration(int state, vector <bitset <256> > &pump);
+};
+
+#endif // MATCHER_H
@@ -34,58 +34,16 @@ using namespace std;
 // TODO: No location information for epsilon edge.  OK?
 static Edge EPSILON = Edge(EPSILON_EDGE);
 
-NFA::NFA(unsigned int _size, unsigned int _initial, unsigned int  _final)
-{
-  size = _size;
-  initial = _initial;
-  final = _final;
-
-  assert(initial < size);
-  assert(final < size);
-
-  // initialize edge table with an "empty graph"
-  vector <Edge *> empty_row(size, NULL);
-  for (unsigned int i = 0; i < size; i++) {
-    edge_table.push_back(empty_row);
-  }
-}
-
-NFA::NFA(const NFA &other)
-{
-  size = other.size;
-  initial = other.initial;
-  final = other.final;
-  edge_table = other.edge_table;
-}
-
-NFA &
-NFA::operator=(const NFA & other)
-{
-  if (this == &other)
-    return *this;
-
-  initial = other.initial;
-  final = other.final;
-  size = other.size;
-  edge_table = other.edge_table;
-
-  return *this;
-}
-
 void
 NFA::build(ParseTree &tree)
 {
-  // Build NFA
-  NFA nfa = build_nfa_from_tree(tree.get_root());
-
-  // Copy NFA
+  out_edges.clear();
+  Fragment nfa = build_nfa_from_tree(tree.get_root());
   initial = nfa.initial;
   final = nfa.final;
-  size = nfa.size;
-  edge_table = nfa.edge_table;
 }
 
-NFA
+Fragment
 NFA::build_nfa_from_tree(ParseNode *tree)
 {
   assert(tree);
@@ -127,54 +85,37 @@ NFA::build_nfa_from_tree(ParseNode *tree)
   }
 }
 
-NFA
+Fragment
 NFA::build_nfa_alternation(ParseNode *tree)
 {
-  NFA nfa1 = build_nfa_from_tree(tree->left);
-  NFA nfa2 = build_nfa_from_tree(tree->right);
-
-  // How this is done: the new nfa must contain all the states in
-  // nfa1 and nfa2, plus new initial and final states.
-  // First will come the new initial state, then nfa1's states, then
-  // nfa2's states, then the new final state.
-
-  // make room for the new initial state
-  nfa1.shift_states(1);
-
-  // make room for nfa1
-  nfa2.shift_states(nfa1.size);
-
-  // create a new nfa and initialize it with (the shifted) nfa2
-  NFA new_nfa(nfa2);
-
-  // nfa1's states take their places in new_nfa
-  new_nfa.fill_states(nfa1);
-
-  // Set new initial state and the edges from it
-  new_nfa.add_edge(0, nfa1.initial, &EPSILON);
-  new_nfa.add_edge(0, nfa2.initial, &EPSILON);
-  new_nfa.initial = 0;
-
-  // Make up space for the new final state
-  new_nfa.append_empty_state();
-
-  // Set new final state
-  new_nfa.final = new_nfa.size - 1;
-  new_nfa.add_edge(nfa1.final, new_nfa.final, &EPSILON);
-  new_nfa.add_edge(nfa2.final, new_nfa.final, &EPSILON);
+  Fragment nfa1 = build_nfa_from_tree(tree->left);
+  Fragment nfa2 = build_nfa_from_tree(tree->right);
+
+  // New initial state branches to both alternatives and both alternatives
+  // join in a new final state.  The edge to nfa1 is added first so that
+  // traversals explore the left alternative first.
+  Fragment new_nfa(add_state(), add_state());
+  add_edge(new_nfa.initial, nfa1.initial, &EPSILON);
+  add_edge(new_nfa.initial, nfa2.initial, &EPSILON);
+  add_edge(nfa1.final, new_nfa.final, &EPSILON);
+  add_edge(nfa2.final, new_nfa.final, &EPSILON);
 
   return new_nfa;
 }
 
-NFA
+Fragment
 NFA::build_nfa_concat(ParseNode *tree)
 {
-  NFA nfa1 = build_nfa_from_tree(tree->left);
-  NFA nfa2 = build_nfa_from_tree(tree->right);
-  return concat_nfa(nfa1, nfa2);
+  Fragment nfa1 = build_nfa_from_tree(tree->left);
+  Fragment nfa2 = build_nfa_from_tree(tree->right);
+
+  // add edge from nfa1 to nfa2
+  add_edge(nfa1.final, nfa2.initial, &EPSILON);
+
+  return Fragment(nfa1.initial, nfa2.final);
 }
 
-NFA
+Fragment
 NFA::build_nfa_repeat(ParseNode *tree)
 {
   int repeat_lower = tree->repeat_lower;
@@ -185,186 +126,95 @@ NFA::build_nfa_repeat(ParseNode *tree)
     return build_nfa_string(tree);
 
   // create NFA for repeated segment
-  NFA nfa = build_nfa_from_tree(tree->left);
-
-  // make room for the new initial state
-  nfa.shift_states(1);
-
-  // make room for the new final state
-  nfa.append_empty_state();
+  Fragment nfa = build_nfa_from_tree(tree->left);
 
   // create new loop
-  RegexLoop *regex_loop = new RegexLoop(repeat_lower, repeat_upper);
+  RegexLoop *regex_loop = Util::get()->own(new RegexLoop(repeat_lower, repeat_upper));
 
-  // Util new edges
-  Edge *edge = new Edge(BEGIN_LOOP_EDGE, tree->loc, regex_loop);
-  nfa.add_edge(0, nfa.initial, edge);	   // new initial to old initial
-  edge = new Edge(END_LOOP_EDGE, tree->loc, regex_loop);
-  nfa.add_edge(nfa.final, nfa.size - 1, edge); // old final to new final
+  // new initial and final states enter and leave the loop
+  Fragment new_nfa(add_state(), add_state());
+  Edge *edge = Util::get()->own(new Edge(BEGIN_LOOP_EDGE, tree->loc, regex_loop));
+  add_edge(new_nfa.initial, nfa.initial, edge);	   // new initial to old initial
+  edge = Util::get()->own(new Edge(END_LOOP_EDGE, tree->loc, regex_loop));
+  add_edge(nfa.final, new_nfa.final, edge); // old final to new final
 
-  // update states
-  nfa.initial = 0;
-  nfa.final = nfa.size - 1;
-
-  return nfa;
+  return new_nfa;
 }
 
-NFA
+Fragment
 NFA::build_nfa_string(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);
   RegexString *regex_str =
-    new RegexString(tree->left->char_set, tree->repeat_lower, tree->repeat_upper);
+    Util::get()->own(new RegexString(tree->left->char_set, tree->repeat_lower, tree->repeat_upper));
   Location loc = make_pair(tree->left->loc.first, tree->loc.second);
-  Edge *edge = new Edge(STRING_EDGE, loc, regex_str);
-  nfa.add_edge(0, 1, edge);
-
-  return nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(STRING_EDGE, loc, regex_str)));
 }
 
-NFA
+Fragment
 NFA::build_nfa_group(ParseNode *tree)
 {
   return build_nfa_from_tree(tree->left);
 }
 
 
-NFA
+Fragment
 NFA::build_nfa_character(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);	// size = 2, initial = 0 , final = 1
-  Edge *edge = new Edge(CHARACTER_EDGE, tree->loc, tree->character);
-  nfa.add_edge(0, 1, edge);
-  return nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(CHARACTER_EDGE, tree->loc, tree->character)));
 }
 
-NFA
+Fragment
 NFA::build_nfa_caret(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);	// size = 2, initial = 0 , final = 1
-  Edge *edge = new Edge(CARET_EDGE, tree->loc);
-  nfa.add_edge(0, 1, edge);
-  return nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(CARET_EDGE, tree->loc)));
 }
 
-NFA
+Fragment
 NFA::build_nfa_dollar(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);	// size = 2, initial = 0 , final = 1
-  Edge *edge = new Edge(DOLLAR_EDGE, tree->loc);
-  nfa.add_edge(0, 1, edge);
-  return nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(DOLLAR_EDGE, tree->loc)));
 }
 
-NFA
+Fragment
 NFA::build_nfa_char_set(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);     // size = 2, initial = 0, final = 1
-  Edge *edge = new Edge(CHAR_SET_EDGE, tree->loc, tree->char_set);
-  nfa.add_edge(0, 1, edge);
-  return nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(CHAR_SET_EDGE, tree->loc, tree->char_set)));
 }
 
-NFA
+Fragment
 NFA::build_nfa_ignored(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);	// size = 2, initial = 0 , final = 1
-  nfa.add_edge(0, 1, &EPSILON);
-  return nfa;
+  return build_nfa_edge(&EPSILON);
 }
 
-NFA
+Fragment
 NFA::build_nfa_backreference(ParseNode *tree)
 {
-  NFA nfa(2, 0, 1);     // size = 2, initial = 0, final = 1
-  Edge *edge = new Edge(BACKREFERENCE_EDGE, tree->loc, tree->backref);
-  nfa.add_edge(0, 1, edge);
-  return nfa;
-}
-
-void
-NFA::add_edge(unsigned int from, unsigned int to, Edge *edge)
-{
-  assert(from < size);
-  assert(to < size);
-
-  edge_table[from][to] = edge;
-}
-
-NFA
-NFA::concat_nfa(NFA nfa1, NFA nfa2)
-{
-  // How this is done: First will come nfa1, then nfa2 (its
-  // initial state replaced with nfa1's final state)
-
-  // make room for nfa1
-  nfa2.shift_states(nfa1.size);
-
-  // create a new nfa and initialize it with (the shifted) nfa2
-  NFA new_nfa(nfa2);
-
-  // nfa1's states take their places in new_nfa
-  new_nfa.fill_states(nfa1);
-
-  // add edge from nfa1 to nfa2
-  new_nfa.add_edge(nfa1.final, new_nfa.initial, &EPSILON);
-
-  // set the new initial state (the final state stays nfa2's final state,
-  // and was already copied)
-  new_nfa.initial = nfa1.initial;
-
-  return new_nfa;
+  return build_nfa_edge(Util::get()->own(new Edge(BACKREFERENCE_EDGE, tree->loc, tree->backref)));
 }
 
-void
-NFA::shift_states(unsigned int shift)
+Fragment
+NFA::build_nfa_edge(Edge *edge)
 {
-  unsigned int new_size = size + shift;
-
-  if (shift < 1) return;
-
-  // create a new, empty edge table (of the new size)
-  vector <Edge *> empty_row(new_size, NULL);
-  vector <vector <Edge *> > new_edge_table(new_size, empty_row);
-
-  // copy all the edges to the new table, at their new locations
-  for (unsigned int i = 0; i < size; i++) {
-    for (unsigned int j = 0; j < size; j++) {
-      new_edge_table[i + shift][j + shift] = edge_table[i][j];
-    }
-  }
-
-  // update the NFA members
-  size = new_size;
-  initial += shift;
-  final += shift;
-  edge_table = new_edge_table;
+  Fragment nfa(add_state(), add_state());
+  add_edge(nfa.initial, nfa.final, edge);
+  return nfa;
 }
 
-// fills states from other's states
-// (requires the use of shift_states first)
-void
-NFA::fill_states(const NFA &other)
+unsigned int
+NFA::add_state()
 {
-  for (unsigned int i = 0; i < other.size; i++) {
-    for (unsigned int j = 0; j < other.size; j++) {
-      edge_table[i][j] = other.edge_table[i][j];
-    }
-  }
+  out_edges.push_back(vector <Transition>());
+  return out_edges.size() - 1;
 }
 
 void
-NFA::append_empty_state()
+NFA::add_edge(unsigned int from, unsigned int to, Edge *edge)
 {
-  // append a new row (already with a larger size)
-  vector <Edge *> empty_row(size + 1, NULL);
-  edge_table.push_back(empty_row);
-
-  // append a new column
-  for (unsigned int i = 0; i < size; i++)
-    edge_table[i].push_back(NULL);
+  assert(from < out_edges.size());
+  assert(to < out_edges.size());
 
-  size += 1;
+  out_edges[from].push_back(Transition(to, edge));
 }
 
 bool
@@ -383,44 +233,65 @@ NFA::is_regex_string(ParseNode *node, int repeat_lower, int repeat_upper)
   return true;
 }
 
+// A state on the current traversal path (the stack of frames is the path)
+struct TraverseFrame {
+  unsigned int state;			// state reached
+  Edge *edge;				// edge taken to reach the state
+  unsigned int next;			// next out-edge to follow
+  bool been_here;			// state was on an earlier path
+  TraverseFrame(unsigned int s, Edge *e, bool b) { state = s; edge = e; next = 0; been_here = b; }
+};
+
 vector <Path>
 NFA::find_basis_paths()
 {
-  Path path(initial);
   vector <Path> paths;
-  bool *visited = new bool[size];
-  for (unsigned int i = 0; i < size; i++)
-    visited[i] = false;
-
-  traverse(initial, path, paths, visited);
+  vector <bool> visited(out_edges.size(), false);
+
+  // depth first traversal with an explicit stack, a path is only built
+  // when the final state is reached
+  vector <TraverseFrame> stack;
+  stack.push_back(TraverseFrame(initial, NULL, visited[initial]));
+
+  unsigned int steps = 0;
+  while (!stack.empty()) {
+    // once the time budget is spent, keep the paths found so far
+    if ((++steps & 0xfff) == 0 && Util::get()->out_of_time()) break;
+
+    TraverseFrame &frame = stack.back();
+
+    // final state --> record the path and stop the traversal
+    if (frame.state == final) {
+      Path path(initial);
+      for (unsigned int i = 1; i < stack.size(); i++)
+        path.append(stack[i].edge, stack[i].state);
+      path.mark_path_visited(visited);
+      paths.push_back(path);
+      stack.pop_back();
+      continue;
+    }
 
-  delete visited;
+    // follow each adjacent state in turn, but only the first one if we
+    // have already been here
+    vector <Transition> &transitions = out_edges[frame.state];
+    if (frame.next == transitions.size() || (frame.been_here && frame.next > 0)) {
+      stack.pop_back();
+      continue;
+    }
+    Transition &transition = transitions[frame.next++];
+    stack.push_back(TraverseFrame(transition.to, transition.edge, visited[transition.to]));
+  }
 
   return paths;
 }
 
 void
-NFA::traverse(unsigned int curr_state, Path path, vector <Path> &paths,
-    bool *visited)
+NFA::reset_edges()
 {
-  // stop if you already have been here
-  bool been_here = visited[curr_state];
-
-  // final state --> process the path and stop the traversal
-  if (curr_state == final) {
-    path.mark_path_visited(visited);
-    paths.push_back(path);
-    return;
-  }
-
-  // for each adjacent state, find all paths 
-  for (unsigned int next_state = 0; next_state < size; next_state++) {
-    Edge *edge = edge_table[curr_state][next_state];
-    if (edge == NULL) continue;
-    path.append(edge, next_state);
-    traverse(next_state, path, paths, visited);
-    path.remove_last();
-    if (been_here) break;
+  for (unsigned int state = 0; state < out_edges.size(); state++) {
+    for (unsigned int i = 0; i < out_edges[state].size(); i++) {
+      out_edges[state][i].edge->reset();
+    }
   }
 }
 
@@ -428,20 +299,17 @@ void
 NFA::print()
 {
   cout << "NFA: " << endl;
-  cout << "Number of states: " << size << " ";
+  cout << "Number of states: " << out_edges.size() << " ";
   cout << "Initial state: " << initial << " ";
   cout << "Final state: " << final << endl;
   
   cout << "Edge table: " << endl;
-  for (unsigned int from = 0; from < size; from++) {
+  for (unsigned int from = 0; from < out_edges.size(); from++) {
     cout << "State " << from << ": ";
     cout << endl;
-    for (unsigned int to = 0; to < size; to++) {
-      Edge *edge = edge_table[from][to];
-      if (edge != NULL) {
-        cout << "  To state " << to << " on ";
-	edge->print();
-      }
+    for (unsigned int i = 0; i < out_edges[from].size(); i++) {
+      cout << "  To state " << out_edges[from][i].to << " on ";
+      out_edges[from][i].edge->print();
     }
   }
 
@@ -462,45 +330,43 @@ NFA::add_stats(Stats &stats)
   int backreference_count = 0;
   int epsilon_count = 0;
 
-  for (unsigned int from = 0; from < size; from++) {
-    for (unsigned int to = 0; to < size; to++) {
-      Edge *edge = edge_table[from][to];
-      if (edge != NULL) {
-        edge_count++;
-	switch (edge->get_type()) {
-	  case CHARACTER_EDGE:
-	    char_count++;
-	    break;
-	  case CHAR_SET_EDGE:
-	    charset_count++;
-	    break;
-	  case STRING_EDGE:
-	    string_count++;
-	    break;
-	  case BEGIN_LOOP_EDGE:
-	    begin_loop_count++;
-	    break;
-	  case END_LOOP_EDGE:
-	    end_loop_count++;
-	    break;
-	  case CARET_EDGE:
-	    caret_count++;
-	    break;
-	  case DOLLAR_EDGE:
-	    dollar_count++;
-	    break;
-	  case BACKREFERENCE_EDGE:
-	    backreference_count++;
-	    break;
-	  case EPSILON_EDGE:
-	    epsilon_count++;
-	    break;
-	}
+  for (unsigned int from = 0; from < out_edges.size(); from++) {
+    for (unsigned int i = 0; i < out_edges[from].size(); i++) {
+      Edge *edge = out_edges[from][i].edge;
+      edge_count++;
+      switch (edge->get_type()) {
+        case CHARACTER_EDGE:
+          char_count++;
+          break;
+        case CHAR_SET_EDGE:
+          charset_count++;
+          break;
+        case STRING_EDGE:
+          string_count++;
+          break;
+        case BEGIN_LOOP_EDGE:
+          begin_loop_count++;
+          break;
+        case END_LOOP_EDGE:
+          end_loop_count++;
+          break;
+        case CARET_EDGE:
+          caret_count++;
+          break;
+        case DOLLAR_EDGE:
+          dollar_count++;
+          break;
+        case BACKREFERENCE_EDGE:
+          backreference_count++;
+          break;
+        case EPSILON_EDGE:
+          epsilon_count++;
+          break;
       }
     }
   }
 
-  stats.add("NFA", "NFA states", size);
+  stats.add("NFA", "NFA states", out_edges.size());
   stats.add("NFA", "NFA edges", edge_count);
   stats.add("NFA", "NFA character edges", char_count);
   stats.add("NFA", "NFA char set edges", charset_count);
@@ -33,14 +33,25 @@
 #include "Stats.h"
 using namespace std;
 
+// out-edge of a state
+struct Transition {
+  unsigned int to;			// destination state
+  Edge *edge;				// edge taken
+  Transition(unsigned int t, Edge *e) { to = t; edge = e; }
+};
+
+// a piece of the NFA under construction, identified by its entry and exit
+struct Fragment {
+  unsigned int initial;			// initial state
+  unsigned int final;			// final state
+  Fragment(unsigned int i, unsigned int f) { initial = i; final = f; }
+};
+
 class NFA {
 
 public:
 
-  NFA() {}
-  NFA(unsigned int _size, unsigned int _initial, unsigned int _final);
-  NFA(const NFA &other);
-  NFA &operator= (const NFA &other);
+  NFA() { initial = 0; final = 0; }
 
   // build an NFA from the parse tree
   void build(ParseTree &tree);
@@ -48,6 +59,9 @@ public:
   // create a set of basis paths
   vector <Path> find_basis_paths();
 
+  // mark every edge unprocessed (before processing the paths again)
+  void reset_edges();
+
   // print out the NFA
   void print();
 
@@ -56,68 +70,57 @@ public:
 
 private:
 
-  unsigned int size;			// number of states
   unsigned int initial;			// initial state
   unsigned int final;			// final state
-  vector <vector <Edge *> > edge_table;	// edge table
+  vector <vector <Transition> > out_edges;	// out-edges of each state, in order
   
-  // builds an NFA from tree
-  NFA build_nfa_from_tree(ParseNode *tree);
+  // builds the fragment for tree (all builders append their states to the NFA)
+  Fragment build_nfa_from_tree(ParseNode *tree);
 
   // builds an alternation of nfa1 and nfa2 (nfa1|nfa2)
-  NFA build_nfa_alternation(ParseNode *tree);
+  Fragment build_nfa_alternation(ParseNode *tree);
 
   // builds a concatenation of nfa1 and nfa2 (nfa1nfa2)
-  NFA build_nfa_concat(ParseNode *tree);
+  Fragment build_nfa_concat(ParseNode *tree);
 
   // builds nfa{m,n}
-  NFA build_nfa_repeat(ParseNode *tree);
+  Fragment build_nfa_repeat(ParseNode *tree);
 
   // builds special node for regex strings such as .+ or \w*
-  NFA build_nfa_string(ParseNode *tree);
+  Fragment build_nfa_string(ParseNode *tree);
 
   // builds (nfa)
-  NFA build_nfa_group(ParseNode *tree);
+  Fragment build_nfa_group(ParseNode *tree);
 
   // builds nfa with character
-  NFA build_nfa_character(ParseNode *tree);
+  Fragment build_nfa_character(ParseNode *tree);
 
   // builds nfa with caret
-  NFA build_nfa_caret(ParseNode *tree);
+  Fragment build_nfa_caret(ParseNode *tree);
 
   // builds nfa with dollar
-  NFA build_nfa_dollar(ParseNode *tree);
+  Fragment build_nfa_dollar(ParseNode *tree);
 
   // builds nfa with char set as input
-  NFA build_nfa_char_set(ParseNode *tree);
+  Fragment build_nfa_char_set(ParseNode *tree);
 
   // builds nfa with ignored element
-  NFA build_nfa_ignored(ParseNode *tree);
+  Fragment build_nfa_ignored(ParseNode *tree);
 
   // builds nfa with backreference
-  NFA build_nfa_backreference(ParseNode *tree);
-
-  // adds an edge to edge table
-  void add_edge(unsigned int from, unsigned int to, Edge *edge);
+  Fragment build_nfa_backreference(ParseNode *tree);
 
-  // concatenates two NFAs together
-  NFA concat_nfa(NFA nfa1, NFA nfa2);
+  // builds a two state fragment joined by edge
+  Fragment build_nfa_edge(Edge *edge);
 
-  // shift (renames) all the states in the NFA according to some (positive) shift factor
-  void shift_states(unsigned int shift);
+  // appends a new state to the NFA and returns it
+  unsigned int add_state();
 
-  // fills states from other's states
-  void fill_states(const NFA &other);
-
-  // appends a new empty state to the NFA
-  void append_empty_state();
+  // adds an edge to the out-edges of state from
+  void add_edge(unsigned int from, unsigned int to, Edge *edge);
 
   // returns true if repeat quantifier represents a string
   bool is_regex_string(ParseNode *node, int repeat_lower, int repeat_upper);
-
-  // utility function to find all paths through the NFA
-  void traverse(unsigned int curr_state, Path path, vector <Path> &paths,
-      bool *visited);
 };
 
 #endif // NFA_H
@@ -96,17 +96,17 @@ ParseTree::expr()
   }
   // left empty: return right?
   else if (left == NULL) {
-    ParseNode *expr_node = new ParseNode(REPEAT_NODE, loc, right, 0, 1);
+    ParseNode *expr_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, right, 0, 1));
     return expr_node;
   }
   // right empty: return left?
   else if (right == NULL) {
-    ParseNode *expr_node = new ParseNode(REPEAT_NODE, loc, left, 0, 1);
+    ParseNode *expr_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, left, 0, 1));
     return expr_node;
   }
   
   // otherwise return left | right
-  ParseNode *expr_node = new ParseNode(ALTERNATION_NODE, loc, left, right);
+  ParseNode *expr_node = Util::get()->own(new ParseNode(ALTERNATION_NODE, loc, left, right));
   return expr_node;
 }
 
@@ -124,7 +124,7 @@ ParseTree::concat()
     ParseNode *right = concat();
     int left_loc = left->loc.second;
     Location loc = make_pair(left_loc, left_loc + 1);
-    ParseNode *concat_node = new ParseNode(CONCAT_NODE, loc, left, right);
+    ParseNode *concat_node = Util::get()->own(new ParseNode(CONCAT_NODE, loc, left, right));
     return concat_node;
   } else {
     return left;
@@ -148,24 +148,24 @@ ParseTree::rep()
   // then check for repetition character
   if (scanner.get_type() == STAR) {
     scanner.advance();
-    ParseNode *rep_node = new ParseNode(REPEAT_NODE, loc, atom_node, 0, -1);
+    ParseNode *rep_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, atom_node, 0, -1));
     return rep_node;
   }
   else if (scanner.get_type() == PLUS) {
     scanner.advance();
-    ParseNode *rep_node = new ParseNode(REPEAT_NODE, loc, atom_node, 1, -1);
+    ParseNode *rep_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, atom_node, 1, -1));
     return rep_node;
   }
   else if (scanner.get_type() == QUESTION) {
     scanner.advance();
-    ParseNode *rep_node = new ParseNode(REPEAT_NODE, loc, atom_node, 0, 1);
+    ParseNode *rep_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, atom_node, 0, 1));
     return rep_node;
   }
   else if (scanner.get_type() == REPEAT) {
     int lower = scanner.get_repeat_lower();
     int upper = scanner.get_repeat_upper();
     scanner.advance();
-    ParseNode *rep_node = new ParseNode(REPEAT_NODE, loc, atom_node, lower, upper);
+    ParseNode *rep_node = Util::get()->own(new ParseNode(REPEAT_NODE, loc, atom_node, lower, upper));
     return rep_node;
   }
   else {
@@ -266,10 +266,10 @@ ParseTree::group()
   int end_loc = scanner.get_loc().first;
   Location loc = make_pair(start_loc, end_loc);
   if (ignored_group) {
-    group_node = new ParseNode(IGNORED_NODE, loc, NULL, NULL);
+    group_node = Util::get()->own(new ParseNode(IGNORED_NODE, loc, NULL, NULL));
   }
   else {
-    group_node = new ParseNode(GROUP_NODE, loc, name, left, NULL);
+    group_node = Util::get()->own(new ParseNode(GROUP_NODE, loc, name, left, NULL));
   }
 
   // Store group information
@@ -306,7 +306,7 @@ ParseTree::character()
   if (type == CHARACTER) {
     char c = scanner.get_character();
     scanner.advance();
-    character_node =  new ParseNode(CHARACTER_NODE, loc, c);
+    character_node = Util::get()->own(new ParseNode(CHARACTER_NODE, loc, c));
     if (ispunct(c)) {
       if (punct_marks.find(c) == punct_marks.end()) {
         punct_marks.insert(c);
@@ -315,22 +315,22 @@ ParseTree::character()
   }
   else if (type == CARET) {
     scanner.advance();
-    return new ParseNode(CARET_NODE, loc, NULL, NULL);
+    return Util::get()->own(new ParseNode(CARET_NODE, loc, NULL, NULL));
   }
   else if (type == DOLLAR) {
     scanner.advance();
-    return new ParseNode(DOLLAR_NODE, loc, NULL, NULL);
+    return Util::get()->own(new ParseNode(DOLLAR_NODE, loc, NULL, NULL));
   }
   else if (type == HYPHEN) {
     scanner.advance();
-    character_node =  new ParseNode(CHARACTER_NODE, loc, '-');
+    character_node = Util::get()->own(new ParseNode(CHARACTER_NODE, loc, '-'));
     if (punct_marks.find('-') == punct_marks.end()) {
       punct_marks.insert('-');
     }
   }
   else if (type == WORD_BOUNDARY) {
     scanner.advance();
-    return new ParseNode(IGNORED_NODE, loc, NULL, NULL);
+    return Util::get()->own(new ParseNode(IGNORED_NODE, loc, NULL, NULL));
   }
   else if (type == BACKREFERENCE) {
     int group_num = scanner.get_group_num();
@@ -343,8 +343,8 @@ ParseTree::character()
       group_loc = group_locs[group_num];
     }
 
-    Backref *backref = new Backref(group_name, group_num, group_loc);
-    character_node = new ParseNode(BACKREFERENCE_NODE, loc, backref);
+    Backref *backref = Util::get()->own(new Backref(group_name, group_num, group_loc));
+    character_node = Util::get()->own(new ParseNode(BACKREFERENCE_NODE, loc, backref));
     scanner.advance();
   }
   else {
@@ -365,14 +365,14 @@ ParseTree::char_class()
   char c = scanner.get_character();
   scanner.advance();
 
-  CharSet *char_set = new CharSet();
+  CharSet *char_set = Util::get()->own(new CharSet());
 
   CharSetItem char_set_item;
   char_set_item.type = CHAR_CLASS_ITEM;
   char_set_item.character = c;
   char_set->add_item(char_set_item);
 
-  ParseNode *char_set_node = new ParseNode(CHAR_SET_NODE, loc, char_set);
+  ParseNode *char_set_node = Util::get()->own(new ParseNode(CHAR_SET_NODE, loc, char_set));
   return char_set_node;
 }
 
@@ -401,11 +401,11 @@ ParseTree::char_set()
   char_set_node = char_list(start_loc);
   if (is_complement) char_set_node->char_set->set_complement(true);
   if (char_set_node->char_set->is_single_char() && !is_complement) {
+    // the replaced node stays in the arena until the run ends
     char c = char_set_node->char_set->get_valid_character();
-    delete char_set_node;
     int end_loc = scanner.get_loc().first;
     Location loc = make_pair(start_loc, end_loc);
-    char_set_node = new ParseNode(CHARACTER_NODE, loc, c);
+    char_set_node = Util::get()->own(new ParseNode(CHARACTER_NODE, loc, c));
   }
 
   if (scanner.get_type() != RIGHT_BRACKET) {
@@ -431,7 +431,8 @@ ParseTree::char_list(int start_loc)
   if (scanner.get_type() == RIGHT_BRACKET) {
     int end_loc = scanner.get_loc().first;
     Location loc = make_pair(start_loc, end_loc);
-    char_set_node = new ParseNode(CHAR_SET_NODE, loc, new CharSet());
+    CharSet *char_set = Util::get()->own(new CharSet());
+    char_set_node = Util::get()->own(new ParseNode(CHAR_SET_NODE, loc, char_set));
   }
   else {
     char_set_node = char_list(start_loc);
@@ -615,6 +616,80 @@ ParseTree::print_tree(ParseNode *node, unsigned offset)
   print_tree(node->right, offset + 2);
 }
 
+string
+ParseTree::canonical_form()
+{
+  string form;
+  canonical_tree(root, Util::get()->get_regex(), form);
+  return form;
+}
+
+// Alternations are always wrapped in a non-capturing group and repeats
+// always use braces, so different trees never share a form.  Extensions
+// the tree ignores keep their regex text.
+void
+ParseTree::canonical_tree(ParseNode *node, const string &regex, string &form)
+{
+  if (!node) return;
+
+  stringstream s;
+  switch (node->type) {
+  case ALTERNATION_NODE:
+    form += "(?:";
+    canonical_tree(node->left, regex, form);
+    form += "|";
+    canonical_tree(node->right, regex, form);
+    form += ")";
+    break;
+  case CONCAT_NODE:
+    canonical_tree(node->left, regex, form);
+    canonical_tree(node->right, regex, form);
+    break;
+  case REPEAT_NODE:
+    canonical_tree(node->left, regex, form);
+    s << "{" << node->repeat_lower << ",";
+    if (node->repeat_upper != -1)
+      s << node->repeat_upper;
+    s << "}";
+    form += s.str();
+    break;
+  case GROUP_NODE:
+    if (node->group_name != "")
+      form += "(?P<" + node->group_name + ">";
+    else if (regex.compare(node->loc.first, 2, "(?") == 0)
+      form += "(?:";
+    else
+      form += "(";
+    canonical_tree(node->left, regex, form);
+    form += ")";
+    break;
+  case BACKREFERENCE_NODE:
+    if (node->backref->get_group_name() != "")
+      s << "(?P=" << node->backref->get_group_name() << ")";
+    else
+      s << "(?:\\" << node->backref->get_group_number() << ")";
+    form += s.str();
+    break;
+  case IGNORED_NODE:
+    form += regex.substr(node->loc.first, node->loc.second - node->loc.first + 1);
+    break;
+  case CHARACTER_NODE:
+    form += canonical_char(node->character);
+    break;
+  case CARET_NODE:
+    form += "^";
+    break;
+  case DOLLAR_NODE:
+    form += "$";
+    break;
+  case CHAR_SET_NODE:
+    form += node->char_set->get_canonical_form();
+    break;
+  default:
+    assert(false);
+  }
+}
+
 void
 ParseTree::add_stats(Stats &stats)
 {
@@ -192,6 +192,10 @@ public:
   // prints the tree
   void print();
 
+  // returns a form of the regex that is the same for regexes with the same
+  // tree once escapes, character classes and set items are normalized
+  string canonical_form();
+
   // get tree stats
   void add_stats(Stats &stats);
 
@@ -222,6 +226,9 @@ private:
   // print the tree
   void print_tree(ParseNode *node, unsigned offset);
 
+  // canonical form functions
+  void canonical_tree(ParseNode *node, const string &regex, string &form);
+
   // gather stats
   struct ParseTreeStats {
     int alternation_nodes;
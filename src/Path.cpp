@@ -47,7 +47,7 @@ Path::remove_last()
 }
 
 void
-Path::mark_path_visited(bool *visited)
+Path::mark_path_visited(vector <bool> &visited)
 {
   vector <unsigned int>::iterator it;
   for (it = states.begin(); it != states.end(); it++) {
@@ -60,8 +60,9 @@ Path::mark_path_visited(bool *visited)
 void
 Path::process_path()
 {
-  // Clear the string to start
+  // Clear the string and evil edges to start
   test_string.clear();
+  evil_edges.clear();
 
   for (unsigned int i = 0; i < edges.size(); i++) {
     // An edge must be processed first before being added, the function returns
@@ -672,6 +673,21 @@ Path::gen_evil_strings(const set <char> &punct_marks)
   return evil_strings;
 }
 
+vector <Pump>
+Path::get_pumps()
+{
+  vector <Pump> pumps;
+
+  // only the loops and strings of the path's evil edges have their substrings
+  for (unsigned int i = 0; i < evil_edges.size(); i++) {
+    Pump pump;
+    if (edges[evil_edges[i]]->get_pump(test_string, pump)) {
+      pumps.push_back(pump);
+    }
+  }
+  return pumps;
+}
+
 // PRINT FUNCTION
 
 void
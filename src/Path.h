@@ -45,7 +45,7 @@ public:
   void remove_last();
 
   // marks the states in the path as visited
-  void mark_path_visited(bool *visited);
+  void mark_path_visited(vector <bool> &visited);
 
   // processes path: sets test string and evil edges
   void process_path();
@@ -95,6 +95,9 @@ public:
   // generates evil strings for the path
   vector <string> gen_evil_strings(const set <char> &punct_marks);
 
+  // returns the substrings of the test string that can be repeated
+  vector <Pump> get_pumps();
+
   // PRINT FUNCTION
   
   // prints the path
@@ -134,6 +134,15 @@ RegexLoop::gen_evil_strings(string test_string)
   return evil_strings;
 }
 
+bool
+RegexLoop::get_pump(string test_string, Pump &pump)
+{
+  if (repeat_upper != -1 || substring.empty()) return false;
+
+  pump = Pump(prefix, substring, test_string.substr(prefix.size() + substring.size()));
+  return true;
+}
+
 void
 RegexLoop::print()
 {
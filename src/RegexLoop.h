@@ -24,6 +24,7 @@
 
 #include <string>
 #include <vector>
+#include "Util.h"
 using namespace std;
 
 class RegexLoop {
@@ -55,6 +56,9 @@ public:
   // generate evil strings
   vector <string> gen_evil_strings(string test_string);
 
+  // sets pump to the iteration of an unbounded loop in test string
+  bool get_pump(string test_string, Pump &pump);
+
   // print the regex loop
   void print();
 
@@ -101,6 +101,15 @@ RegexString::gen_evil_strings(string test_string, const set <char> &punct_marks)
   return evil_strings;
 }
 
+bool
+RegexString::get_pump(string test_string, Pump &pump)
+{
+  if (substring.empty()) return false;
+
+  pump = Pump(prefix, substring, test_string.substr(prefix.size() + substring.size()));
+  return true;
+}
+
 void
 RegexString::print()
 {
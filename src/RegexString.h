@@ -64,6 +64,9 @@ public:
   // generate evil strings
   vector <string> gen_evil_strings(string test_string, const set <char> &punct_marks);
 
+  // sets pump to the substring of the string in test string
+  bool get_pump(string test_string, Pump &pump);
+
   // print the regex string
   void print();
 
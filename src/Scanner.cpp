@@ -36,6 +36,7 @@ using namespace std;
 void
 Scanner::init(string in)
 {
+  gen_error.clear();
   unsigned int idx = 0;
   bool in_set = false;	// set to true when in the middle of set [] 
   while (idx < in.length()) {
@@ -94,61 +95,41 @@ Scanner::init(string in)
 	// Escaped characters are unsupported for test generation but supported for check mode
         // TODO: Fix test generation with these characters
         case 'a':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\a';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\a");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\a");
+	  token.type = CHARACTER;
+	  token.character = '\a';
 	  break;
         case 'f':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\f';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\f");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\f");
+	  token.type = CHARACTER;
+	  token.character = '\f';
 	  break;
 	case 'n':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\n';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\n");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\n");
+	  token.type = CHARACTER;
+	  token.character = '\n';
 	  break;
 	case 'r':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\r';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\r");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\r");
+	  token.type = CHARACTER;
+	  token.character = '\r';
 	  break;
 	case 't':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\t';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\t");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\t");
+	  token.type = CHARACTER;
+	  token.character = '\t';
 	  break;
 	case 'v':
-          if (Util::get()->is_check_mode()) {
-	    token.type = CHARACTER;
-	    token.character = '\v';
-          }
-          else {
-            throw EgretException("ERROR (unsupported): contains unsupported character \\v");
-          }
+          unsupported_in_generation("ERROR (unsupported): contains unsupported character \\v");
+	  token.type = CHARACTER;
+	  token.character = '\v';
 	  break;
 	case 'p':
           throw EgretException("ERROR (unsupported): contains unsupported character \\p");
+	// \N{name} is a character named in the Unicode database, which the
+	// engine cannot look up (scanning it as N{...} would be a repeat)
+	case 'N':
+          throw EgretException("ERROR (unsupported): contains unsupported named character \\N{...}");
 	case '\\':
 	  token.type = CHARACTER;
 	  token.character = '\\';
@@ -397,6 +378,15 @@ Scanner::init(string in)
   }
 }
 
+void
+Scanner::unsupported_in_generation(string error)
+{
+  if (!Util::get()->is_check_mode())
+    throw EgretException(error);
+  if (gen_error.empty())
+    gen_error = error;
+}
+
 char
 Scanner::get_next_char(string in, unsigned int &idx)
 {
@@ -430,14 +420,10 @@ Scanner::process_octal(string in, unsigned int &idx, char first_digit)
   // only one digit - either null or backreference (both are unsupported)
   if (only_one_digit) {
     if (first_digit == '0') {
-      if (Util::get()->is_check_mode()) {
-        token.type = CHARACTER;
-        token.character = '\0';
-        return token;
-      }
-      else {
-        throw EgretException("ERROR (unsupported): contains unsupported character \\0");
-      }
+      unsupported_in_generation("ERROR (unsupported): contains unsupported character \\0");
+      token.type = CHARACTER;
+      token.character = '\0';
+      return token;
     }
     else {
       token.type = BACKREFERENCE;
@@ -469,10 +455,12 @@ Scanner::process_octal(string in, unsigned int &idx, char first_digit)
     }
 
     // check the validity of the octal value
-    if (octal_value > 126 || (octal_value < 32 && !Util::get()->is_check_mode())) {
+    if (octal_value > 126 || octal_value < 32) {
       stringstream s;
       s << "ERROR (unsupported): contains unsupported octal value " << octal_value;
-      throw EgretException(s.str());
+      if (octal_value > 126)
+        throw EgretException(s.str());
+      unsupported_in_generation(s.str());
     }
 
     token.type = CHARACTER;
@@ -519,10 +507,12 @@ Scanner::process_hex(string in, unsigned int &idx, int num_digits)
   }
 
   // check the validity of the hex value
-  if (hex_value > 126 || (hex_value < 32 && !Util::get()->is_check_mode())) {
+  if (hex_value > 126 || hex_value < 32) {
     stringstream s;
     s << "ERROR (unsupported): contains unsupported hex value " << hex_value;
-    throw EgretException(s.str());
+    if (hex_value > 126)
+      throw EgretException(s.str());
+    unsupported_in_generation(s.str());
   }
 
   // return the hex value
@@ -78,6 +78,10 @@ public:
 
   vector <Token> get_tokens() { return tokens; }
 
+  // first error that test generation would have stopped at, empty if none
+  // (check mode scans past constructs only test generation rejects)
+  string get_gen_error() { return gen_error; }
+
   // scans through input string and creates a vector of tokens
   void init(string in);
 
@@ -125,6 +129,10 @@ private:
 
   vector <Token> tokens;	// stores the regular expression
   unsigned index;		// iterator
+  string gen_error;		// first error only test generation reports
+
+  // throws error in test generation mode, otherwise records it in gen_error
+  void unsupported_in_generation(string error);
 
   // get next character from input string
   char get_next_char(string in, unsigned int &idx);
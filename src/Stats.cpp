@@ -33,6 +33,21 @@ Stats::add(string tag, string name, int value)
   statList.push_back(stat);
 }
 
+void
+Stats::add_time(string stage, double seconds, unsigned int allocations)
+{
+  vector <Timing>::iterator it;
+  for (it = timeList.begin(); it != timeList.end(); it++) {
+    if (it->stage == stage) {
+      it->seconds += seconds;
+      it->allocations += allocations;
+      return;
+    }
+  }
+  Timing timing = { stage, seconds, allocations };
+  timeList.push_back(timing);
+}
+
 void
 Stats::print()
 {
@@ -51,5 +66,18 @@ Stats::print()
     cout << left << setw(WIDTH) << it->name << "| " << it->value << endl;
     prev_tag = it->tag;
   }
+
+  // stage times in milliseconds
+  vector <Timing>::iterator ti;
+  for (ti = timeList.begin(); ti != timeList.end(); ti++) {
+    if (ti == timeList.begin() && prev_tag != "") {
+      for (int i = 0; i < WIDTH + 8; i++) cout << "-";
+      cout << endl;
+    }
+    cout << left << setw(WIDTH) << ("Time " + ti->stage + " (ms)") << "| "
+         << fixed << setprecision(3) << ti->seconds * 1000 << endl;
+    cout << left << setw(WIDTH) << ("Objects " + ti->stage) << "| "
+         << ti->allocations << endl;
+  }
 }
   
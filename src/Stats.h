@@ -22,28 +22,74 @@
 #ifndef STATS_H
 #define STATS_H
 
+#include <chrono>
+#include <string>
 #include <vector>
+#include "Util.h"
 using namespace std;
 
 class Stats
 {
 
 public:
+
+  struct Stat {
+    string tag;
+    string name;
+    int value;
+  };
+
+  struct Timing {
+    string stage;
+    double seconds;
+    unsigned int allocations;   // objects the stage allocated in the run's arena
+  };
+
   // adds a stat to the list of stats
   void add(string tag, string name, int value);
 
+  // adds time spent and objects allocated in a stage (repeated stages accumulate)
+  void add_time(string stage, double seconds, unsigned int allocations = 0);
+
   // print the stats
   void print();
 
-private:
+  vector <Stat> get_stats() { return statList; }
+  vector <Timing> get_times() { return timeList; }
 
-  struct Stat {
-    string tag;
-    string name;
-    int value;
-  };
+private:
 
   vector <Stat> statList;
+  vector <Timing> timeList;
+};
+
+// Measures the wall clock time of a stage and the engine objects it allocates
+// (parse nodes, character sets, edges, ... - everything owned by the run's
+// arena, see Util::own) from construction until stop() (or destruction, so
+// stages cut short by an exception are still counted)
+class StageTimer
+{
+
+public:
+  StageTimer(Stats &s, string n) : stats(s), stage(n), running(true) {
+    start = chrono::steady_clock::now();
+    start_objects = Util::get()->get_arena()->size();
+  }
+  ~StageTimer() { stop(); }
+
+  void stop() {
+    if (!running) return;
+    running = false;
+    chrono::duration <double> elapsed = chrono::steady_clock::now() - start;
+    stats.add_time(stage, elapsed.count(), Util::get()->get_arena()->size() - start_objects);
+  }
+
+private:
+  Stats &stats;
+  string stage;
+  bool running;
+  chrono::steady_clock::time_point start;
+  unsigned int start_objects;
 };
 
 #endif // STATS_H
@@ -30,46 +30,77 @@
 #include "NFA.h"
 #include "Path.h"
 #include "TestGenerator.h"
+#include "Util.h"
 using namespace std;
 
 // TEST STRING GENERATION FUNCTIONS
 
-vector <string>
-TestGenerator::gen_test_strings()
+bool
+TestGenerator::next_string(string &s)
 {
-  vector <string>::iterator si;
-
-  // get initial strings
-  get_initial_strings();
-
-  // TODO: Move to egret.cpp after path processing?
-  // debug - print initial strings from basis paths
-  if (debug_mode) {
-    cout << "Initial Test Strings: " << endl;
-    for (si = test_strings.begin(); si != test_strings.end(); si++) {
-      cout << *si << endl;
+  while (true) {
+    // return the next string that was not returned before
+    while (pending_idx < pending.size()) {
+      string &candidate = pending[pending_idx++];
+      if (seen.insert(candidate).second) {
+        num_gen_strings++;
+        s = candidate;
+        return true;
+      }
     }
-  }
-
-  // gen minimum iteration strings
-  gen_min_iter_strings();
-
-  // gen evil strings
-  gen_evil_strings();
 
-  // TODO: Create a function that checks for duplicates each time a string is added?
-  // create return set with no duplicates
-  vector <string> return_strs;
-  for (si = test_strings.begin(); si != test_strings.end(); si++) {
-    if (!(std::find(return_strs.begin(), return_strs.end(), *si) != return_strs.end())) {
-      return_strs.insert(return_strs.begin(), *si);
-    }
+    pending.clear();
+    pending_idx = 0;
+    // the initial strings are cheap and already known, so they are
+    // returned even once the time budget is spent
+    if (stage != INITIAL_STAGE && Util::get()->out_of_time()) return false;
+    if (!gen_next_strings()) return false;
   }
+}
 
-  // record number of generated strings for stats
-  num_gen_strings = return_strs.size();
+// Strings are generated in stages: the initial strings of all paths, then
+// the minimum iteration string of each path, then the evil strings of each
+// path.  Later stages rely on the state left by earlier ones, so the order
+// must be kept even though strings are generated on demand.
+bool
+TestGenerator::gen_next_strings()
+{
+  switch (stage) {
+    case INITIAL_STAGE:
+      get_initial_strings();
+
+      // TODO: Move to egret.cpp after path processing?
+      // debug - print initial strings from basis paths
+      if (debug_mode) {
+        cout << "Initial Test Strings: " << endl;
+        for (unsigned int i = 0; i < pending.size(); i++) {
+          cout << pending[i] << endl;
+        }
+        cout << "Minimum Iteration Test Strings: " << endl;
+      }
+      stage = MIN_ITER_STAGE;
+      return true;
+
+    case MIN_ITER_STAGE:
+      if (path_idx < paths.size())
+        gen_min_iter_strings(paths[path_idx++]);
+      break;
+
+    case EVIL_STAGE:
+      if (path_idx < paths.size())
+        gen_evil_strings(paths[path_idx++]);
+      break;
+
+    case DONE_STAGE:
+      return false;
+  }
 
-  return return_strs;
+  // move to the next stage after the last path
+  if (path_idx >= paths.size()) {
+    stage = (stage == MIN_ITER_STAGE) ? EVIL_STAGE : DONE_STAGE;
+    path_idx = 0;
+  }
+  return true;
 }
 
 void
@@ -77,37 +108,24 @@ TestGenerator::get_initial_strings()
 {
   vector <Path>::iterator path_iter;
   for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++) {
-    test_strings.push_back(path_iter->get_test_string());
+    pending.push_back(path_iter->get_test_string());
   }
 }
 
 void
-TestGenerator::gen_min_iter_strings()
+TestGenerator::gen_min_iter_strings(Path &path)
 {
-  if (debug_mode) {
-    cout << "Minimum Iteration Test Strings: " << endl;
-  }
-
-  vector <Path>::iterator path_iter;
-  for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++) {
-    string min_iter_string = path_iter->gen_min_iter_string();
-    test_strings.push_back(min_iter_string);
-    if (debug_mode)
-      cout << min_iter_string << endl;
-  }
+  string min_iter_string = path.gen_min_iter_string();
+  pending.push_back(min_iter_string);
+  if (debug_mode)
+    cout << min_iter_string << endl;
 }
 
 void
-TestGenerator::gen_evil_strings()
+TestGenerator::gen_evil_strings(Path &path)
 {
-  vector <Path>::iterator path_iter;
-  for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++) {
-    vector <string> evil_strings = path_iter->gen_evil_strings(punct_marks);
-    vector <string>::iterator si;
-    for (si = evil_strings.begin(); si != evil_strings.end(); si++) {
-      test_strings.push_back(*si);
-    }
-  }
+  vector <string> evil_strings = path.gen_evil_strings(punct_marks);
+  pending.insert(pending.end(), evil_strings.begin(), evil_strings.end());
 }
 
 // STAT FUNCTION
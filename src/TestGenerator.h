@@ -27,6 +27,7 @@
 
 #include <set>
 #include <string>
+#include <unordered_set>
 #include <vector>
 #include "Path.h"
 using namespace std;
@@ -39,10 +40,16 @@ public:
     paths = p;
     punct_marks = m;
     debug_mode = d;
+    stage = INITIAL_STAGE;
+    path_idx = 0;
+    pending_idx = 0;
+    num_gen_strings = 0;
   }
 
-  // generate test strings
-  vector <string> gen_test_strings();
+  // sets s to the next new test string in generation order, returns false
+  // when all strings have been generated or the time budget of the run is
+  // spent (strings are generated on demand)
+  bool next_string(string &s);
 
   // add test generation stats
   void add_stats(Stats &stats);
@@ -53,19 +60,29 @@ private:
   set <char> punct_marks;	// set of punct marks
   bool debug_mode;		// set if debug mode is on
 
-  vector <string> test_strings;     // list of test strings
+  // generation stages, in order
+  enum Stage { INITIAL_STAGE, MIN_ITER_STAGE, EVIL_STAGE, DONE_STAGE };
+
+  Stage stage;                      // current generation stage
+  unsigned int path_idx;            // next path to generate strings for
+  vector <string> pending;          // generated strings not yet returned
+  unsigned int pending_idx;         // next pending string
+  unordered_set <string> seen;      // strings returned so far
 
   int num_gen_strings;          // number of generated strings (for stats)
 
   // TEST STRING GENERATION FUNCTIONS
 
+  // generates the next batch of strings into pending, returns false when done
+  bool gen_next_strings();
+
   // get initial set of strings
   void get_initial_strings();
 
-  // generate minimum iteration strings
-  void gen_min_iter_strings();
+  // generate minimum iteration string for a path
+  void gen_min_iter_strings(Path &path);
 
-  // generates evil strings
-  void gen_evil_strings();
+  // generates evil strings for a path
+  void gen_evil_strings(Path &path);
 };
 #endif // TEST_GENERATOR_H
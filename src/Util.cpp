@@ -1,4 +1,4 @@
-/*  Util.cpp: Singleton utility class
+/*  Util.cpp: Per-run utility class
 
     Copyright (C) 2016-2018  Eric Larson and Anna Kirk
     elarson@seattleu.edu
@@ -24,25 +24,63 @@
 #include "Util.h"
 using namespace std;
 
-// global static pointer for singleton class
-Util* Util::inst = NULL;
+// context of the run in progress, one per thread
+thread_local Util* Util::curr = NULL;
 
 Util *
 Util::get() 
 {
-  if (inst == NULL) inst = new Util;
-  return inst;
+  // callers outside of a run get a default context for their thread
+  static thread_local Util fallback;
+  if (curr == NULL) return &fallback;
+  return curr;
+}
+
+Arena *
+Util::get_arena()
+{
+  // objects made outside of a run live as long as the thread
+  static thread_local Arena fallback;
+  if (arena == NULL) return &fallback;
+  return arena;
 }
 
 void
-Util::init(string r, bool c, bool w, string s)
+Util::init(string r, bool c, string s)
 {
   regex = r;
   check_mode = c;
-  web_mode = w;
   base_substring = s;
   alerts.clear();
   prev_alerts.clear();
+  char_sets.clear();
+  budget = Budget();
+  truncated = false;
+}
+
+void
+Util::set_budget(Budget b)
+{
+  budget = b;
+  deadline = chrono::steady_clock::now() +
+    chrono::duration_cast<chrono::steady_clock::duration>(chrono::duration<double>(b.seconds));
+}
+
+bool
+Util::out_of_time()
+{
+  if (budget.seconds <= 0) return false;
+  if (chrono::steady_clock::now() < deadline) return false;
+  truncated = true;
+  return true;
+}
+
+CharSetMembers *
+Util::find_members(const string &key)
+{
+  map <string, CharSetMembers *>::iterator it = char_sets.find(key);
+  if (it == char_sets.end()) return NULL;
+  return it->second;
 }
 
 void
@@ -51,11 +89,6 @@ Util::add_alert(Alert alert)
   // Create type, location pair
   pair <string, int> alert_pair = make_pair(alert.type, alert.loc1.first);
 
-  // Line break
-  string lb = web_mode ? "<br>" : "\n";
-  string start = web_mode ? "<mark>" : "\033[33;44;1m";
-  string end = web_mode ? "</mark>" : "\033[0m";
-
   if (prev_alerts.find(alert_pair) == prev_alerts.end()) {
     // New error - add to list of previous alerts
     prev_alerts.insert(alert_pair);
@@ -65,8 +98,42 @@ Util::add_alert(Alert alert)
     return;
   }
 
+  alerts.push_back(alert);
+}
+
+vector <Alert>
+Util::get_alerts()
+{
+  if (!check_mode) return alerts;
+
   // Ignore warnings in check mode (warnings only relevant in test generation mode)
-  if (alert.warning && check_mode) return;
+  vector <Alert> check_alerts;
+  for (unsigned int i = 0; i < alerts.size(); i++) {
+    if (!alerts[i].warning) check_alerts.push_back(alerts[i]);
+  }
+  return check_alerts;
+}
+
+string
+canonical_char(char c)
+{
+  if (isalnum((unsigned char) c))
+    return string(1, c);
+
+  const char *HEX_DIGITS = "0123456789abcdef";
+  string s = "\\x";
+  s += HEX_DIGITS[(unsigned char) c >> 4];
+  s += HEX_DIGITS[(unsigned char) c & 0xf];
+  return s;
+}
+
+string
+format_alert(const Alert &alert, const string &regex, bool web_mode)
+{
+  // Line break
+  string lb = web_mode ? "<br>" : "\n";
+  string start = web_mode ? "<mark>" : "\033[33;44;1m";
+  string end = web_mode ? "</mark>" : "\033[0m";
 
   // Produce alert message
   stringstream s;
@@ -74,7 +141,12 @@ Util::add_alert(Alert alert)
     s << "WARNING (";
   else
     s << "VIOLATION (";
-  s << alert.type << "): " << alert.message << lb;
+  s << alert.type << "): " << alert.message;
+  for (unsigned int i = 0; i < alert.anchor_examples.size(); i++) {
+    s << lb << "..." << alert.anchor_examples[i].first << ": "
+      << alert.anchor_examples[i].second;
+  }
+  s << lb;
   
   if (alert.loc1.first != -1) {
     s << "...Regex: ";
@@ -98,5 +170,9 @@ Util::add_alert(Alert alert)
   if (alert.has_example) {
     s << "...Example accepted string: " << alert.example << lb;
   }
-  alerts.push_back(s.str());
+
+  if (alert.has_attack) {
+    s << "...Attack string: " << alert.attack << lb;
+  }
+  return s.str();
 }
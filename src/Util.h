@@ -1,4 +1,4 @@
-/*  Util.h: Singleton utility class
+/*  Util.h: Per-run utility class
 
     Copyright (C) 2016-2018  Eric Larson and Anna Kirk
     elarson@seattleu.edu
@@ -22,11 +22,16 @@
 #ifndef ERROR_H
 #define ERROR_H
 
+#include <chrono>
+#include <map>
 #include <set>
 #include <string>
 #include <vector>
+#include "Arena.h"
 using namespace std;
 
+struct CharSetMembers;
+
 // Location
 typedef pair <int, int> Location;
 
@@ -39,69 +44,141 @@ struct Alert {
   string suggest;
   bool has_example;
   string example;
+  bool has_attack;
+  string attack;                // string a backtracking matcher is slow to reject
   Location loc1;
   Location loc2;
+  vector <pair <string, string> > anchor_examples;  // (label, string) pairs
 
   Alert(string t, string m) { 
     warning = false; type = t; message = m; has_suggest = false; has_example = false;
-    loc1 = make_pair(-1, -1); loc2 = make_pair(-1, -1);
+    has_attack = false; loc1 = make_pair(-1, -1); loc2 = make_pair(-1, -1);
   }
   Alert(string t, string m, Location l1) { 
     warning = false; type = t; message = m; has_suggest = false; has_example = false;
-    loc1 = l1; loc2 = make_pair(-1, -1);
+    has_attack = false; loc1 = l1; loc2 = make_pair(-1, -1);
   }
   Alert(string t, string m, Location l1, Location l2) { 
     warning = false; type = t; message = m; has_suggest = false; has_example = false;
-    loc1 = l1; loc2 = l2;
+    has_attack = false; loc1 = l1; loc2 = l2;
   }
   Alert(string t, string m, string s) { 
     warning = false; type = t; message = m; has_suggest = true; has_example = false;
-    suggest = s; loc1 = make_pair(-1, -1); loc2 = make_pair(-1, -1);
+    has_attack = false; suggest = s; loc1 = make_pair(-1, -1); loc2 = make_pair(-1, -1);
   }
   Alert(string t, string m, string s, Location l1) { 
     warning = false; type = t; message = m; has_suggest = true; has_example = false;
-    suggest = s; loc1 = l1; loc2 = make_pair(-1, -1);
+    has_attack = false; suggest = s; loc1 = l1; loc2 = make_pair(-1, -1);
     
   }
   Alert(string t, string m, string s, Location l1, Location l2) { 
     warning = false; type = t; message = m; has_suggest = true; has_example = false;
-    suggest = s; loc1 = l1; loc2 = l2;
+    has_attack = false; suggest = s; loc1 = l1; loc2 = l2;
   }
 };
 
+// Budget: limits on a run, a run that reaches one stops early and keeps
+// the alerts and strings found so far (zero means no limit)
+struct Budget {
+  double seconds;               // time for the whole run
+  int max_strings;              // test strings to generate
+
+  Budget(double s = 0, int m = 0) { seconds = s; max_strings = m; }
+};
+
+// Pump: a test string split around a substring that can be repeated, the
+// string prefix + pump * n + suffix follows the same path for every n
+struct Pump {
+  string prefix;
+  string pump;
+  string suffix;
+
+  Pump() {}
+  Pump(string p, string s, string x) { prefix = p; pump = s; suffix = x; }
+};
+
 class Util {
 
 public:
+  Util() { arena = NULL; truncated = false; };
+
+  // returns the context of the run in progress on the calling thread
   static Util* get();
 
-  void init(string r, bool c, bool w, string s);
+  void init(string r, bool c, string s);
+
+  // switches the mode of a run in progress, keeping the alerts found so far
+  void set_mode(bool c, string s) { check_mode = c; base_substring = s; }
 
   bool is_check_mode() { return check_mode; }
-  bool is_web_mode() { return web_mode; }
   string get_base_substring() { return base_substring; }
   string get_regex() { return regex; }
-  vector<string> get_alerts() { return alerts; }
+  vector<Alert> get_alerts();
+
+  // Objects: everything allocated by the run is owned by its arena
+  void set_arena(Arena *a) { arena = a; }
+  Arena *get_arena();
+  template <class T>
+  T *own(T *obj) { return get_arena()->adopt(obj); }
+
+  // Budget: checked during path enumeration, path processing and generation
+  void set_budget(Budget b);
+  bool out_of_time();
+  bool at_string_limit(int count) { return budget.max_strings > 0 && count >= budget.max_strings; }
+  void set_truncated() { truncated = true; }
+  bool is_truncated() { return truncated; }
+
+  // Character sets: members of the sets seen so far, by item key
+  CharSetMembers *find_members(const string &key);
+  void add_members(const string &key, CharSetMembers *m) { char_sets[key] = m; }
 
   // Alerts 
   void add_alert(Alert alert);
 
 // TODO: Possibly create a new regex class where the "fixing" functions reside?
 private:
-  Util() {};            // singleton class, private constructor
-  static Util *inst;
+  friend class UtilScope;
+  static thread_local Util *curr;               // context installed on this thread
 
-  // Global options
+  // Run options
   bool check_mode;
-  bool web_mode;
   string base_substring; 
 
   string regex;                                 // original regular expression
 
+  Arena *arena;                                 // owner of the run's objects
+  map <string, CharSetMembers *> char_sets;     // interned character set members
+
+  // Budget
+  Budget budget;
+  chrono::steady_clock::time_point deadline;    // end of the time budget
+  bool truncated;                               // true once a budget ran out
+
   // Alerts
-  vector <string> alerts;                       // vector of alert strings
+  vector <Alert> alerts;                        // alerts in the order found (all modes)
   set <pair <string, int> > prev_alerts;         // all previous alerts
 
 };
+
+// Returns a character as written in a canonical form: letters and digits as
+// themselves, other characters as hex escapes (dropping redundant escapes
+// such as \- or \/)
+string canonical_char(char c);
+
+// Formats an alert as text (ANSI highlighting) or as HTML (web mode)
+string format_alert(const Alert &alert, const string &regex, bool web_mode);
+
+// Installs a context as the current one for the calling thread while the scope
+// lives, so that concurrent runs on different threads never share state
+class UtilScope {
+
+public:
+  UtilScope(Util *util) { prev = Util::curr; Util::curr = util; }
+  ~UtilScope() { Util::curr = prev; }
+
+private:
+  Util *prev;                                   // context to restore on exit
+};
      
 // TODO: Can this exception be folded into util class above?
 // TODO: One idea is to add an add_error function that throws an exception that is caught at
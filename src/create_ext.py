@@ -23,7 +23,9 @@ from distutils.core import setup, Extension
 module1 = Extension('egret_ext',
                     sources = ['egret_ext.cpp'],
                     libraries = ['egret'],
-                    library_dirs = ['.'])
+                    library_dirs = ['.'],
+                    extra_compile_args = ['-std=c++11', '-pthread'],
+                    extra_link_args = ['-pthread'])
 
 setup(name = 'Egret',
       version = '1.0',
@@ -24,6 +24,8 @@
 #include <string>
 #include <vector>
 #include "Checker.h"
+#include "egret.h"
+#include "Matcher.h"
 #include "NFA.h"
 #include "ParseTree.h"
 #include "Path.h"
@@ -34,31 +36,42 @@
 
 using namespace std;
 
-vector<string>
-run_engine(string regex, string base_substring, bool check_mode, bool web_mode,
-           bool debug_mode, bool stat_mode)
+// throws an error if the base substring cannot be used
+static void
+validate_base_substring(string base_substring)
 {
-  Stats stats;
-  vector<string> test_strings;
+  if (base_substring.length() < 2)
+  {
+    throw EgretException("ERROR (bad arguments): Base substring must have at least two letters");
+  }
+  for (unsigned int i = 0; i < base_substring.length(); i++)
+  {
+    if (!isalpha(base_substring[i]))
+    {
+      throw EgretException("ERROR (bad arguments): Base substring can only contain letters");
+    }
+  }
+}
+
+EngineRun::EngineRun(string regex, string base_substring, bool check_mode,
+                     bool debug_mode, Budget budget)
+{
+  gen = NULL;
+  num_strings = 0;
+
+  // all per-run state lives in this context, which makes the engine reentrant
+  UtilScope scope(&util);
+  util.set_arena(&arena);
 
   try
   {
 
-    // check and convert base substring
-    if (base_substring.length() < 2)
-    {
-      throw EgretException("ERROR (bad arguments): Base substring must have at least two letters");
-    }
-    for (unsigned int i = 0; i < base_substring.length(); i++)
-    {
-      if (!isalpha(base_substring[i]))
-      {
-        throw EgretException("ERROR (bad arguments): Base substring can only contain letters");
-      }
-    }
+    // check base substring
+    validate_base_substring(base_substring);
 
-    // set global options
-    Util::get()->init(regex, check_mode, web_mode, base_substring);
+    // set run options
+    util.init(regex, check_mode, base_substring);
+    util.set_budget(budget);
 
     // start debug mode
     if (debug_mode)
@@ -66,65 +79,404 @@ run_engine(string regex, string base_substring, bool check_mode, bool web_mode,
 
     // initialize scanner with regex
     Scanner scanner;
+    StageTimer scanner_timer(stats, "scanner");
     scanner.init(regex);
+    scanner_timer.stop();
     if (debug_mode)
       scanner.print();
-    if (stat_mode)
-      scanner.add_stats(stats);
+    scanner.add_stats(stats);
 
     // build parse tree
     ParseTree tree;
+    StageTimer tree_timer(stats, "parse_tree");
     tree.build(scanner);
+    tree_timer.stop();
     if (debug_mode)
       tree.print();
-    if (stat_mode)
-      tree.add_stats(stats);
+    tree.add_stats(stats);
 
     // build NFA
     NFA nfa;
+    StageTimer nfa_timer(stats, "nfa");
     nfa.build(tree);
+    nfa_timer.stop();
     if (debug_mode)
       nfa.print();
-    if (stat_mode)
-      nfa.add_stats(stats);
+    nfa.add_stats(stats);
 
     // traverse NFA basis paths and process them
+    StageTimer paths_timer(stats, "basis_paths");
     vector<Path> paths = nfa.find_basis_paths();
+    paths_timer.stop();
+    StageTimer process_timer(stats, "process_paths");
     vector<Path>::iterator path_iter;
     for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++)
     {
+      // out of time --> check and generate from the processed paths only
+      if (util.out_of_time())
+      {
+        paths.erase(path_iter, paths.end());
+        break;
+      }
       path_iter->process_path();
     }
+    process_timer.stop();
 
     // run checker
     if (check_mode)
     {
-      Checker checker(paths, scanner.get_tokens());
+      StageTimer checker_timer(stats, "checker");
+      Checker checker(paths, scanner.get_tokens(), tree.get_root());
       checker.check();
     }
 
-    // generate tests
+    // set up test generation (strings are generated by next_string), the
+    // backtracking check only needs the tree so it runs in this mode too
     if (!check_mode)
     {
-      TestGenerator gen(paths, tree.get_punct_marks(), debug_mode);
-      test_strings = gen.gen_test_strings();
-      if (stat_mode)
-        gen.add_stats(stats);
+      Checker checker(vector<Path>(), scanner.get_tokens(), tree.get_root());
+      checker.check_redos();
+      gen = new TestGenerator(paths, tree.get_punct_marks(), debug_mode);
     }
+  }
+  catch (EgretException const &e)
+  {
+    error = e.get_error();
+  }
+}
 
-    // print stats
-    if (stat_mode)
-      stats.print();
+EngineRun::~EngineRun()
+{
+  delete gen;
+}
+
+bool
+EngineRun::next_string(string &s)
+{
+  if (gen == NULL || !error.empty())
+    return false;
+
+  UtilScope scope(&util);
+  StageTimer gen_timer(stats, "test_generator");
+  try
+  {
+    // a string past the limit only shows that the output was cut short
+    if (gen->next_string(s))
+    {
+      if (!util.at_string_limit(num_strings))
+      {
+        num_strings++;
+        return true;
+      }
+      util.set_truncated();
+    }
   }
   catch (EgretException const &e)
   {
-    vector<string> result;
-    result.push_back(e.get_error());
+    error = e.get_error();
+    return false;
+  }
+
+  // generation is complete (or stopped by the budget), record its counters once
+  gen_timer.stop();
+  gen->add_stats(stats);
+  delete gen;
+  gen = NULL;
+  return false;
+}
+
+EngineResult
+analyze_engine(string regex, string base_substring, bool check_mode,
+               bool debug_mode, bool stat_mode, Budget budget)
+{
+  EngineResult result;
+  EngineRun run(regex, base_substring, check_mode, debug_mode, budget);
+
+  // generate tests, the latest generated string comes first
+  string s;
+  while (run.next_string(s))
+  {
+    result.test_strings.push_back(s);
+  }
+  reverse(result.test_strings.begin(), result.test_strings.end());
+
+  result.stats = run.get_stats();
+  result.truncated = run.is_truncated();
+  result.error = run.get_error();
+  if (!result.error.empty())
+  {
+    result.test_strings.clear();
     return result;
   }
 
-  // Add alerts to front of list.
-  vector<string> alerts = Util::get()->get_alerts();
+  // print stats
+  if (stat_mode)
+    run.get_stats().print();
+
+  result.alerts = run.get_alerts();
+  return result;
+}
+
+pair <EngineResult, EngineResult>
+analyze_both(string regex, string check_base_substring, string gen_base_substring)
+{
+  EngineResult check_result;
+  EngineResult gen_result;
+  Stats stats;
+  Arena arena;                  // outlives everything below that points into it
+  Util util;
+  UtilScope scope(&util);
+  util.set_arena(&arena);
+
+  // base substrings are checked before the regex, as in separate runs
+  try
+  {
+    validate_base_substring(check_base_substring);
+  }
+  catch (EgretException const &e)
+  {
+    check_result.error = e.get_error();
+  }
+  try
+  {
+    validate_base_substring(gen_base_substring);
+  }
+  catch (EgretException const &e)
+  {
+    gen_result.error = e.get_error();
+  }
+  if (!check_result.error.empty() && !gen_result.error.empty())
+    return make_pair(check_result, gen_result);
+
+  // scan in check mode, the scanner keeps the first error test generation
+  // would have stopped at
+  util.init(regex, true, check_base_substring);
+  Scanner scanner;
+  ParseTree tree;
+  NFA nfa;
+  vector<Path> paths;
+  try
+  {
+    StageTimer scanner_timer(stats, "scanner");
+    scanner.init(regex);
+    scanner_timer.stop();
+    scanner.add_stats(stats);
+
+    StageTimer tree_timer(stats, "parse_tree");
+    tree.build(scanner);
+    tree_timer.stop();
+    tree.add_stats(stats);
+
+    StageTimer nfa_timer(stats, "nfa");
+    nfa.build(tree);
+    nfa_timer.stop();
+    nfa.add_stats(stats);
+
+    StageTimer paths_timer(stats, "basis_paths");
+    paths = nfa.find_basis_paths();
+  }
+  catch (EgretException const &e)
+  {
+    if (check_result.error.empty())
+      check_result.error = e.get_error();
+    if (gen_result.error.empty())
+      gen_result.error = scanner.get_gen_error().empty() ? e.get_error() : scanner.get_gen_error();
+    check_result.stats = stats;
+    gen_result.stats = stats;
+    return make_pair(check_result, gen_result);
+  }
+  if (gen_result.error.empty())
+    gen_result.error = scanner.get_gen_error();
+
+  // alerts and stats up to here are shared by both modes
+  Util shared_util = util;
+  Stats shared_stats = stats;
+  vector<Path>::iterator path_iter;
+
+  // check mode: process the paths and run the checker
+  if (check_result.error.empty())
+  {
+    try
+    {
+      StageTimer process_timer(stats, "process_paths");
+      for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++)
+      {
+        path_iter->process_path();
+      }
+      process_timer.stop();
+
+      StageTimer checker_timer(stats, "checker");
+      Checker checker(paths, scanner.get_tokens(), tree.get_root());
+      checker.check();
+      checker_timer.stop();
+      check_result.alerts = util.get_alerts();
+    }
+    catch (EgretException const &e)
+    {
+      check_result.error = e.get_error();
+    }
+  }
+  check_result.stats = stats;
+
+  // test generation mode: process the paths again from scratch and
+  // generate the strings
+  if (gen_result.error.empty())
+  {
+    util = shared_util;
+    util.set_mode(false, gen_base_substring);
+    stats = shared_stats;
+    nfa.reset_edges();
+    try
+    {
+      StageTimer process_timer(stats, "process_paths");
+      for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++)
+      {
+        path_iter->process_path();
+      }
+      process_timer.stop();
+
+      Checker checker(vector<Path>(), scanner.get_tokens(), tree.get_root());
+      checker.check_redos();
+      TestGenerator gen(paths, tree.get_punct_marks(), false);
+      StageTimer gen_timer(stats, "test_generator");
+      string s;
+      while (gen.next_string(s))
+      {
+        gen_result.test_strings.push_back(s);
+      }
+      gen_timer.stop();
+      gen.add_stats(stats);
+      reverse(gen_result.test_strings.begin(), gen_result.test_strings.end());
+      gen_result.alerts = util.get_alerts();
+    }
+    catch (EgretException const &e)
+    {
+      gen_result.error = e.get_error();
+      gen_result.test_strings.clear();
+    }
+  }
+  gen_result.stats = stats;
+
+  return make_pair(check_result, gen_result);
+}
+
+bool
+canonical_form(string regex, string &form)
+{
+  Arena arena;
+  Util util;
+  UtilScope scope(&util);
+  util.set_arena(&arena);
+
+  try
+  {
+    util.init(regex, false, "evil");
+    Scanner scanner;
+    scanner.init(regex);
+    ParseTree tree;
+    tree.build(scanner);
+    form = tree.canonical_form();
+  }
+  catch (EgretException const &e)
+  {
+    return false;
+  }
+  return true;
+}
+
+bool
+find_pumps(string regex, string base_substring, vector <Pump> &pumps)
+{
+  Arena arena;
+  Util util;
+  UtilScope scope(&util);
+  util.set_arena(&arena);
+
+  // check mode scans escapes such as \n that test generation rejects
+  try
+  {
+    validate_base_substring(base_substring);
+    util.init(regex, true, base_substring);
+    Scanner scanner;
+    scanner.init(regex);
+    ParseTree tree;
+    tree.build(scanner);
+    NFA nfa;
+    nfa.build(tree);
+    vector<Path> paths = nfa.find_basis_paths();
+
+    pumps.clear();
+    vector<Path>::iterator path_iter;
+    for (path_iter = paths.begin(); path_iter != paths.end(); path_iter++)
+    {
+      path_iter->process_path();
+      vector<Pump> path_pumps = path_iter->get_pumps();
+      pumps.insert(pumps.end(), path_pumps.begin(), path_pumps.end());
+    }
+  }
+  catch (EgretException const &e)
+  {
+    return false;
+  }
+  return true;
+}
+
+bool
+classify_strings(string regex, const vector<string> &strings, bool full_match,
+                 vector<int> &matched)
+{
+  Arena arena;
+  Util util;
+  UtilScope scope(&util);
+  util.set_arena(&arena);
+
+  // check mode scans escapes such as \n that test generation rejects
+  Matcher matcher;
+  try
+  {
+    util.init(regex, true, "evil");
+    Scanner scanner;
+    scanner.init(regex);
+    ParseTree tree;
+    tree.build(scanner);
+    if (!matcher.build(tree))
+      return false;
+  }
+  catch (EgretException const &e)
+  {
+    return false;
+  }
+
+  matched.clear();
+  for (unsigned int i = 0; i < strings.size(); i++)
+  {
+    matched.push_back(matcher.matches(strings[i], full_match));
+  }
+  return true;
+}
+
+vector<string>
+run_engine(string regex, string base_substring, bool check_mode, bool web_mode,
+           bool debug_mode, bool stat_mode, Budget budget)
+{
+  EngineResult result =
+    analyze_engine(regex, base_substring, check_mode, debug_mode, stat_mode, budget);
+  if (!result.error.empty())
+  {
+    return vector<string>(1, result.error);
+  }
+
+  // Add alerts to front of list, after the truncation notice.
+  vector<string> alerts;
+  if (result.truncated)
+  {
+    alerts.push_back("WARNING (truncated): the run ran out of budget, "
+                     "the alerts and strings are partial");
+  }
+  for (unsigned int i = 0; i < result.alerts.size(); i++)
+  {
+    alerts.push_back(format_alert(result.alerts[i], regex, web_mode));
+  }
   if (check_mode)
   {
     if (alerts.size() == 0)
@@ -133,6 +485,7 @@ run_engine(string regex, string base_substring, bool check_mode, bool web_mode,
     }
     return alerts;
   }
+  vector<string> test_strings = result.test_strings;
   test_strings.insert(test_strings.begin(), "BEGIN");
   test_strings.insert(test_strings.begin(), alerts.begin(), alerts.end());
 
@@ -23,12 +23,105 @@
 #define EGRET_H
 
 #include <string>
+#include <utility>
 #include <vector>
+#include "Arena.h"
+#include "Stats.h"
+#include "TestGenerator.h"
+#include "Util.h"
 using namespace std;
 
-// run_engine: entry point into EGRET engine
+// EngineResult: outcome of a single engine run
+struct EngineResult {
+  string error;                 // error message, empty if the run succeeded
+  vector <Alert> alerts;        // violations and warnings in the order found
+  vector <string> test_strings; // generated strings (test generation mode only)
+  Stats stats;                  // per-stage counters and times
+  bool truncated;               // true if a budget ran out, results are partial
+
+  EngineResult() { truncated = false; }
+};
+
+// EngineRun: an engine run whose test strings are generated on demand
+class EngineRun {
+
+public:
+
+  // scans and parses the regex, builds the NFA and processes its basis paths
+  // (and runs the checker in check mode), errors are kept for get_error
+  EngineRun(string regex, string base_substring, bool check_mode = false,
+      bool debug_mode = false, Budget budget = Budget());
+  ~EngineRun();
+
+  // error message, empty if the run has not failed
+  string get_error() { return error; }
+
+  // alerts found so far
+  vector <Alert> get_alerts() { return util.get_alerts(); }
+
+  // true if the budget ran out, the alerts and strings are then partial
+  bool is_truncated() { return util.is_truncated(); }
+
+  // sets s to the next test string (in generation order, without duplicates),
+  // returns false when there are no more strings or the run failed
+  bool next_string(string &s);
+
+  // per-stage counters and times (test generator stats are added once
+  // all strings have been generated)
+  Stats &get_stats() { return stats; }
+
+private:
+
+  EngineRun(const EngineRun &);                 // not copyable
+  EngineRun &operator=(const EngineRun &);
+
+  Arena arena;                  // owner of the run's parse tree and NFA objects
+  Util util;                    // run context, installed for every call
+  Stats stats;                  // per-stage counters and times
+  TestGenerator *gen;           // test generator (NULL in check mode or when done)
+  int num_strings;              // strings returned so far
+  string error;                 // error message, empty if no error
+};
+
+// analyze_engine: runs the engine and returns structured results
+EngineResult
+analyze_engine(string regex, string base_substring,
+    bool check_mode = false, bool debug_mode = false, bool stat_mode = false,
+    Budget budget = Budget());
+
+// analyze_both: runs the engine once for check mode and test generation,
+// sharing scanning, parsing, NFA construction and basis path enumeration,
+// returns the (check mode, test generation) results
+pair <EngineResult, EngineResult>
+analyze_both(string regex, string check_base_substring, string gen_base_substring);
+
+// canonical_form: sets form to a form of the regex shared by the regexes
+// that differ only in redundant escapes, the spelling of their character
+// sets (e.g. [0-9] and \d) or the order of set items, returns false if the
+// regex cannot be parsed
+bool
+canonical_form(string regex, string &form);
+
+// find_pumps: sets pumps to the substrings of the test strings that an
+// unbounded loop or string can repeat, one per loop (see Pump), returns false
+// if the regex cannot be analyzed
+bool
+find_pumps(string regex, string base_substring, vector <Pump> &pumps);
+
+// classify_strings: sets matched[i] to 1 if the regex matches strings[i]
+// (anywhere in it, or all of it with full_match), 0 if it does not and -1
+// if the string cannot be decided (see Matcher), returns false if the
+// regex cannot be parsed or uses a construct the matcher does not model
+bool
+classify_strings(string regex, const vector <string> &strings, bool full_match,
+    vector <int> &matched);
+
+// run_engine: entry point into EGRET engine, returns the formatted alerts
+// followed by "BEGIN" and the test strings (or only the alerts in check mode),
+// a run that ran out of budget starts with a "WARNING (truncated)" line
 vector <string>
 run_engine(string regex, string base_substring,
-    bool check_mode = false, bool web_mode = false, bool debug_mode = false, bool stat_mode = false);
+    bool check_mode = false, bool web_mode = false, bool debug_mode = false, bool stat_mode = false,
+    Budget budget = Budget());
 
 #endif // EGRET_H
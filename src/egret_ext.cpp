@@ -20,41 +20,686 @@
 */
 
 #include <Python.h>
+#include <atomic>
+#include <exception>
 #include <string>
+#include <thread>
 #include <vector>
 #include "egret.h"
 using namespace std;
 
 static PyObject *EgretExtError;
 
+// Structured results: egret_ext.Alert and egret_ext.Result
+
+static PyTypeObject AlertType;
+static PyTypeObject ResultType;
+
+static PyStructSequence_Field alert_fields[] = {
+  {(char *) "kind", (char *) "'violation' or 'warning'"},
+  {(char *) "type", (char *) "alert type, e.g. 'anchor usage'"},
+  {(char *) "message", (char *) "description of the problem"},
+  {(char *) "locations", (char *) "tuple of (start, end) regex spans to highlight"},
+  {(char *) "suggestion", (char *) "suggested fix or None"},
+  {(char *) "example", (char *) "example accepted string or None"},
+  {(char *) "anchor_examples", (char *) "tuple of (label, string) pairs"},
+  {(char *) "attack", (char *) "string a backtracking matcher is slow to reject or None"},
+  {NULL, NULL}
+};
+
+static PyStructSequence_Desc alert_desc = {
+  (char *) "egret_ext.Alert", (char *) "Alert reported by the engine.", alert_fields, 8
+};
+
+static PyStructSequence_Field result_fields[] = {
+  {(char *) "error", (char *) "error message or None"},
+  {(char *) "alerts", (char *) "tuple of Alert"},
+  {(char *) "test_strings", (char *) "tuple of generated strings"},
+  {(char *) "stats", (char *) "dict with per-stage 'times' (seconds), 'allocations' (engine objects) and 'counts'"},
+  {(char *) "truncated", (char *) "True if a budget ran out and the results are partial"},
+  {NULL, NULL}
+};
+
+static PyStructSequence_Desc result_desc = {
+  (char *) "egret_ext.Result", (char *) "Outcome of an engine run.", result_fields, 5
+};
+
+// returns s as a Python string, or None if has_value is false
+static PyObject *
+optional_str(bool has_value, const string &s)
+{
+  if (has_value)
+    return PyUnicode_FromString(s.c_str());
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+alert_to_python(const Alert &alert)
+{
+  PyObject *obj = PyStructSequence_New(&AlertType);
+  if (obj == NULL)
+    return NULL;
+
+  PyObject *locations;
+  if (alert.loc1.first == -1)
+    locations = PyTuple_New(0);
+  else if (alert.loc2.first == -1)
+    locations = Py_BuildValue("((ii))", alert.loc1.first, alert.loc1.second);
+  else
+    locations = Py_BuildValue("((ii)(ii))", alert.loc1.first, alert.loc1.second,
+        alert.loc2.first, alert.loc2.second);
+
+  PyObject *anchor_examples = PyTuple_New(alert.anchor_examples.size());
+  for (unsigned int i = 0; anchor_examples && i < alert.anchor_examples.size(); i++) {
+    PyTuple_SET_ITEM(anchor_examples, i, Py_BuildValue("(ss)",
+        alert.anchor_examples[i].first.c_str(), alert.anchor_examples[i].second.c_str()));
+  }
+
+  PyStructSequence_SET_ITEM(obj, 0, PyUnicode_FromString(alert.warning ? "warning" : "violation"));
+  PyStructSequence_SET_ITEM(obj, 1, PyUnicode_FromString(alert.type.c_str()));
+  PyStructSequence_SET_ITEM(obj, 2, PyUnicode_FromString(alert.message.c_str()));
+  PyStructSequence_SET_ITEM(obj, 3, locations);
+  PyStructSequence_SET_ITEM(obj, 4, optional_str(alert.has_suggest, alert.suggest));
+  PyStructSequence_SET_ITEM(obj, 5, optional_str(alert.has_example, alert.example));
+  PyStructSequence_SET_ITEM(obj, 6, anchor_examples);
+  PyStructSequence_SET_ITEM(obj, 7, optional_str(alert.has_attack, alert.attack));
+
+  if (PyErr_Occurred()) {
+    Py_DECREF(obj);
+    return NULL;
+  }
+  return obj;
+}
+
+// stats as {'times': {stage: seconds}, 'allocations': {stage: objects},
+// 'counts': {name: value}}
 static PyObject *
-egret_run(PyObject *self, PyObject *args)
+stats_to_python(Stats stats)
 {
+  PyObject *times = PyDict_New();
+  PyObject *allocations = PyDict_New();
+  PyObject *counts = PyDict_New();
+  if (times == NULL || allocations == NULL || counts == NULL) {
+    Py_XDECREF(times);
+    Py_XDECREF(allocations);
+    Py_XDECREF(counts);
+    return NULL;
+  }
+
+  vector <Stats::Timing> timings = stats.get_times();
+  for (unsigned int i = 0; i < timings.size(); i++) {
+    PyObject *value = PyFloat_FromDouble(timings[i].seconds);
+    if (value == NULL || PyDict_SetItemString(times, timings[i].stage.c_str(), value) < 0)
+      PyErr_Clear();
+    Py_XDECREF(value);
+    value = PyLong_FromUnsignedLong(timings[i].allocations);
+    if (value == NULL || PyDict_SetItemString(allocations, timings[i].stage.c_str(), value) < 0)
+      PyErr_Clear();
+    Py_XDECREF(value);
+  }
+  vector <Stats::Stat> stat_list = stats.get_stats();
+  for (unsigned int i = 0; i < stat_list.size(); i++) {
+    PyObject *value = PyLong_FromLong(stat_list[i].value);
+    if (value == NULL || PyDict_SetItemString(counts, stat_list[i].name.c_str(), value) < 0)
+      PyErr_Clear();
+    Py_XDECREF(value);
+  }
+
+  return Py_BuildValue("{sNsNsN}", "times", times, "allocations", allocations,
+                       "counts", counts);
+}
+
+static PyObject *
+result_to_python(const EngineResult &result)
+{
+  PyObject *obj = PyStructSequence_New(&ResultType);
+  if (obj == NULL)
+    return NULL;
+
+  PyObject *alerts = PyTuple_New(result.alerts.size());
+  for (unsigned int i = 0; alerts && i < result.alerts.size(); i++) {
+    PyTuple_SET_ITEM(alerts, i, alert_to_python(result.alerts[i]));
+  }
+  PyObject *test_strings = PyTuple_New(result.test_strings.size());
+  for (unsigned int i = 0; test_strings && i < result.test_strings.size(); i++) {
+    PyTuple_SET_ITEM(test_strings, i, PyUnicode_FromString(result.test_strings[i].c_str()));
+  }
+
+  PyStructSequence_SET_ITEM(obj, 0, optional_str(!result.error.empty(), result.error));
+  PyStructSequence_SET_ITEM(obj, 1, alerts);
+  PyStructSequence_SET_ITEM(obj, 2, test_strings);
+  PyStructSequence_SET_ITEM(obj, 3, stats_to_python(result.stats));
+  PyStructSequence_SET_ITEM(obj, 4, PyBool_FromLong(result.truncated));
+
+  if (PyErr_Occurred()) {
+    Py_DECREF(obj);
+    return NULL;
+  }
+  return obj;
+}
+
+// copies a sequence of Python strings, returns false with an exception set on failure
+static bool
+get_strings(PyObject *obj, vector <string> &strings)
+{
+  PyObject *seq = PySequence_Fast(obj, "expected a sequence of strings");
+  if (seq == NULL)
+    return false;
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+  strings.reserve(count);
+  for (Py_ssize_t i = 0; i < count; i++) {
+    Py_ssize_t size;
+    const char *str = PyUnicode_AsUTF8AndSize(PySequence_Fast_GET_ITEM(seq, i), &size);
+    if (str == NULL) {
+      Py_DECREF(seq);
+      return false;
+    }
+    strings.push_back(string(str, size));
+  }
+  Py_DECREF(seq);
+  return true;
+}
+
+// runs func(i) for i in [0, count) on up to threads native threads
+template <class Func>
+static void
+parallel_for(Py_ssize_t count, int threads, Func func)
+{
+  if (threads > count) threads = count;
+  if (threads <= 1) {
+    for (Py_ssize_t i = 0; i < count; i++)
+      func(i);
+    return;
+  }
+
+  atomic <Py_ssize_t> next(0);
+  vector <thread> pool;
+  for (int t = 0; t < threads; t++) {
+    pool.push_back(thread([&]() {
+      Py_ssize_t i;
+      while ((i = next++) < count)
+        func(i);
+    }));
+  }
+  for (unsigned int t = 0; t < pool.size(); t++)
+    pool[t].join();
+}
+
+static PyObject *
+egret_run(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "base_substring", "check_mode",
+    "web_mode", "debug_mode", "stat_mode", "time_limit", "max_strings", NULL};
   const char *regex;
   const char *base_substring;
   int check_mode;
   int web_mode;
   int debug_mode;
   int stat_mode;
+  double time_limit = 0;
+  int max_strings = 0;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "sspppp|di", (char **) kwlist,
+        &regex, &base_substring, &check_mode, &web_mode, &debug_mode, &stat_mode,
+        &time_limit, &max_strings))
+    return NULL;
+
+  // each run has its own engine context, so other threads may run Python
+  // code (or other analyses) while this one is in the engine
+  string regex_str(regex);
+  string base_str(base_substring);
+  vector <string> tests;
+  Py_BEGIN_ALLOW_THREADS
+  tests = run_engine(regex_str, base_str, check_mode, web_mode, debug_mode, stat_mode,
+                     Budget(time_limit, max_strings));
+  Py_END_ALLOW_THREADS
+
+  // the list steals each string, so no reference is left behind
+  PyObject *list = PyList_New(tests.size());
+  if (list == NULL)
+    return NULL;
+  for (unsigned int i = 0; i < tests.size(); i++) {
+    PyObject *str = PyUnicode_FromString(tests[i].c_str());
+    if (str == NULL) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    PyList_SET_ITEM(list, i, str);
+  }
+
+  return list;
+}
+
+// runs one regex of a batch, turning any C++ exception into an error result
+static EngineResult
+analyze_one(const string &regex, const string &base_substring, bool check_mode,
+            Budget budget)
+{
+  try {
+    return analyze_engine(regex, base_substring, check_mode, false, false, budget);
+  }
+  catch (std::exception const &e) {
+    EngineResult result;
+    result.error = string("ERROR (internal): ") + e.what();
+    return result;
+  }
+}
+
+static vector <string>
+run_one(const string &regex, const string &base_substring, bool check_mode, bool web_mode)
+{
+  try {
+    return run_engine(regex, base_substring, check_mode, web_mode, false, false);
+  }
+  catch (std::exception const &e) {
+    return vector <string>(1, string("ERROR (internal): ") + e.what());
+  }
+}
+
+static PyObject *
+egret_run_many(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regexes", "base_substring", "check_mode",
+    "web_mode", "threads", NULL};
+  PyObject *regex_seq;
+  const char *base_substring;
+  int check_mode = 0;
+  int web_mode = 0;
+  int threads = 1;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Os|ppi", (char **) kwlist,
+        &regex_seq, &base_substring, &check_mode, &web_mode, &threads))
+    return NULL;
+
+  // copy the regexes out of Python objects before releasing the GIL
+  vector <string> regexes;
+  if (!get_strings(regex_seq, regexes))
+    return NULL;
+  Py_ssize_t count = regexes.size();
+
+  // run the batch, spreading the regexes over the requested number of threads
+  string base_str(base_substring);
+  vector <vector <string> > results(count);
+  Py_BEGIN_ALLOW_THREADS
+  parallel_for(count, threads, [&](Py_ssize_t i) {
+    results[i] = run_one(regexes[i], base_str, check_mode, web_mode);
+  });
+  Py_END_ALLOW_THREADS
+
+  PyObject *list = PyList_New(count);
+  if (list == NULL)
+    return NULL;
+  for (Py_ssize_t i = 0; i < count; i++) {
+    PyObject *strings = PyList_New(results[i].size());
+    if (strings == NULL) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    for (unsigned int j = 0; j < results[i].size(); j++) {
+      PyObject *str = PyUnicode_FromString(results[i][j].c_str());
+      if (str == NULL) {
+        Py_DECREF(strings);
+        Py_DECREF(list);
+        return NULL;
+      }
+      PyList_SET_ITEM(strings, j, str);
+    }
+    PyList_SET_ITEM(list, i, strings);
+  }
+
+  return list;
+}
+
+static PyObject *
+egret_analyze(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "base_substring", "check_mode",
+    "debug_mode", "stat_mode", "time_limit", "max_strings", NULL};
+  const char *regex;
+  const char *base_substring = "evil";
+  int check_mode = 0;
+  int debug_mode = 0;
+  int stat_mode = 0;
+  double time_limit = 0;
+  int max_strings = 0;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|spppdi", (char **) kwlist,
+        &regex, &base_substring, &check_mode, &debug_mode, &stat_mode,
+        &time_limit, &max_strings))
+    return NULL;
+
+  string regex_str(regex);
+  string base_str(base_substring);
+  EngineResult result;
+  Py_BEGIN_ALLOW_THREADS
+  result = analyze_engine(regex_str, base_str, check_mode, debug_mode, stat_mode,
+                          Budget(time_limit, max_strings));
+  Py_END_ALLOW_THREADS
+
+  return result_to_python(result);
+}
 
-  if (!PyArg_ParseTuple(args, "sspppp", &regex, &base_substring,
-        &check_mode, &web_mode, &debug_mode, &stat_mode))
+static PyObject *
+egret_analyze_both(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "base_substring", "check_base_substring", NULL};
+  const char *regex;
+  const char *base_substring = "evil";
+  const char *check_base_substring = NULL;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sz", (char **) kwlist,
+        &regex, &base_substring, &check_base_substring))
     return NULL;
 
-  vector <string> tests =
-    run_engine(regex, base_substring, check_mode, web_mode, debug_mode, stat_mode);
+  string regex_str(regex);
+  string gen_base_str(base_substring);
+  string check_base_str(check_base_substring ? check_base_substring : base_substring);
+  pair <EngineResult, EngineResult> results;
+  Py_BEGIN_ALLOW_THREADS
+  results = analyze_both(regex_str, check_base_str, gen_base_str);
+  Py_END_ALLOW_THREADS
 
-  PyObject *list = PyList_New(0);
-  vector <string>::iterator it;
-  for (it = tests.begin(); it != tests.end(); it++) {
-    PyList_Append(list, PyUnicode_FromString((*it).c_str()));
+  PyObject *check_result = result_to_python(results.first);
+  if (check_result == NULL)
+    return NULL;
+  PyObject *gen_result = result_to_python(results.second);
+  if (gen_result == NULL) {
+    Py_DECREF(check_result);
+    return NULL;
+  }
+  return Py_BuildValue("(NN)", check_result, gen_result);
+}
+
+static PyObject *
+egret_analyze_many(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regexes", "base_substring", "check_mode",
+    "threads", "time_limit", "max_strings", NULL};
+  PyObject *regex_seq;
+  const char *base_substring = "evil";
+  int check_mode = 0;
+  int threads = 1;
+  double time_limit = 0;
+  int max_strings = 0;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|spidi", (char **) kwlist,
+        &regex_seq, &base_substring, &check_mode, &threads, &time_limit, &max_strings))
+    return NULL;
+
+  vector <string> regexes;
+  if (!get_strings(regex_seq, regexes))
+    return NULL;
+  Py_ssize_t count = regexes.size();
+
+  string base_str(base_substring);
+  vector <EngineResult> results(count);
+  Py_BEGIN_ALLOW_THREADS
+  parallel_for(count, threads, [&](Py_ssize_t i) {
+    results[i] = analyze_one(regexes[i], base_str, check_mode, Budget(time_limit, max_strings));
+  });
+  Py_END_ALLOW_THREADS
+
+  PyObject *list = PyList_New(count);
+  if (list == NULL)
+    return NULL;
+  for (Py_ssize_t i = 0; i < count; i++) {
+    PyObject *obj = result_to_python(results[i]);
+    if (obj == NULL) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    PyList_SET_ITEM(list, i, obj);
   }
 
   return list;
 }
 
+// egret_ext.StringIterator: test strings of a regex, generated on demand
+
+typedef struct {
+  PyObject_HEAD
+  EngineRun *run;               // engine run (NULL once exhausted)
+  Py_ssize_t remaining;         // strings left to return, -1 if unlimited
+  bool running;                 // set while a thread is generating strings
+} StringIterator;
+
+static PyTypeObject StringIteratorType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  "egret_ext.StringIterator"
+};
+
+static void
+string_iter_dealloc(StringIterator *self)
+{
+  delete self->run;
+  Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+static PyObject *
+string_iter_next(StringIterator *self)
+{
+  if (self->run == NULL || self->remaining == 0)
+    return NULL;
+  if (self->running) {
+    PyErr_SetString(PyExc_ValueError, "iterator already executing");
+    return NULL;
+  }
+
+  string s;
+  bool found;
+  self->running = true;
+  Py_BEGIN_ALLOW_THREADS
+  found = self->run->next_string(s);
+  Py_END_ALLOW_THREADS
+  self->running = false;
+
+  // release the engine state as soon as all strings are generated
+  if (!found) {
+    string error = self->run->get_error();
+    delete self->run;
+    self->run = NULL;
+    if (!error.empty())
+      PyErr_SetString(EgretExtError, error.c_str());
+    return NULL;
+  }
+
+  if (self->remaining > 0)
+    self->remaining--;
+  return PyUnicode_FromString(s.c_str());
+}
+
+static PyObject *
+egret_iter_strings(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "base_substring", "max_count", NULL};
+  const char *regex;
+  const char *base_substring = "evil";
+  PyObject *max_count = Py_None;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|sO", (char **) kwlist,
+        &regex, &base_substring, &max_count))
+    return NULL;
+
+  Py_ssize_t remaining = -1;
+  if (max_count != Py_None) {
+    remaining = PyLong_AsSsize_t(max_count);
+    if (remaining == -1 && PyErr_Occurred())
+      return NULL;
+    if (remaining < 0) {
+      PyErr_SetString(PyExc_ValueError, "max_count must be None or at least 0");
+      return NULL;
+    }
+  }
+
+  // scan, parse and build the NFA up front so that errors are raised here
+  string regex_str(regex);
+  string base_str(base_substring);
+  EngineRun *run;
+  Py_BEGIN_ALLOW_THREADS
+  run = new EngineRun(regex_str, base_str);
+  Py_END_ALLOW_THREADS
+  if (!run->get_error().empty()) {
+    PyErr_SetString(EgretExtError, run->get_error().c_str());
+    delete run;
+    return NULL;
+  }
+
+  StringIterator *iter = PyObject_New(StringIterator, &StringIteratorType);
+  if (iter == NULL) {
+    delete run;
+    return NULL;
+  }
+  iter->run = run;
+  iter->remaining = remaining;
+  iter->running = false;
+  return (PyObject *) iter;
+}
+
+static PyObject *
+egret_canonicalize(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", NULL};
+  const char *regex;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s", (char **) kwlist, &regex))
+    return NULL;
+
+  string regex_str(regex);
+  string form;
+  bool parsed;
+  Py_BEGIN_ALLOW_THREADS
+  parsed = canonical_form(regex_str, form);
+  Py_END_ALLOW_THREADS
+
+  return optional_str(parsed, form);
+}
+
+static PyObject *
+egret_classify(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "strings", "fullmatch", NULL};
+  const char *regex;
+  PyObject *string_seq;
+  int full_match = 0;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "sO|p", (char **) kwlist,
+        &regex, &string_seq, &full_match))
+    return NULL;
+
+  vector <string> strings;
+  if (!get_strings(string_seq, strings))
+    return NULL;
+
+  string regex_str(regex);
+  vector <int> matched;
+  bool modeled;
+  Py_BEGIN_ALLOW_THREADS
+  modeled = classify_strings(regex_str, strings, full_match, matched);
+  Py_END_ALLOW_THREADS
+  if (!modeled)
+    Py_RETURN_NONE;
+
+  PyObject *tuple = PyTuple_New(matched.size());
+  if (tuple == NULL)
+    return NULL;
+  for (unsigned int i = 0; i < matched.size(); i++) {
+    PyObject *obj;
+    if (matched[i] < 0) {
+      Py_INCREF(Py_None);
+      obj = Py_None;
+    }
+    else {
+      obj = PyBool_FromLong(matched[i]);
+    }
+    PyTuple_SET_ITEM(tuple, i, obj);
+  }
+  return tuple;
+}
+
+static PyObject *
+egret_pumps(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  static const char *kwlist[] = {"regex", "base_substring", NULL};
+  const char *regex;
+  const char *base_substring = "evil";
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|s", (char **) kwlist,
+        &regex, &base_substring))
+    return NULL;
+
+  string regex_str(regex);
+  string base_substring_str(base_substring);
+  vector <Pump> pumps;
+  bool analyzed;
+  Py_BEGIN_ALLOW_THREADS
+  analyzed = find_pumps(regex_str, base_substring_str, pumps);
+  Py_END_ALLOW_THREADS
+  if (!analyzed)
+    Py_RETURN_NONE;
+
+  PyObject *tuple = PyTuple_New(pumps.size());
+  if (tuple == NULL)
+    return NULL;
+  for (unsigned int i = 0; i < pumps.size(); i++) {
+    PyObject *obj = Py_BuildValue("(sss)", pumps[i].prefix.c_str(), pumps[i].pump.c_str(),
+                                  pumps[i].suffix.c_str());
+    if (obj == NULL) {
+      Py_DECREF(tuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(tuple, i, obj);
+  }
+  return tuple;
+}
+
 static PyMethodDef EgretExtMethods[] = {
-  {"run", egret_run, METH_VARARGS, "Run EGRET."},
+  {"run", (PyCFunction) egret_run, METH_VARARGS | METH_KEYWORDS,
+   "run(regex, base_substring, check_mode, web_mode, debug_mode, stat_mode,\n"
+   "    time_limit=0, max_strings=0)\n"
+   "Run EGRET.  A run stops early once it has taken time_limit seconds or\n"
+   "generated max_strings strings (0 for no limit), its output then starts\n"
+   "with a 'WARNING (truncated)' line."},
+  {"run_many", (PyCFunction) egret_run_many, METH_VARARGS | METH_KEYWORDS,
+   "run_many(regexes, base_substring, check_mode=False, web_mode=False, threads=1)\n"
+   "Run EGRET on each regex, returning one result list per regex."},
+  {"analyze", (PyCFunction) egret_analyze, METH_VARARGS | METH_KEYWORDS,
+   "analyze(regex, base_substring='evil', check_mode=False, debug_mode=False, stat_mode=False,\n"
+   "        time_limit=0, max_strings=0)\n"
+   "Run EGRET, returning a Result with the alerts and test strings.  The budgets\n"
+   "are those of run, Result.truncated tells if one ran out."},
+  {"analyze_many", (PyCFunction) egret_analyze_many, METH_VARARGS | METH_KEYWORDS,
+   "analyze_many(regexes, base_substring='evil', check_mode=False, threads=1,\n"
+   "             time_limit=0, max_strings=0)\n"
+   "Run EGRET on each regex, returning one Result per regex (the budgets apply\n"
+   "to each regex)."},
+  {"analyze_both", (PyCFunction) egret_analyze_both, METH_VARARGS | METH_KEYWORDS,
+   "analyze_both(regex, base_substring='evil', check_base_substring=None)\n"
+   "Run EGRET in check mode and test generation mode with one pass over the\n"
+   "regex, returning the (check mode, test generation) Results.  The check mode\n"
+   "run uses check_base_substring if given, otherwise base_substring."},
+  {"iter_strings", (PyCFunction) egret_iter_strings, METH_VARARGS | METH_KEYWORDS,
+   "iter_strings(regex, base_substring='evil', max_count=None)\n"
+   "Iterate over the test strings of regex as they are generated (in generation\n"
+   "order, the reverse of the order used by run and analyze), stopping after\n"
+   "max_count strings.  Raises egret_ext.error if the regex cannot be analyzed."},
+  {"canonicalize", (PyCFunction) egret_canonicalize, METH_VARARGS | METH_KEYWORDS,
+   "canonicalize(regex)\n"
+   "Return the canonical form of regex, or None if it cannot be parsed.  Regexes\n"
+   "that differ only in redundant escapes, the spelling of their character sets\n"
+   "(e.g. [0-9] and \\d) or the order of set items share a canonical form."},
+  {"classify", (PyCFunction) egret_classify, METH_VARARGS | METH_KEYWORDS,
+   "classify(regex, strings, fullmatch=False)\n"
+   "Tell for each string whether regex matches it, anywhere in the string like\n"
+   "re.search or all of it like re.fullmatch, in time linear in its length.\n"
+   "Returns a tuple of True, False or None (a string that is not ASCII), or\n"
+   "None if regex cannot be parsed or uses a construct the matcher does not\n"
+   "model exactly (backreferences, lookarounds, \\b, flags, named characters\n"
+   "\\N{...}, non-ASCII characters or too many states once repeats are unrolled)."},
+  {"pumps", (PyCFunction) egret_pumps, METH_VARARGS | METH_KEYWORDS,
+   "pumps(regex, base_substring='evil')\n"
+   "Return a (prefix, pump, suffix) tuple for each unbounded loop or repeated\n"
+   "character set of regex: prefix + pump * n + suffix is a test string that\n"
+   "takes the loop n times.  Returns None if regex cannot be analyzed."},
   {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -81,6 +726,27 @@ extern "C" {
     EgretExtError = PyErr_NewException("egret_ext.error", NULL, NULL);
     Py_INCREF(EgretExtError);
     PyModule_AddObject(m, "error", EgretExtError);
+
+    if (PyStructSequence_InitType2(&AlertType, &alert_desc) < 0)
+      return NULL;
+    Py_INCREF(&AlertType);
+    PyModule_AddObject(m, "Alert", (PyObject *) &AlertType);
+
+    if (PyStructSequence_InitType2(&ResultType, &result_desc) < 0)
+      return NULL;
+    Py_INCREF(&ResultType);
+    PyModule_AddObject(m, "Result", (PyObject *) &ResultType);
+
+    StringIteratorType.tp_basicsize = sizeof(StringIterator);
+    StringIteratorType.tp_dealloc = (destructor) string_iter_dealloc;
+    StringIteratorType.tp_flags = Py_TPFLAGS_DEFAULT;
+    StringIteratorType.tp_doc = "Test strings of a regex, generated on demand.";
+    StringIteratorType.tp_iter = PyObject_SelfIter;
+    StringIteratorType.tp_iternext = (iternextfunc) string_iter_next;
+    if (PyType_Ready(&StringIteratorType) < 0)
+      return NULL;
+    Py_INCREF(&StringIteratorType);
+    PyModule_AddObject(m, "StringIterator", (PyObject *) &StringIteratorType);
     return m;
   }
 }